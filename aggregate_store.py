@@ -0,0 +1,82 @@
+# aggregate_store.py
+# Persisted month x hour aggregates, one file per site: for every year the count, mean and M2 of
+# each (month, hour) cell (the MonthHourAccumulator state; sum and sum of squares follow from it)
+# and the signature of the ERA5 file the year was read from. Any range of years is answered by
+# merging its yearly states, O(years) without opening a NetCDF, and a new year is appended by
+# reading that year's file only. A year whose source file changed is read again.
+
+import os
+import json
+import uuid
+import numpy as np
+
+from month_hour_stats import MonthHourAccumulator
+
+
+AGGREGATE_DIR = os.path.join("./output", "cache", "aggregates")
+STORE_VERSION = 1  # bump when the stored statistics change meaning; older stores are refilled
+
+
+def aggregate_path(product, lat, lon, regional=False, aggregate_dir=None):
+    aggregate_dir = aggregate_dir or AGGREGATE_DIR
+    site = f"{float(lat):.6f}_{float(lon):.6f}".replace('-', 'm').replace('.', 'p')
+    return os.path.join(aggregate_dir, f"{product}{'_regional' if regional else ''}_{site}.npz")
+
+
+class AggregateStore:
+    # Yearly states of one site: {year: {"source", "dtype", "count", "mean", "m2"}}.
+    # A missing, unreadable or older-version file starts empty and is filled again
+    def __init__(self, path):
+        self.path = path
+        self.years = {}
+        self.changed = False
+        try:
+            with np.load(path) as f:
+                meta = json.loads(str(f["meta"]))
+                if meta.get("version") == STORE_VERSION:
+                    for i, year in enumerate(meta["years"]):
+                        self.years[year] = {"source": meta["sources"][i], "dtype": meta["dtypes"][i],
+                                            "count": f["count"][i], "mean": f["mean"][i], "m2": f["m2"][i]}
+        except FileNotFoundError:
+            pass
+        except Exception:
+            self.years = {}
+
+    def get(self, year, source):
+        # Accumulator of a stored year, or None when it is missing or was read from another file
+        entry = self.years.get(int(year))
+        if entry is None or entry["source"] != source:
+            return None
+        return MonthHourAccumulator.from_arrays(entry["count"], entry["mean"], entry["m2"], entry["dtype"])
+
+    def put(self, year, source, acc):
+        self.years[int(year)] = dict(acc.to_arrays(), source=source,
+                                     dtype=None if acc.dtype is None else acc.dtype.str)
+        self.changed = True
+
+    def accumulator(self, years=None):
+        # Stored years (all, or those in `years`) merged in year order
+        acc = MonthHourAccumulator()
+        wanted = None if years is None else {int(y) for y in years}
+        for year in sorted(self.years):
+            if wanted is None or year in wanted:
+                entry = self.years[year]
+                acc.merge(MonthHourAccumulator.from_arrays(entry["count"], entry["mean"], entry["m2"],
+                                                           entry["dtype"]))
+        return acc
+
+    def save(self):
+        # Written to a temporary name and renamed, so a reader never sees a half-written store
+        if not self.changed:
+            return
+        years = sorted(self.years)
+        meta = {"version": STORE_VERSION, "years": years,
+                "sources": [self.years[y]["source"] for y in years],
+                "dtypes": [self.years[y]["dtype"] for y in years]}
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = f"{self.path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, meta=np.array(json.dumps(meta)),
+                     **{key: np.stack([self.years[y][key] for y in years]) for key in ("count", "mean", "m2")})
+        os.replace(tmp, self.path)
+        self.changed = False
@@ -0,0 +1,158 @@
+# batch_analysis.py
+# Multi-site runner: the shapefile, masked rasters and capacity-factor raster
+# are loaded once and shared by every site in the input file.
+
+import os
+import numpy as np
+import pandas as pd
+
+from common import MONTH_NAMES, site_output_dir
+from solar_analysis import load_monthly_rasters, extract_values_by_coordinates, calculate_monthly_hourly_profiles
+from wind_analysis import read_capacity_factors, download_wind, compute_wind_statistics, wind_statistics_from_store
+from era5_store import ensure_regional_store, open_store
+from era5_download import YEARS, NETCDF_LOCK
+from aggregate_store import AggregateStore, aggregate_path
+from rendering import save_table
+
+
+LAT_COLUMNS = ["lat", "latitude", "y"]
+LON_COLUMNS = ["lon", "lng", "longitude", "x"]
+ID_COLUMNS = ["site_id", "id", "name"]
+
+
+def load_sites(sites_path):
+    # Accepts a CSV with lat/lon columns or any vector file readable by geopandas (GeoJSON, ...)
+    if sites_path.lower().endswith(".csv"):
+        df = pd.read_csv(sites_path)
+        columns = {c.lower(): c for c in df.columns}
+        lat_col = next((columns[c] for c in LAT_COLUMNS if c in columns), None)
+        lon_col = next((columns[c] for c in LON_COLUMNS if c in columns), None)
+        if lat_col is None or lon_col is None:
+            raise ValueError(f"{sites_path}: expected latitude/longitude columns, found {list(df.columns)}")
+        sites = pd.DataFrame({"lat": pd.to_numeric(df[lat_col], errors="coerce"),
+                              "lon": pd.to_numeric(df[lon_col], errors="coerce")}, dtype=float)
+    else:
+        import geopandas as gpd
+        df = gpd.read_file(sites_path)
+        df = df.set_crs("EPSG:4326") if df.crs is None else df.to_crs("EPSG:4326")
+        points = df.geometry.representative_point()
+        sites = pd.DataFrame({"lat": points.y.values, "lon": points.x.values})
+        columns = {c.lower(): c for c in df.columns}
+
+    id_col = next((columns[c] for c in ID_COLUMNS if c in columns), None)
+    sites.insert(0, "site_id", df[id_col].astype(str).values if id_col else np.arange(len(sites)).astype(str))
+
+    # Missing or non-numeric coordinates (and empty geometries) are reported and left out of the run
+    bad = ~(np.isfinite(sites["lat"]) & np.isfinite(sites["lon"]))
+    if bad.any():
+        ids = sites.loc[bad, "site_id"].tolist()
+        print(f"Warning: skipping {len(ids)} site(s) without valid coordinates: "
+              f"{', '.join(ids[:10])}{', ...' if len(ids) > 10 else ''}")
+        sites = sites[~bad].reset_index(drop=True)
+    if sites.empty:
+        raise ValueError(f"{sites_path}: no site with valid latitude/longitude")
+    sites["lat"] = sites["lat"].round(6)
+    sites["lon"] = sites["lon"].round(6)
+    return sites
+
+
+def stack_site_tables(tables, sites):
+    # (site, month) x hour long table, one block of 12 rows per site
+    frames = []
+    for (_, site), table in zip(sites.iterrows(), tables):
+        frame = table.copy()
+        frame.insert(0, "month", frame.index)
+        frame.insert(0, "lon", site["lon"])
+        frame.insert(0, "lat", site["lat"])
+        frame.insert(0, "site_id", site["site_id"])
+        frames.append(frame.reset_index(drop=True))
+    return pd.concat(frames, ignore_index=True)
+
+
+def profile_table(profiles, sites):
+    # (S, 12, 24) profiles -> same long layout as stack_site_tables, without per-site DataFrames
+    n_sites, n_months, n_hours = profiles.shape
+    table = pd.DataFrame(profiles.reshape(n_sites * n_months, n_hours).round(6),
+                         columns=[f"{h:02d}h" for h in range(n_hours)])
+    table.insert(0, "month", np.tile(MONTH_NAMES[:n_months], n_sites))
+    table.insert(0, "lon", np.repeat(sites["lon"].values, n_months))
+    table.insert(0, "lat", np.repeat(sites["lat"].values, n_months))
+    table.insert(0, "site_id", np.repeat(sites["site_id"].values, n_months))
+    return table
+
+
+def run_batch_solar(sites, monthly_rasters=None, sampling="nearest", source="densiPV"):
+    if monthly_rasters is None:
+        monthly_rasters = load_monthly_rasters(source=source)
+
+    values = extract_values_by_coordinates(sites["lat"].values, sites["lon"].values, monthly_rasters, sampling)
+    return calculate_monthly_hourly_profiles(sites["lat"].values, sites["lon"].values, values)
+
+
+def run_batch_wind(sites, API_KEY, regional=False, years=None, use_cache=True):
+    # Per-site yearly aggregates are kept in the aggregate store, so a new year or a new range only reads
+    # the years not yet aggregated; use_cache=False reads every year again and stores nothing
+    capacity_factors = read_capacity_factors(sites["lat"].values, sites["lon"].values)
+
+    stats = {}
+    if regional:
+        # One regional store, opened once, serves every site with a local chunk read
+        path = ensure_regional_store("wind", API_KEY)
+        if path is None:
+            print("No wind files found. Skipping.")
+            return stats, capacity_factors
+        store = open_store(path)
+        try:
+            for i, site in enumerate(sites.itertuples()):
+                path = aggregate_path("wind", site.lat, site.lon, regional=True)
+                aggregates = AggregateStore(path) if use_cache else None
+                stats[i] = wind_statistics_from_store(store, site.lat, site.lon, capacity_factors[i], years,
+                                                      aggregates)
+        finally:
+            with NETCDF_LOCK:
+                store.close()
+        return stats, capacity_factors
+
+    for i, site in enumerate(sites.itertuples()):
+        output_dir = site_output_dir(site.lat, site.lon)
+        os.makedirs(output_dir, exist_ok=True)
+
+        nc_files = download_wind(site.lat, site.lon, API_KEY, output_dir, years=years or YEARS)
+        if not any(os.path.exists(f) for f in nc_files):
+            print(f"No wind files found for site {site.site_id}. Skipping.")
+            continue
+        aggregates = AggregateStore(aggregate_path("wind", site.lat, site.lon)) if use_cache else None
+        stats[i] = compute_wind_statistics(nc_files, site.lat, site.lon, capacity_factors[i], aggregates)
+    return stats, capacity_factors
+
+
+def run_batch_analysis(sites_path, API_KEY, run_solar=True, run_wind=True, output_dir="./output/batch",
+                       sampling="nearest", regional=False, formats=("csv",), source="densiPV",
+                       years=None, use_cache=True):
+    # Data-only: tables are written as CSV and/or Parquet, no figures are rendered
+    sites = load_sites(sites_path)
+    os.makedirs(output_dir, exist_ok=True)
+
+    print(f"\n{'='*70}")
+    print(f"BATCH ANALYSIS → {len(sites)} sites from {sites_path}")
+    print(f"{'='*70}")
+
+    if run_solar:
+        print("\n→ Starting SOLAR batch...")
+        profiles = run_batch_solar(sites, sampling=sampling, source=source)
+        table = profile_table(profiles, sites)
+        save_table(table, os.path.join(output_dir, "solar_monthly_average_pv_density"), formats)
+
+    if run_wind:
+        print("\n→ Starting WIND batch...")
+        stats, capacity_factors = run_batch_wind(sites, API_KEY, regional, years, use_cache)
+        done = sites.iloc[sorted(stats)]
+        for key in ["mean", "std", "cv", "energy_density"] if stats else []:
+            table = stack_site_tables([stats[i][key] for i in sorted(stats)], done)
+            table.columns = table.columns.astype(str)  # Parquet needs string column names
+            save_table(table, os.path.join(output_dir, f"wind_{key}"), formats)
+        cf = sites.assign(capacity_factor=capacity_factors)
+        save_table(cf, os.path.join(output_dir, "wind_capacity_factor"), formats)
+
+    print(f"\nBATCH ANALYSIS COMPLETED!\nAll tables in: {output_dir}\n")
+    print(f"{'='*70}\n")
@@ -0,0 +1,203 @@
+# Benchmark harness: every stage is timed until TIME_BUDGET or MAX_RUNS and run once more under
+# tracemalloc (peak Python/NumPy heap); the peak is compared with baseline.json and the test fails
+# when a stage regresses past the tolerance. Times are always reported but only checked on request,
+# since a busy or shared machine is noisy well past the tolerance; they are compared relative to the
+# machine: a fixed calibration workload is timed once per session and the baseline times are scaled
+# by its ratio to the calibration stored with the baseline.
+#   python -m pytest benchmarks                       -> compare the peaks with the stored baseline
+#   python -m pytest benchmarks --check-times         -> compare the (calibrated) times too
+#   python -m pytest benchmarks --bench-sizes 1,100   -> skip the 10k-site runs
+#   python -m pytest benchmarks --update-baseline     -> record this machine's numbers (and calibration) as the baseline
+import json
+import os
+import time
+import tracemalloc
+
+import numpy as np
+import pytest
+
+import synthetic
+
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+DEFAULT_SIZES = "1,100,10000"
+TIME_BUDGET = 1.0  # seconds of timed runs per stage
+MAX_RUNS = 5
+TIME_TOLERANCE = 1.5  # fail above 1.5x the baseline time ...
+TIME_SLACK = 0.005  # ... plus 5 ms, so sub-millisecond stages do not fail on timer noise
+MEMORY_TOLERANCE = 1.25
+MEMORY_SLACK_MB = 1.0
+CALIBRATION_KEY = "calibration"
+CALIBRATION_RUNS = 5
+
+RESULTS = {}
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("benchmarks")
+    group.addoption("--bench-sizes", default=DEFAULT_SIZES,
+                    help=f"Comma-separated site counts for the per-site stages (default: {DEFAULT_SIZES})")
+    group.addoption("--check-times", action="store_true",
+                    help="Also fail when a stage is slower than its baseline time, scaled by the calibration run")
+    group.addoption("--update-baseline", action="store_true",
+                    help="Write the measured times and peaks to benchmarks/baseline.json instead of comparing")
+
+
+def pytest_generate_tests(metafunc):
+    if "sites" in metafunc.fixturenames:
+        sizes = [int(n) for n in metafunc.config.getoption("--bench-sizes").split(",") if n.strip()]
+        metafunc.parametrize("sites", sizes, indirect=True, ids=[f"{n}_sites" for n in sizes])
+
+
+def load_baseline():
+    if not os.path.exists(BASELINE_PATH):
+        return {}
+    with open(BASELINE_PATH) as f:
+        return json.load(f)
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    function(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def calibration_workload():
+    # A fixed mix of NumPy and interpreter work, standing in for the speed of the machine
+    values = np.random.default_rng(0).random(1_000_000)
+    np.sort(values)
+    total = 0
+    for i in range(300_000):
+        total += i % 7
+    return total
+
+
+def calibrate():
+    return min(timed(calibration_workload) for _ in range(CALIBRATION_RUNS))
+
+
+def measure(function, *args, **kwargs):
+    # The traced run comes after the first timed run, so one-off imports and caches do not count
+    times = [timed(function, *args, **kwargs)]
+    tracemalloc.start()
+    try:
+        function(*args, **kwargs)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    while len(times) < MAX_RUNS and sum(times) < TIME_BUDGET:
+        times.append(timed(function, *args, **kwargs))
+    return {"seconds": min(times), "peak_mb": peak / 2**20, "runs": len(times)}
+
+
+def regressions(result, expected, speed=None):
+    # speed: this machine's calibration time over the baseline's (2.0 on a machine twice as slow);
+    # None leaves the time unchecked
+    problems = []
+    time_limit = None if speed is None else expected["seconds"] * speed * TIME_TOLERANCE + TIME_SLACK
+    if time_limit is not None and result["seconds"] > time_limit:
+        problems.append(f"time {result['seconds']:.4f} s > {time_limit:.4f} s "
+                        f"(baseline {expected['seconds']:.4f} s x {speed:.2f} machine speed)")
+    memory_limit = expected["peak_mb"] * MEMORY_TOLERANCE + MEMORY_SLACK_MB
+    if result["peak_mb"] > memory_limit:
+        problems.append(f"peak {result['peak_mb']:.1f} MB > {memory_limit:.1f} MB "
+                        f"(baseline {expected['peak_mb']:.1f} MB)")
+    return problems
+
+
+@pytest.fixture(scope="session")
+def calibration():
+    seconds = calibrate()
+    RESULTS[CALIBRATION_KEY] = {"seconds": seconds}
+    return seconds
+
+
+def machine_speed(baseline, seconds):
+    expected = baseline.get(CALIBRATION_KEY, {}).get("seconds")
+    return seconds / expected if expected else 1.0
+
+
+@pytest.fixture
+def bench(request, calibration):
+    # bench(stage, size, function, *args, **kwargs) -> measured result; fails on a regression
+    update = request.config.getoption("--update-baseline")
+    baseline = load_baseline()
+    speed = machine_speed(baseline, calibration) if request.config.getoption("--check-times") else None
+
+    def run(stage, size, function, *args, **kwargs):
+        key = f"{stage}[{size}]"
+        result = measure(function, *args, **kwargs)
+        RESULTS[key] = result
+        if not update and key in baseline:
+            problems = regressions(result, baseline[key], speed)
+            if problems:
+                pytest.fail(f"{key} regressed: " + "; ".join(problems))
+        return result
+    return run
+
+
+def pytest_sessionfinish(session):
+    if RESULTS and session.config.getoption("--update-baseline"):
+        baseline = load_baseline()
+        for key, r in RESULTS.items():
+            baseline[key] = {"seconds": round(r["seconds"], 6)}
+            if "peak_mb" in r:
+                baseline[key]["peak_mb"] = round(r["peak_mb"], 3)
+        with open(BASELINE_PATH, "w") as f:
+            json.dump(dict(sorted(baseline.items())), f, indent=2)
+            f.write("\n")
+
+
+def pytest_terminal_summary(terminalreporter):
+    if not RESULTS:
+        return
+    baseline = load_baseline()
+    terminalreporter.section("benchmarks")
+    if CALIBRATION_KEY in RESULTS:
+        speed = machine_speed(baseline, RESULTS[CALIBRATION_KEY]["seconds"])
+        terminalreporter.write_line(f"calibration {RESULTS[CALIBRATION_KEY]['seconds']:.4f} s: "
+                                    f"baseline times scaled by {speed:.2f}")
+    terminalreporter.write_line(f"{'stage':<48}{'best s':>10}{'peak MB':>10}{'runs':>6}{'vs baseline':>13}")
+    for key, r in RESULTS.items():
+        if key == CALIBRATION_KEY:
+            continue
+        ratio = f"{r['seconds'] / baseline[key]['seconds']:.2f}x" if baseline.get(key, {}).get("seconds") else "-"
+        terminalreporter.write_line(f"{key:<48}{r['seconds']:>10.4f}{r['peak_mb']:>10.1f}{r['runs']:>6}{ratio:>13}")
+
+
+# =========================== SYNTHETIC INPUTS ===========================
+@pytest.fixture(scope="session")
+def pv_inputs(tmp_path_factory):
+    return synthetic.write_pv_inputs(str(tmp_path_factory.mktemp("pv")))
+
+
+@pytest.fixture(scope="session")
+def monthly_rasters(pv_inputs):
+    from solar_analysis import load_monthly_rasters
+    return load_monthly_rasters(pv_inputs, use_cache=False)
+
+
+@pytest.fixture(scope="session")
+def capacity_factor_raster(tmp_path_factory):
+    import rasterio
+
+    path = synthetic.write_capacity_factor(str(tmp_path_factory.mktemp("cf") / "cf.tif"))
+    with rasterio.open(path) as src:
+        yield src
+
+
+@pytest.fixture(scope="session")
+def era5_wind(tmp_path_factory):
+    # Yearly files loaded into memory, so the wind stage times the statistics and not the disk
+    import xarray as xr
+
+    datasets = []
+    for path in synthetic.write_era5_wind(str(tmp_path_factory.mktemp("era5"))):
+        with xr.open_dataset(path) as ds:
+            datasets.append(ds.load())
+    return datasets
+
+
+@pytest.fixture
+def sites(request):
+    return synthetic.site_coordinates(request.param)
@@ -0,0 +1,104 @@
+# Deterministic, offline stand-ins for the real inputs, shaped like them: 12 monthly PV GeoTIFFs
+# (560 x 463, 1 km pixels in EPSG:31984, nodata -9999) with an elliptical state outline, a
+# capacity-factor GeoTIFF in EPSG:4326 and yearly ERA5-like hourly u100/v100 NetCDF files.
+import os
+
+import numpy as np
+
+import era5_download
+
+
+HEIGHT, WIDTH = 560, 463
+PIXEL = 1000.0
+ORIGIN = (230705.51, 9692140.42)  # top-left corner of the real ceara_densiPV rasters
+CRS = "EPSG:31984"
+ERA5_AREA = [-2.5, -41.5, -8.0, -37.0]  # north, west, south, east; the ERA5 bounding box of Ceará
+WIND = ["100m_u_component_of_wind", "100m_v_component_of_wind"]
+
+
+def outline(points=64):
+    # Ellipse inscribed in the raster, in the raster CRS
+    x0, y0 = ORIGIN
+    cx, cy = x0 + WIDTH * PIXEL / 2, y0 - HEIGHT * PIXEL / 2
+    angle = np.linspace(0, 2 * np.pi, points, endpoint=False)
+    return np.c_[cx + 0.45 * WIDTH * PIXEL * np.cos(angle), cy + 0.45 * HEIGHT * PIXEL * np.sin(angle)]
+
+
+def write_geotiff(path, data, transform, crs, nodata=None):
+    import rasterio
+
+    with rasterio.open(path, "w", driver="GTiff", height=data.shape[0], width=data.shape[1], count=1,
+                       dtype=data.dtype, crs=crs, transform=transform, nodata=nodata) as dst:
+        dst.write(data, 1)
+
+
+def write_pv_inputs(folder, seed=0):
+    # ceara_densiPV_XX.tif monthly totals (kWh/m²) plus ceara_onshore.shp; outside the outline is nodata
+    import geopandas as gpd
+    from rasterio.features import geometry_mask
+    from rasterio.transform import from_origin
+    from shapely.geometry import Polygon
+
+    transform = from_origin(*ORIGIN, PIXEL, PIXEL)
+    shape = gpd.GeoDataFrame(geometry=[Polygon(outline())], crs=CRS)
+    outside = geometry_mask(shape.geometry, (HEIGHT, WIDTH), transform)
+
+    rng = np.random.default_rng(seed)
+    field = rng.normal(0.0, 0.05, (HEIGHT, WIDTH))
+    for month in range(1, 13):
+        daily = 5.0 + 0.8 * np.cos(2 * np.pi * (month - 10) / 12)
+        data = (daily * 30 * (1 + field)).astype(np.float32)
+        data[outside] = -9999.0
+        write_geotiff(os.path.join(folder, f"ceara_densiPV_{month:02d}.tif"), data, transform, CRS, -9999.0)
+    shape.to_crs("EPSG:4326").to_file(os.path.join(folder, "ceara_onshore.shp"))
+    return folder
+
+
+def site_coordinates(n, seed=0):
+    # n (lat, lon) points spread inside the outline
+    from pyproj import Transformer
+
+    rng = np.random.default_rng(seed)
+    radius = 0.9 * np.sqrt(rng.uniform(0, 1, n))
+    angle = rng.uniform(0, 2 * np.pi, n)
+    x0, y0 = ORIGIN
+    x = x0 + WIDTH * PIXEL / 2 + 0.45 * WIDTH * PIXEL * radius * np.cos(angle)
+    y = y0 - HEIGHT * PIXEL / 2 + 0.45 * HEIGHT * PIXEL * radius * np.sin(angle)
+    lons, lats = Transformer.from_crs(CRS, "EPSG:4326", always_xy=True).transform(x, y)
+    return np.asarray(lats), np.asarray(lons)
+
+
+def write_capacity_factor(path, seed=0):
+    # 0.0025° capacity-factor grid over the ERA5 box, like the Global Wind Atlas export
+    from rasterio.transform import from_origin
+
+    north, west, south, east = ERA5_AREA
+    res = 0.0025
+    height, width = int(round((north - south) / res)), int(round((east - west) / res))
+    rng = np.random.default_rng(seed)
+    data = rng.uniform(0.2, 0.6, (height, width)).astype(np.float32)
+    write_geotiff(path, data, from_origin(west, north, res, res), "EPSG:4326")
+    return path
+
+
+def write_era5_wind(folder, years=("2017", "2018"), area=ERA5_AREA, seed=0):
+    # One file per year with the layout of a CDS download (valid_time, latitude, longitude)
+    import xarray as xr
+
+    paths = []
+    for year in years:
+        request = era5_download.era5_request(WIND, year, area)
+        times = era5_download.expected_times(request)
+        north, west, south, east = area
+        lats = np.arange(north, south - 1e-9, -0.25)
+        lons = np.arange(west, east + 1e-9, 0.25)
+        rng = np.random.default_rng(seed + int(year))
+        shape = (len(times), lats.size, lons.size)
+        ds = xr.Dataset({name: (("valid_time", "latitude", "longitude"), rng.normal(4.0, 2.0, shape).astype("float32"))
+                         for name in ("u100", "v100")},
+                        coords={"valid_time": times, "latitude": lats, "longitude": lons})
+        path = os.path.join(folder, f"wind100m_{year}.nc")
+        with era5_download.NETCDF_LOCK:
+            ds.to_netcdf(path)
+        paths.append(path)
+    return paths
@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+
+from month_hour_stats import MonthHourAccumulator
+from rendering import (render_heatmap, render_solar_surface, render_solar_html, render_wind_surface,
+                       render_wind_html)
+from solar_analysis import (load_ceara_shape, process_monthly_tifs, extract_values_by_coordinates,
+                            calculate_monthly_hourly_profiles, profile_dataframe)
+from wind_analysis import sample_raster_points, update_wind_accumulator, wind_statistics_from_accumulator
+
+
+def wind_statistics(datasets, lats, lons, capacity_factor=0.45):
+    # The per-site block of compute_wind_statistics, on series already in memory
+    for lat, lon in zip(lats, lons):
+        acc = MonthHourAccumulator()
+        for ds in datasets:
+            update_wind_accumulator(acc, ds.sel(latitude=lat, longitude=lon, method='nearest'))
+        wind_statistics_from_accumulator(acc, capacity_factor)
+
+
+# =========================== PER-SITE STAGES ===========================
+def test_process_monthly_tifs(bench, pv_inputs):
+    gdf = load_ceara_shape(pv_inputs)
+    assert bench("process_monthly_tifs", "month", process_monthly_tifs, 1, gdf, pv_inputs)["seconds"] > 0
+
+
+def test_extract_values_by_coordinates(bench, monthly_rasters, sites):
+    lats, lons = sites
+    assert not np.isnan(extract_values_by_coordinates(lats, lons, monthly_rasters)).any()
+    bench("extract_values_by_coordinates", lats.size, extract_values_by_coordinates, lats, lons, monthly_rasters)
+
+
+def test_calculate_monthly_hourly_profiles(bench, monthly_rasters, sites):
+    lats, lons = sites
+    values = extract_values_by_coordinates(lats, lons, monthly_rasters)
+    bench("calculate_monthly_hourly_profiles", lats.size, calculate_monthly_hourly_profiles, lats, lons, values)
+
+
+def test_wind_statistics(bench, era5_wind, sites):
+    lats, lons = sites
+    bench("wind_statistics", lats.size, wind_statistics, era5_wind, lats, lons)
+
+
+def test_capacity_factor_sampling(bench, capacity_factor_raster, sites):
+    lats, lons = sites
+    assert not np.isnan(sample_raster_points(capacity_factor_raster, lats, lons)).any()
+    bench("sample_raster_points", lats.size, sample_raster_points, capacity_factor_raster, lats, lons)
+
+
+# =========================== FIGURE EXPORTS ===========================
+@pytest.fixture(scope="module")
+def tables(monthly_rasters, era5_wind, tmp_path_factory):
+    # Synthetic solar and wind tables; one throwaway render warms the plotting imports and font caches
+    lats, lons = np.array([-5.0]), np.array([-39.5])
+    values = extract_values_by_coordinates(lats, lons, monthly_rasters)
+    df_mean = profile_dataframe(calculate_monthly_hourly_profiles(lats, lons, values)[0])
+    acc = MonthHourAccumulator()
+    for ds in era5_wind:
+        update_wind_accumulator(acc, ds.sel(latitude=lats[0], longitude=lons[0], method='nearest'))
+    warm = str(tmp_path_factory.mktemp("warm") / "warm")
+    render_heatmap(df_mean, warm, "", ".3f", ["png"])
+    render_solar_surface(df_mean.values, warm, ["pdf"])
+    render_solar_html(df_mean.values, warm, ["html"])
+    return df_mean, wind_statistics_from_accumulator(acc, 0.45)
+
+
+FIGURES = [
+    ("render_heatmap", "pdf"),
+    ("render_heatmap", "png"),
+    ("render_solar_surface", "pdf"),
+    ("render_solar_html", "html"),
+    ("render_wind_surface", "pdf"),
+    ("render_wind_html", "html"),
+]
+
+
+@pytest.mark.parametrize("name, fmt", FIGURES, ids=[f"{n}-{f}" for n, f in FIGURES])
+def test_figure_export(bench, tables, tmp_path, name, fmt):
+    df_mean, wind = tables
+    path_base = str(tmp_path / name)
+    kwargs = {
+        "render_heatmap": dict(function=render_heatmap, data=df_mean, cbar_label="PV Production (kWh/m²)",
+                               fmt=".3f"),
+        "render_solar_surface": dict(function=render_solar_surface, z=df_mean.values),
+        "render_solar_html": dict(function=render_solar_html, z=df_mean.values),
+        "render_wind_surface": dict(function=render_wind_surface, z=wind["std"].values),
+        "render_wind_html": dict(function=render_wind_html, z=wind["std"].values),
+    }[name]
+    function = kwargs.pop("function")
+    bench(f"{name}.{fmt}", 1, function, path_base=path_base, formats=[fmt], **kwargs)
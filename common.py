@@ -0,0 +1,16 @@
+# common.py
+# Names shared by the solar and wind analyses, the batch runner, map modes and the server: month
+# labels, the solar input sources and the per-coordinate output folder. Standard library only, so
+# the launcher and the server can import it without pulling in the analysis dependencies.
+
+import os
+
+
+MONTH_NAMES = ["Jan","Feb","Mar","Apr","May","Jun","Jul","Aug","Sep","Oct","Nov","Dec"]
+SOLAR_SOURCES = ("densiPV", "daily", "h5")
+OUTPUT_DIR = "./output"
+
+
+def site_output_dir(lat, lon):
+    # -3.73, -38.52 -> ./output/m3p73_m38p52, where a site's downloads, tables and figures go
+    return os.path.join(OUTPUT_DIR, f"{lat:.2f}_{lon:.2f}".replace('-', 'm').replace('.', 'p'))
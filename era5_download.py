@@ -0,0 +1,329 @@
+# era5_download.py
+# Shared ERA5 download manager used by the solar and wind modules.
+# Requests run in a bounded thread pool with retries and exponential backoff for transient errors
+# (timeouts, resets, 5xx); permanent ones (unknown host, missing or rejected CDS key, HTTP 4xx) fail
+# at once and cancel the years still queued. Every file is written to a temporary name, validated
+# and only then renamed into place, and a manifest (checksum + request) lets interrupted runs
+# resume without trusting half-written files.
+# The CDS client is injectable: any object with retrieve(dataset, request, target) works,
+# so a local stub can stand in for the CDS API.
+
+import os
+import json
+import time
+import uuid
+import random
+import socket
+import hashlib
+import datetime
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+try:
+    import fcntl
+    msvcrt = None
+except ImportError:  # Windows: byte-range locks through msvcrt instead of flock
+    import msvcrt
+    fcntl = None
+
+import numpy as np
+import pandas as pd
+
+from profiling import stage
+
+
+CDS_URL = "https://cds.climate.copernicus.eu/api"
+DATASET = "reanalysis-era5-single-levels"
+YEARS = [str(y) for y in range(1999, 2019)]
+MANIFEST_NAME = "manifest.json"
+
+MAX_WORKERS = 4
+RETRIES = 4
+BACKOFF = 5.0  # seconds, doubled after every failed attempt
+# cdsapi retries 500 times by default (up to 120 s apart), which would hide a dead endpoint for hours.
+# Its own retries are kept to a minimum so that RETRIES/BACKOFF above decide when a file gives up
+CDS_RETRY_MAX = 1
+CDS_SLEEP_MAX = 5  # seconds
+
+# The HDF5 library behind NetCDF4 is not thread-safe: transfers run in parallel, file checks do not
+NETCDF_LOCK = threading.Lock()
+
+
+class DownloadError(Exception):
+    pass
+
+
+class PermanentDownloadError(DownloadError):
+    # Retrying cannot help: the host does not resolve, the CDS key is missing or rejected, the request is invalid
+    pass
+
+
+RETRY_STATUS = {408, 429}  # request timeout and rate limiting are worth retrying despite being 4xx
+
+
+def is_permanent(error):
+    # Looks down the exception chain (requests wraps urllib3, which wraps the socket error)
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if isinstance(error, socket.gaierror) and error.errno != getattr(socket, "EAI_AGAIN", None):
+            return True
+        status = getattr(getattr(error, "response", None), "status_code", None)
+        if isinstance(status, int) and 400 <= status < 500 and status not in RETRY_STATUS:
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+def era5_request(variable, year, area):
+    return {
+        "product_type": "reanalysis",
+        "variable": variable,
+        "year": year,
+        "month": [f"{m:02d}" for m in range(1,13)],
+        "day": [f"{d:02d}" for d in range(1,32)],
+        "time": [f"{h:02d}:00" for h in range(24)],
+        "area": area,
+        "format": "netcdf"
+    }
+
+
+def parse_years(text):
+    # "2005-2014" or "2010" -> ["2005", ..., "2014"], the form of YEARS
+    first, _, last = text.partition("-")
+    try:
+        first, last = int(first), int(last or first)
+    except ValueError:
+        raise ValueError(f"years must be a year or a first-last range such as 2005-2014, got {text!r}")
+    if not 1940 <= first <= last <= datetime.date.today().year:
+        raise ValueError(f"years {text!r}: ERA5 covers 1940 to the current year and the range must not be reversed")
+    return [str(year) for year in range(first, last + 1)]
+
+
+def file_year(path):
+    # wind100m_2003.nc -> 2003
+    return int(os.path.splitext(os.path.basename(path))[0].rsplit("_", 1)[-1])
+
+
+def cds_client_factory(API_KEY):
+    def factory():
+        import cdsapi
+        return cdsapi.Client(url=CDS_URL, key=API_KEY, retry_max=CDS_RETRY_MAX, sleep_max=CDS_SLEEP_MAX,
+                             quiet=True)
+    return factory
+
+
+# =========================== VALIDATION ===========================
+def file_sha256(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def expected_times(request):
+    # Valid timestamps covered by a request (invalid dates such as 31 Feb are skipped)
+    times = pd.date_range(f"{request['year']}-01-01", f"{int(request['year']) + 1}-01-01",
+                          freq="h", inclusive="left")
+    months = {int(m) for m in request["month"]}
+    days = {int(d) for d in request["day"]}
+    hours = {int(t[:2]) for t in request["time"]}
+    keep = times.month.isin(months) & times.day.isin(days) & times.hour.isin(hours)
+    return times[keep]
+
+
+def validate_netcdf(path, variables, request=None):
+    # Raises DownloadError unless the file opens and holds every variable over the full period
+    import xarray as xr
+
+    with NETCDF_LOCK:
+        try:
+            ds = xr.open_dataset(path, cache=False)
+        except Exception as e:
+            raise DownloadError(f"{os.path.basename(path)}: unreadable NetCDF ({e})")
+        with ds:
+            check_dataset(ds, path, variables, request)
+
+
+def check_dataset(ds, path, variables, request):
+    missing = [v for v in variables if v not in ds.data_vars]
+    if missing:
+        raise DownloadError(f"{os.path.basename(path)}: missing variables {missing}")
+
+    time_name = "valid_time" if "valid_time" in ds.coords else "time"
+    if time_name not in ds.coords:
+        raise DownloadError(f"{os.path.basename(path)}: no time coordinate")
+    if request is not None:
+        found = pd.DatetimeIndex(np.unique(ds[time_name].values))
+        expected = expected_times(request)
+        if not expected.isin(found).all():
+            raise DownloadError(f"{os.path.basename(path)}: {(~expected.isin(found)).sum()} "
+                                f"of {len(expected)} time steps missing")
+
+
+# =========================== MANIFEST ===========================
+@contextmanager
+def file_lock(path):
+    # Exclusive lock on a sidecar file, shared by every process that writes next to it
+    with open(path, "a+") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)  # released when the file is closed
+            yield
+            return
+        f.seek(0)
+        while True:
+            try:
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                break
+            except OSError:  # LK_LOCK gives up after 10 s; keep waiting like flock does
+                pass
+        try:
+            yield
+        finally:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def manifest_signature(files):
+    # [filename, sha256] of each file as recorded by the manifest next to it
+    manifests = {}
+    signature = []
+    for path in sorted(files):
+        folder = os.path.dirname(path)
+        if folder not in manifests:
+            try:
+                with open(os.path.join(folder, MANIFEST_NAME)) as f:
+                    manifests[folder] = json.load(f)
+            except (OSError, ValueError):
+                manifests[folder] = {}
+        signature.append([os.path.basename(path), manifests[folder].get(os.path.basename(path), {}).get("sha256")])
+    return signature
+
+
+class DownloadManifest:
+    # JSON record of accepted files: {filename: {sha256, size, mtime_ns, request}}
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        try:
+            with open(path) as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def is_complete(self, target, request):
+        entry = self.entries.get(os.path.basename(target))
+        if entry is None or entry.get("request") != request or not os.path.exists(target):
+            return False
+        st = os.stat(target)
+        if st.st_size != entry["size"]:
+            return False
+        if st.st_mtime_ns == entry["mtime_ns"]:
+            return True
+        # File touched since it was accepted: only the checksum can tell whether it changed
+        return file_sha256(target) == entry["sha256"]
+
+    def record(self, target, request, sha256):
+        # Other processes (solar and wind analyses, server threads) share this file: it is re-read
+        # under a lock file before each write, so nobody overwrites what the others recorded
+        st = os.stat(target)
+        with self.lock, file_lock(f"{self.path}.lock"):
+            try:
+                with open(self.path) as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError):
+                pass
+            self.entries[os.path.basename(target)] = {
+                "sha256": sha256, "size": st.st_size, "mtime_ns": st.st_mtime_ns, "request": request,
+            }
+            tmp = f"{self.path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(self.entries, f, indent=1)
+            os.replace(tmp, self.path)
+
+
+# =========================== DOWNLOAD ===========================
+def fetch_file(client, target, request, variables, dataset=DATASET, retries=RETRIES, backoff=BACKOFF):
+    # One request with retry/backoff on transient errors; the file only appears under its final name once validated
+    for attempt in range(retries + 1):
+        tmp = f"{target}.{uuid.uuid4().hex}.part"
+        try:
+            with stage("ERA5 request", file=os.path.basename(target), attempt=attempt + 1):
+                client.retrieve(dataset, request, tmp)
+            validate_netcdf(tmp, variables, request)
+            sha256 = file_sha256(tmp)
+            os.replace(tmp, target)
+            return sha256
+        except Exception as e:
+            if is_permanent(e):
+                raise PermanentDownloadError(f"{os.path.basename(target)}: {e}") from e
+            if attempt == retries:
+                raise DownloadError(f"{os.path.basename(target)}: failed after {retries + 1} attempts ({e})")
+            delay = backoff * 2 ** attempt * (0.5 + random.random())
+            print(f"   → {os.path.basename(target)}: attempt {attempt + 1} failed ({e}), retrying in {delay:.0f}s")
+            time.sleep(delay)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+
+def download_era5(jobs, variables, client_factory, manifest_path, max_workers=MAX_WORKERS,
+                  retries=RETRIES, backoff=BACKOFF, dataset=DATASET):
+    # jobs: list of (target_path, request). Returns {target_path: None | DownloadError}
+    manifest = DownloadManifest(manifest_path)
+    results = {}
+    pending = []
+    for target, request in jobs:
+        if manifest.is_complete(target, request):
+            print(f"   → {os.path.basename(target)}: Already exist")
+            results[target] = None
+            continue
+        if os.path.exists(target):
+            # Files from before the manifest existed are adopted only if they validate
+            try:
+                validate_netcdf(target, variables, request)
+                manifest.record(target, request, file_sha256(target))
+                print(f"   → {os.path.basename(target)}: Already exist (validated)")
+                results[target] = None
+                continue
+            except DownloadError as e:
+                print(f"   → {e}; downloading again")
+                os.remove(target)
+        pending.append((target, request))
+
+    local = threading.local()
+    abort = threading.Event()  # set by the first permanent failure; the years still queued are skipped
+
+    def worker(target, request):
+        if abort.is_set():
+            raise DownloadError(f"{os.path.basename(target)}: cancelled after a permanent failure")
+        try:
+            if not hasattr(local, "client"):
+                try:
+                    local.client = client_factory()
+                except Exception as e:  # e.g. no CDS key configured
+                    raise PermanentDownloadError(f"CDS client: {e}") from e
+            print(f"   → Downloading {os.path.basename(target)}...")
+            sha256 = fetch_file(local.client, target, request, variables, dataset, retries, backoff)
+        except PermanentDownloadError:
+            abort.set()
+            raise
+        manifest.record(target, request, sha256)
+        return target
+
+    if pending:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(pending)))) as pool:
+            futures = {pool.submit(worker, target, request): target for target, request in pending}
+            for future in as_completed(futures):
+                target = futures[future]
+                try:
+                    future.result()
+                    results[target] = None
+                except Exception as e:
+                    print(f"There's a error: {e}")
+                    results[target] = e if isinstance(e, DownloadError) else DownloadError(str(e))
+
+    return {target: results[target] for target, _ in jobs}
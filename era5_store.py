@@ -0,0 +1,222 @@
+# era5_store.py
+# Regional ERA5 store: the Ceará bounding box is downloaded once per year and consolidated
+# into a single compressed NetCDF4 file chunked for point reads (long time x small space),
+# so every coordinate inside the region is served by a local chunk read instead of new
+# CDS jobs and a new output/<coord>/ folder of NetCDFs.
+
+import os
+import json
+import numpy as np
+
+from era5_download import (YEARS, MANIFEST_NAME, NETCDF_LOCK, era5_request, cds_client_factory, download_era5,
+                           manifest_signature)
+from profiling import stage
+
+
+BASE_PATH = r"./input"
+REGION_DIR = os.path.join("./output", "era5_region")
+GRID_STEP = 0.25  # ERA5 single-levels resolution (degrees)
+CHUNK_TIME = 8784  # one leap year of hours
+CHUNK_SPACE = 4
+
+_YEAR_RANGES = {}  # (store file, size, mtime_ns) -> {year: (first, last)}
+
+PRODUCTS = {
+    "wind": {
+        "prefix": "wind100m",
+        "variable": ["100m_u_component_of_wind", "100m_v_component_of_wind"],
+        "short_names": ["u100", "v100"],
+    },
+    "ssrd": {
+        "prefix": "ssrd",
+        "variable": "surface_solar_radiation_downwards",
+        "short_names": ["ssrd"],
+    },
+}
+
+
+def region_area(base_path=BASE_PATH, pad=GRID_STEP):
+    # [North, West, South, East] of the shapefile bounds, padded and snapped to the ERA5 grid
+    from solar_analysis import load_ceara_shape
+
+    west, south, east, north = load_ceara_shape(base_path).total_bounds
+    return [
+        float(np.ceil((north + pad) / GRID_STEP) * GRID_STEP),
+        float(np.floor((west - pad) / GRID_STEP) * GRID_STEP),
+        float(np.floor((south - pad) / GRID_STEP) * GRID_STEP),
+        float(np.ceil((east + pad) / GRID_STEP) * GRID_STEP),
+    ]
+
+
+def store_path(product, region_dir=REGION_DIR):
+    return os.path.join(region_dir, f"{PRODUCTS[product]['prefix']}_store.nc")
+
+
+# =========================== DOWNLOAD ===========================
+def download_region(product, API_KEY, area=None, region_dir=REGION_DIR, client_factory=None, years=YEARS):
+    spec = PRODUCTS[product]
+    area = area or region_area()
+    os.makedirs(region_dir, exist_ok=True)
+
+    print(f"Downloading regional ERA5 {product} for area {area} ({years[0]}–{years[-1]})...")
+    jobs = [(os.path.join(region_dir, f"{spec['prefix']}_{year}.nc"), era5_request(spec["variable"], year, area))
+            for year in years]
+    with stage("ERA5 download", product=product, regional=True):
+        results = download_era5(jobs, spec["short_names"], client_factory or cds_client_factory(API_KEY),
+                                os.path.join(region_dir, MANIFEST_NAME))
+    return [path for path, error in results.items() if error is None]
+
+
+# =========================== CONSOLIDATION ===========================
+def source_signature(files, region_dir=REGION_DIR):
+    # Checksums of the yearly files as recorded by the download manifest
+    return manifest_signature([os.path.join(region_dir, os.path.basename(f)) for f in files])
+
+
+def read_store_signature(path):
+    # path: the store file, or a dataset already opened with open_store
+    import netCDF4
+
+    if not isinstance(path, str):
+        return json.loads(path.attrs["sources"]) if "sources" in path.attrs else None
+    if not os.path.exists(path):
+        return None
+    try:
+        with NETCDF_LOCK, netCDF4.Dataset(path) as nc:
+            return json.loads(nc.getncattr("sources"))
+    except (OSError, AttributeError, ValueError):
+        return None
+
+
+def build_regional_store(product, files, region_dir=REGION_DIR):
+    # Appends the yearly files one at a time into a chunked, zlib-compressed NetCDF4 store
+    import netCDF4
+    import xarray as xr
+
+    spec = PRODUCTS[product]
+    path = store_path(product, region_dir)
+    tmp = path + ".tmp"
+    files = sorted(files)
+    print(f"Consolidating {len(files)} files into {path}...")
+
+    with NETCDF_LOCK:
+        nc = netCDF4.Dataset(tmp, "w", format="NETCDF4")
+        try:
+            for i, file_path in enumerate(files):
+                with xr.open_dataset(file_path) as ds:
+                    time_name = "valid_time" if "valid_time" in ds.coords else "time"
+                    ds = ds.sortby("latitude", ascending=False)
+                    if i == 0:
+                        lats = ds["latitude"].values
+                        lons = ds["longitude"].values
+                        nc.createDimension("valid_time", None)
+                        nc.createDimension("latitude", lats.size)
+                        nc.createDimension("longitude", lons.size)
+                        time_var = nc.createVariable("valid_time", "i8", ("valid_time",))
+                        time_var.units = "hours since 1900-01-01 00:00:00"
+                        time_var.calendar = "proleptic_gregorian"
+                        nc.createVariable("latitude", "f8", ("latitude",))[:] = lats
+                        nc.createVariable("longitude", "f8", ("longitude",))[:] = lons
+                        chunks = (CHUNK_TIME, min(CHUNK_SPACE, lats.size), min(CHUNK_SPACE, lons.size))
+                        for name in spec["short_names"]:
+                            var = nc.createVariable(name, "f4", ("valid_time", "latitude", "longitude"),
+                                                    zlib=True, complevel=4, shuffle=True,
+                                                    chunksizes=chunks, fill_value=np.float32(np.nan))
+                            for attr in ("units", "long_name"):
+                                if attr in ds[name].attrs:
+                                    var.setncattr(attr, ds[name].attrs[attr])
+                    elif not (np.array_equal(ds["latitude"].values, lats) and
+                              np.array_equal(ds["longitude"].values, lons)):
+                        raise ValueError(f"{file_path}: grid differs from {files[0]}")
+
+                    hours = ((ds[time_name].values - np.datetime64("1900-01-01T00:00:00")) //
+                             np.timedelta64(1, "h")).astype("i8")
+                    start = len(nc.dimensions["valid_time"])
+                    nc["valid_time"][start:start + hours.size] = hours
+                    for name in spec["short_names"]:
+                        values = ds[name].transpose(time_name, "latitude", "longitude").values
+                        nc[name][start:start + hours.size] = values.astype(np.float32)
+
+            nc.setncattr("sources", json.dumps(source_signature(files, region_dir)))
+            nc.setncattr("product", product)
+        finally:
+            nc.close()
+        os.replace(tmp, path)
+    return path
+
+
+def ensure_regional_store(product, API_KEY, region_dir=REGION_DIR, client_factory=None):
+    # Downloads missing years and (re)builds the store only when the set of yearly files changed
+    files = download_region(product, API_KEY, region_dir=region_dir, client_factory=client_factory)
+    if not files:
+        return None
+    path = store_path(product, region_dir)
+    if read_store_signature(path) != source_signature(files, region_dir):
+        build_regional_store(product, files, region_dir)
+    return path
+
+
+# =========================== POINT READS ===========================
+def open_store(path):
+    # Keeps a store open across many point reads (long-running processes); pass it in place of the path
+    import xarray as xr
+
+    with NETCDF_LOCK, stage("dataset open", file=os.path.basename(path)):
+        return xr.open_dataset(path)
+
+
+def store_file(store):
+    return store if isinstance(store, str) else store.encoding.get("source")
+
+
+def year_ranges(ds):
+    # {year: (first, last)} valid_time indices of an open store. The time coordinate is only scanned
+    # once per store file, not once for every site and year read from it
+    source = store_file(ds)
+    key = None
+    if source and os.path.exists(source):
+        st = os.stat(source)
+        key = (os.path.abspath(source), st.st_size, st.st_mtime_ns)
+        if key in _YEAR_RANGES:
+            return _YEAR_RANGES[key]
+    ranges = scan_year_ranges(ds["valid_time"].dt.year.values)
+    if key is not None:
+        _YEAR_RANGES[key] = ranges
+    return ranges
+
+
+def scan_year_ranges(year_of):
+    # The store holds whole years in order, so each year is one contiguous run of the time axis
+    starts = np.flatnonzero(np.r_[True, year_of[1:] != year_of[:-1]])
+    stops = np.r_[starts[1:], year_of.size]
+    return {int(year_of[first]): (int(first), int(last)) for first, last in zip(starts, stops)}
+
+
+def iter_point_series(path, lat, lon, variables=None, block=CHUNK_TIME, years=None):
+    # Nearest-cell series in blocks of one time chunk, so a 20-year series is never held at once.
+    # years restricts the series to those calendar years (UTC) and no block then straddles two years.
+    # path may also be a dataset from open_store, which is then left open.
+    # The store is opened once; the HDF5 lock is only held while a block is read, never across yield
+    ds = open_store(path) if isinstance(path, str) else path
+    try:
+        point = ds.sel(latitude=lat, longitude=lon, method="nearest")
+        distance = max(abs(float(point["latitude"]) - lat), abs(float(point["longitude"]) - lon))
+        if distance > GRID_STEP:
+            print(f"Warning: Point outside the regional ERA5 store ({distance:.2f}° from the nearest cell)")
+        if variables is not None:
+            point = point[variables]
+
+        ranges = [(0, point.sizes["valid_time"])]
+        if years is not None:
+            by_year = year_ranges(ds)
+            ranges = [by_year[year] for year in sorted({int(y) for y in years}) if year in by_year]
+
+        for first, last in ranges:
+            for start in range(first, last, block):
+                with NETCDF_LOCK, stage("point read"):
+                    values = point.isel(valid_time=slice(start, min(start + block, last))).load()
+                yield values
+    finally:
+        if ds is not path:
+            with NETCDF_LOCK:
+                ds.close()
@@ -1,10 +1,15 @@
 # main.py
 # Unified launcher for Solar and Wind energy analysis
 # Run with: python main.py --lat -3.73 --lon -38.52
+# The analysis modules are imported only by the branch that runs them, so --wind-only never loads
+# the solar stack and a data-only run never loads the plotting libraries.
 
 import argparse
-from solar_analysis import run_solar_analysis
-from wind_analysis import run_wind_analysis
+from rendering import DEFAULT_FORMATS, parse_formats, table_formats, render_jobs
+from profiling import DEFAULT_PROFILE, stage, start_profiling, stop_profiling
+from parallel import configure, run_tasks
+from common import SOLAR_SOURCES
+from era5_download import YEARS, parse_years
 
 
 # ===================================================================
@@ -23,6 +28,14 @@ Examples:
   python main.py --lat -5.0 --lon -40.0  → Custom coordinate
   python main.py --solar-only           → Only solar analysis
   python main.py --wind-only            → Only wind analysis
+  python main.py --sites sites.csv      → Batch run over every site in a CSV/GeoJSON
+  python main.py --formats png,csv      → PNG figures plus CSV tables
+  python main.py --formats csv          → Data-only run: CSV tables, no figures
+  python main.py --years 2005-2014      → Wind statistics over 2005–2014 only (from the yearly aggregates)
+  python main.py --jobs 4               → Solar and wind side by side, months and ERA5 years in parallel
+  python main.py --map --jobs 4         → Hourly solar profile maps for the whole masked grid
+  python main.py --wind-grid --jobs 4   → Month x hour wind statistics for every ERA5 cell of the region
+  python main.py --profile trace.json   → Per-stage timings as a Chrome trace (or .jsonl for JSON lines)
 
 Note: Make sure you have inserted your CDS API key in API_KEY above.
 """,
@@ -47,7 +60,145 @@ Note: Make sure you have inserted your CDS API key in API_KEY above.
         "--wind-only", action="store_true", help="Run only the wind analysis"
     )
 
+    parser.add_argument(
+        "--sites",
+        type=str,
+        default=None,
+        help="CSV (lat/lon columns) or GeoJSON of sites for a batch run; tables saved in ./output/batch/",
+    )
+
+    parser.add_argument(
+        "--sampling",
+        choices=["nearest", "bilinear"],
+        default="nearest",
+        help="How the monthly PV rasters are sampled at each coordinate (default: nearest)",
+    )
+
+    parser.add_argument(
+        "--solar-source",
+        choices=SOLAR_SOURCES,
+        default="densiPV",
+        help="Monthly solar input: ceara_densiPV_XX.tif, densidade_energia_solar_diaria_ceara_XX.tif "
+             "or solar_data_completo.h5 (default: densiPV)",
+    )
+
+    parser.add_argument(
+        "--regional",
+        action="store_true",
+        help="Download ERA5 once for the Ceará bounding box and read every point from the local regional store",
+    )
+
+    parser.add_argument(
+        "--years",
+        type=str,
+        default=None,
+        metavar="FIRST-LAST",
+        help="ERA5 years of the wind statistics and of --wind-grid, e.g. 2005-2014 or 2019 "
+             f"(default: {YEARS[0]}-{YEARS[-1]}). Point sites download the years they are missing; --regional and "
+             f"--wind-grid read the regional store, which only holds {YEARS[0]}-{YEARS[-1]}. Yearly aggregates are "
+             "kept in ./output/cache/aggregates/, so only years not aggregated yet are read",
+    )
+
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Recompute the result tables instead of reading them from ./output/cache/results/, "
+             "without the yearly wind aggregates",
+    )
+
+    parser.add_argument(
+        "--formats",
+        type=str,
+        default=",".join(DEFAULT_FORMATS),
+        help="Comma-separated outputs: pdf, png, html figures and csv, parquet tables, or none "
+             f"(default: {','.join(DEFAULT_FORMATS)})",
+    )
+
+    parser.add_argument(
+        "--map",
+        action="store_true",
+        help="Map mode: hourly solar profiles for every valid pixel, saved as month x hour stacks in ./output/map/",
+    )
+    parser.add_argument(
+        "--map-format",
+        choices=["tif", "nc"],
+        default="tif",
+        help="Map stacks as one 24-band GeoTIFF per month or a single NetCDF4 file (default: tif)",
+    )
+    parser.add_argument(
+        "--wind-grid",
+        action="store_true",
+        help="Gridded wind mode: month x hour mean, std, CV and energy density for every ERA5 cell of the "
+             "regional store, saved as one chunked NetCDF4 file in ./output/wind_grid/",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Worker processes: the solar and wind analyses run side by side and the monthly rasters, "
+             "ERA5 year-files and map blocks are spread over the workers; --wind-grid uses as many "
+             "threads (default: 1)",
+    )
+    parser.add_argument(
+        "--memory-budget",
+        type=float,
+        default=None,
+        metavar="MB",
+        help="Memory the worker processes may use together; fewer workers are started when --jobs would "
+             "not fit (default: half of the physical memory)",
+    )
+
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const=DEFAULT_PROFILE,
+        default=None,
+        metavar="PATH",
+        help="Record wall time, CPU time, peak RSS and bytes read per stage; .jsonl writes JSON lines, "
+             f"any other extension a Chrome trace (default: {DEFAULT_PROFILE})",
+    )
+
     args = parser.parse_args()
+    try:
+        formats = parse_formats(args.formats)
+        args.years = parse_years(args.years) if args.years else None
+    except ValueError as e:
+        parser.error(str(e))
+    if args.years and (args.regional or args.wind_grid) and not set(args.years) <= set(YEARS):
+        parser.error(f"--years with --regional or --wind-grid must lie within the regional store, "
+                     f"{YEARS[0]}-{YEARS[-1]}")
+
+    configure(args.jobs, args.memory_budget)
+    if args.profile:
+        start_profiling(args.profile)
+    try:
+        run(args, formats)
+    finally:
+        if args.profile:
+            print(f"Profile saved: {stop_profiling()}")
+
+
+def run(args, formats):
+    if args.map:
+        from solar_map import run_solar_map
+        with stage("solar map", workers=args.jobs, source=args.solar_source):
+            run_solar_map(map_format=args.map_format, workers=args.jobs, source=args.solar_source)
+        return
+
+    if args.wind_grid:
+        from wind_grid import run_wind_grid
+        with stage("wind grid", workers=args.jobs):
+            run_wind_grid(API_KEY, years=args.years, workers=args.jobs)
+        return
+
+    if args.sites:
+        from batch_analysis import run_batch_analysis
+        with stage("batch analysis"):
+            run_batch_analysis(args.sites, API_KEY, run_solar=not args.wind_only, run_wind=not args.solar_only,
+                               sampling=args.sampling, regional=args.regional,
+                               formats=table_formats(formats) or ["csv"], source=args.solar_source,
+                               years=args.years, use_cache=not args.no_cache)
+        return
 
     lat = round(args.lat, 6)
     lon = round(args.lon, 6)
@@ -60,19 +211,37 @@ Note: Make sure you have inserted your CDS API key in API_KEY above.
     )
     print("=" * 70)
 
-    if not args.wind_only:
-        print("\n→ Starting SOLAR analysis...")
-        run_solar_analysis(lat, lon, API_KEY)
+    # Both analyses only queue their figures; they are rendered together in one process pool.
+    # With --jobs > 1 the two analyses run in separate worker processes
+    analyses = [name for name, skip in (("solar", args.wind_only), ("wind", args.solar_only)) if not skip]
+    results = run_tasks(run_analysis, [(name, lat, lon, args, formats) for name in analyses], "analysis")
+    jobs = [job for figure_jobs in results for job in figure_jobs]
 
-    if not args.solar_only:
-        print("\n→ Starting WIND analysis...")
-        run_wind_analysis(lat, lon, API_KEY)
+    if jobs:
+        print(f"\n→ Rendering {len(jobs)} figures...")
+        render_jobs(jobs)
 
     print("\n" + "=" * 70)
     print("ALL ANALYSES COMPLETED SUCCESSFULLY!")
-    print("PDF and HTML reports saved in: ./output/figures_pdf/")
+    print("Reports saved in: ./output/<coordinate>/figures_pdf/ and ./output/<coordinate>/tables/")
     print("=" * 70)
 
 
+def run_analysis(name, lat, lon, args, formats):
+    # One analysis of the launcher; returns its figure jobs
+    print(f"\n→ Starting {name.upper()} analysis...")
+    jobs = []
+    with stage(f"{name} analysis"):
+        if name == "solar":
+            from solar_analysis import run_solar_analysis
+            run_solar_analysis(lat, lon, API_KEY, sampling=args.sampling, regional=args.regional,
+                               use_cache=not args.no_cache, formats=formats, jobs=jobs, source=args.solar_source)
+        else:
+            from wind_analysis import run_wind_analysis
+            run_wind_analysis(lat, lon, API_KEY, regional=args.regional, use_cache=not args.no_cache,
+                              formats=formats, jobs=jobs, years=args.years)
+    return jobs
+
+
 if __name__ == "__main__":
     main()
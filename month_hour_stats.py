@@ -0,0 +1,88 @@
+# month_hour_stats.py
+# Streaming month x hour statistics: count, mean and M2 per (month, hour) cell are updated
+# one batch at a time (Welford / Chan et al. parallel update), so memory stays constant
+# no matter how many years or sites are folded in, and partial states from different
+# files or workers can be merged.
+
+import numpy as np
+import pandas as pd
+
+from common import MONTH_NAMES
+
+
+class MonthHourAccumulator:
+    def __init__(self, dtype=None):
+        self.count = np.zeros((12, 24), dtype=np.int64)
+        self.mean = np.zeros((12, 24))
+        self.m2 = np.zeros((12, 24))
+        # dtype of the input values, used for the output tables (float32 ERA5 -> float32 tables)
+        self.dtype = None if dtype is None else np.dtype(dtype)
+
+    def _combine_dtype(self, dtype):
+        if dtype is not None:
+            self.dtype = np.dtype(dtype) if self.dtype is None else np.result_type(self.dtype, dtype)
+
+    def update(self, times, values):
+        times = pd.DatetimeIndex(np.asarray(times).ravel())
+        values = np.asarray(values).ravel()
+        self._combine_dtype(values.dtype)
+        valid = ~np.isnan(values)
+        if not valid.all():
+            times = times[valid]
+            values = values[valid]
+        if values.size == 0:
+            return self
+
+        cell = (np.asarray(times.month) - 1) * 24 + np.asarray(times.hour)
+        dtype = values.dtype
+        values = values.astype(np.float64)
+        count = np.bincount(cell, minlength=288)
+        total = np.bincount(cell, weights=values, minlength=288)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(count > 0, total / count, 0.0)
+        m2 = np.bincount(cell, weights=(values - mean[cell])**2, minlength=288)
+
+        other = MonthHourAccumulator(dtype)
+        other.count = count.reshape(12, 24)
+        other.mean = mean.reshape(12, 24)
+        other.m2 = m2.reshape(12, 24)
+        return self.merge(other)
+
+    def merge(self, other):
+        self._combine_dtype(other.dtype)
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        with np.errstate(invalid='ignore', divide='ignore'):
+            weight = np.where(count > 0, other.count / count, 0.0)
+        self.mean = self.mean + delta * weight
+        self.m2 = self.m2 + other.m2 + delta**2 * self.count * weight
+        self.count = count
+        return self
+
+    # ----------------------------------------------------------------- results
+    def global_mean(self):
+        total = self.count.sum()
+        return (self.mean * self.count).sum() / total if total else np.nan
+
+    def table(self, values):
+        table = pd.DataFrame(values.astype(self.dtype or np.float64), index=MONTH_NAMES, columns=range(24))
+        table.columns.name = "Hour"
+        return table
+
+    def mean_table(self):
+        return self.table(np.where(self.count > 0, self.mean, np.nan))
+
+    def std_table(self, ddof=1):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.table(np.where(self.count > ddof, np.sqrt(self.m2 / (self.count - ddof)), np.nan))
+
+    def to_arrays(self):
+        return {"count": self.count, "mean": self.mean, "m2": self.m2}
+
+    @classmethod
+    def from_arrays(cls, count, mean, m2, dtype=None):
+        acc = cls(dtype)
+        acc.count = np.asarray(count, dtype=np.int64)
+        acc.mean = np.asarray(mean, dtype=np.float64)
+        acc.m2 = np.asarray(m2, dtype=np.float64)
+        return acc
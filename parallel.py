@@ -0,0 +1,94 @@
+# parallel.py
+# Process-pool scheduler for the independent pieces of the pipeline: the solar and wind analyses,
+# the 12 monthly rasters, the ERA5 year-files and the report figures. main.py sets the number of worker processes
+# (--jobs) and a memory budget (--memory-budget); each pool gets as many workers as the budget
+# allows at the estimated footprint of one task. Results come back in task order, and a failing
+# task raises its own exception in the caller (the first failure in task order wins, the tasks not
+# yet started are cancelled). Workers start with spawn, clear of the parent's HDF5/netCDF threads, and get the
+# remaining share of jobs and budget for any pool of their own. While a profile is being recorded
+# the workers record their stages too and send them back with the results.
+
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from profiling import active_profiler, stage, start_profiling
+
+
+JOBS = 1
+MEMORY_BUDGET_MB = None  # None: half of the physical memory
+# Peak RSS of one spawned worker (interpreter, imports and data), measured on the Ceará inputs
+TASK_MEMORY_MB = {"analysis": 400, "month": 200, "year": 150, "figure": 250}
+# Below this much input a pool costs more than it saves (a spawned worker needs ~1 s to import the stack)
+POOL_MIN_BYTES = 64 * 2**20
+
+
+def configure(jobs=1, memory_budget_mb=None):
+    global JOBS, MEMORY_BUDGET_MB
+    JOBS = max(1, int(jobs))
+    MEMORY_BUDGET_MB = memory_budget_mb
+
+
+def memory_budget_mb():
+    if MEMORY_BUDGET_MB is not None:
+        return MEMORY_BUDGET_MB
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / 2**20 / 2
+    except (AttributeError, ValueError, OSError):  # no sysconf (Windows)
+        return 4096
+
+
+def _init_worker(jobs, memory_budget_mb, profile_origin):
+    configure(jobs, memory_budget_mb)
+    if profile_origin is not None:
+        start_profiling(None, profile_origin)
+
+
+def _run_task(function, args):
+    result = function(*args)
+    profiler = active_profiler()
+    return result, (profiler.take() if profiler else [])
+
+
+def pool_size(n_tasks, kind, jobs=None):
+    # Workers for n_tasks of one kind: at most jobs, and no more than fit in the memory budget
+    jobs = JOBS if jobs is None else jobs
+    return max(1, min(jobs, n_tasks, int(memory_budget_mb() // TASK_MEMORY_MB[kind])))
+
+
+def run_tasks(function, tasks, kind, jobs=None, input_bytes=None):
+    # [function(*args) for args in tasks], on a process pool when more than one worker fits.
+    # input_bytes: size of the files the tasks read; small inputs are always run here, serially
+    tasks = [tuple(args) for args in tasks]
+    workers = pool_size(len(tasks), kind, jobs)
+    if workers <= 1 or (input_bytes is not None and input_bytes < POOL_MIN_BYTES):
+        return [function(*args) for args in tasks]
+
+    inner_jobs = max(1, (JOBS if jobs is None else jobs) // workers)
+    profiler = active_profiler()
+    context = multiprocessing.get_context("spawn")
+    with stage("process pool", kind=kind, tasks=len(tasks), workers=workers):
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                                   initargs=(inner_jobs, memory_budget_mb() / workers,
+                                             profiler.origin if profiler else None))
+        futures = [pool.submit(_run_task, function, args) for args in tasks]
+        results = []
+        try:
+            for i, future in enumerate(futures):
+                try:
+                    result, records = future.result()
+                except Exception as e:
+                    e.add_note(f"in {kind} task {i + 1}/{len(tasks)}: {function.__name__}{tasks[i]!r:.200}")
+                    raise
+                results.append(result)
+                for record in records if profiler else []:
+                    profiler.add(record)
+        except BaseException:
+            pool.shutdown(wait=True, cancel_futures=True)
+            raise
+        pool.shutdown(wait=True)
+    return results
+
+
+def files_size(paths):
+    return sum(os.path.getsize(path) for path in paths if os.path.exists(path))
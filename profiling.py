@@ -0,0 +1,184 @@
+# profiling.py
+# Per-stage instrumentation. The pipeline marks its stages with
+#     with stage("raster masking", month=3):
+# and, while a profile is being recorded (main.py --profile), every stage records its wall time,
+# CPU time (the process plus child processes that finished inside it), the process peak RSS and
+# the bytes read. The records are written as JSON lines (.jsonl) or as a Chrome trace (any other
+# extension; open it in chrome://tracing or https://ui.perfetto.dev).
+# When no profile is being recorded stage() returns one shared no-op context manager.
+# Worker processes (parallel.run_tasks) record against the parent's clock origin and send their
+# records back with each result, so a profile covers every process.
+
+import os
+import sys
+import json
+import threading
+import time
+from contextlib import nullcontext
+
+try:
+    import resource
+except ImportError:  # Windows: no peak RSS or child CPU time
+    resource = None
+
+
+DEFAULT_PROFILE = os.path.join("./output", "profile.jsonl")
+MB = 2**20
+
+_NO_STAGE = nullcontext()
+_profiler = None
+
+
+def _cpu_seconds():
+    cpu = time.process_time()
+    if resource is not None:
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        cpu += children.ru_utime + children.ru_stime
+    return cpu
+
+
+def _peak_rss():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024  # bytes on macOS, KiB on Linux
+
+
+def _io_counters():
+    # rchar: bytes returned by read calls (page-cache hits included); read_bytes: bytes fetched from storage.
+    # Linux only, None elsewhere
+    try:
+        with open("/proc/self/io", "rb") as f:
+            counters = dict(line.split(b":") for line in f.read().splitlines())
+        return int(counters[b"rchar"]), int(counters[b"read_bytes"])
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+
+def _snapshot():
+    return time.perf_counter(), _cpu_seconds(), _peak_rss(), _io_counters()
+
+
+def _delta(end, start):
+    return None if end is None or start is None else end - start
+
+
+class Stage:
+    def __init__(self, profiler, name, args):
+        self.profiler = profiler
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.depth = self.profiler._enter()
+        self.start = _snapshot()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall, cpu, peak, (rchar, read_bytes) = _snapshot()
+        start_wall, start_cpu, start_peak, (start_rchar, start_read_bytes) = self.start
+        self.profiler._exit()
+        thread = threading.current_thread()
+        record = {
+            "name": self.name,
+            "start_s": start_wall - self.profiler.origin,
+            "wall_s": wall - start_wall,
+            "cpu_s": cpu - start_cpu,
+            "peak_rss_mb": None if peak is None else peak / MB,
+            "peak_rss_growth_mb": None if peak is None else (peak - start_peak) / MB,
+            "bytes_read": _delta(rchar, start_rchar),
+            "disk_bytes_read": _delta(read_bytes, start_read_bytes),
+            "depth": self.depth,
+            "pid": os.getpid(),
+            "tid": thread.ident,
+            "thread": thread.name,
+        }
+        if self.args:
+            record["args"] = self.args
+        if exc_type is not None:
+            record["error"] = exc_type.__name__
+        self.profiler.add(record)
+        return False
+
+
+class Profiler:
+    # Collects the stage records of every thread; nesting depth is tracked per thread
+    def __init__(self, path=DEFAULT_PROFILE, origin=None):
+        self.path = path
+        self.origin = time.perf_counter() if origin is None else origin  # perf_counter is system-wide
+        self.records = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def stage(self, name, args):
+        return Stage(self, name, args)
+
+    def _enter(self):
+        depth = getattr(self._local, "depth", 0)
+        self._local.depth = depth + 1
+        return depth
+
+    def _exit(self):
+        self._local.depth -= 1
+
+    def add(self, record):
+        with self._lock:
+            self.records.append(record)
+
+    def take(self):
+        with self._lock:
+            records, self.records = self.records, []
+        return records
+
+    def chrome_trace(self):
+        # Complete ("X") events in microseconds; the metrics go in args, shown when an event is selected
+        events = []
+        threads = {}
+        for r in sorted(self.records, key=lambda r: r["start_s"]):
+            threads[(r["pid"], r["tid"])] = r["thread"]
+            args = {k: v for k, v in r.items() if k not in ("name", "start_s", "wall_s", "pid", "tid", "thread")}
+            args.update(args.pop("args", {}))
+            events.append({"name": r["name"], "cat": "stage", "ph": "X", "ts": r["start_s"] * 1e6,
+                           "dur": r["wall_s"] * 1e6, "pid": r["pid"], "tid": r["tid"], "args": args})
+        events += [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+                   for (pid, tid), name in threads.items()]
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write(self, path=None):
+        path = path or self.path
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with self._lock:
+            records = sorted(self.records, key=lambda r: r["start_s"])
+        with open(path, "w") as f:
+            if path.endswith((".jsonl", ".ndjson")):
+                for record in records:
+                    f.write(json.dumps(record, default=str) + "\n")
+            else:
+                json.dump(self.chrome_trace(), f, default=str)
+        return path
+
+
+def stage(name, **args):
+    profiler = _profiler
+    if profiler is None:
+        return _NO_STAGE
+    return profiler.stage(name, args)
+
+
+def active_profiler():
+    return _profiler
+
+
+def start_profiling(path=DEFAULT_PROFILE, origin=None):
+    global _profiler
+    _profiler = Profiler(path, origin)
+    return _profiler
+
+
+def stop_profiling():
+    # Writes the records and stops recording; returns the file path (None if nothing was being recorded)
+    global _profiler
+    profiler, _profiler = _profiler, None
+    return None if profiler is None else profiler.write()
@@ -0,0 +1,133 @@
+# raster_cache.py
+# On-disk cache of the masked monthly PV density rasters (one cache per raster source).
+# The first run writes a 12 x H x W float32 cube as .npy plus its grid (transform, CRS) in meta.json;
+# later runs memory-map the cube without touching rasterio, and compute lons/lats from the transform.
+# Run directly to (re)build the cache: python raster_cache.py
+
+import os
+import json
+import shutil
+import uuid
+import numpy as np
+
+from spatial_index import PixelCoordinates
+
+
+CACHE_VERSION = 3
+BASE_PATH = r"./input"
+CACHE_DIR = os.path.join("./output", "cache", "pv_cube")
+SHAPE_EXTENSIONS = [".shp", ".shx", ".dbf", ".prj", ".cpg"]
+# Monthly raster sets: monthly_total=True rasters hold the month's total and are divided by its days
+RASTER_SOURCES = {
+    "densiPV": {"pattern": "ceara_densiPV_{month:02d}.tif", "monthly_total": True},
+    "daily": {"pattern": "densidade_energia_solar_diaria_ceara_{month:02d}.tif", "monthly_total": False},
+}
+
+
+def cache_dir_for(source="densiPV"):
+    return CACHE_DIR if source == "densiPV" else f"{CACHE_DIR}_{source}"
+
+
+def source_files(base_path=BASE_PATH, source="densiPV"):
+    pattern = RASTER_SOURCES[source]["pattern"]
+    paths = [os.path.join(base_path, pattern.format(month=m)) for m in range(1, 13)]
+    paths += [os.path.join(base_path, f"ceara_onshore{ext}") for ext in SHAPE_EXTENSIONS]
+    return [p for p in paths if os.path.exists(p)]
+
+
+def source_fingerprint(base_path=BASE_PATH, source="densiPV"):
+    # Size + mtime of every source TIFF and shapefile component; any change invalidates the cache
+    fingerprint = []
+    for path in source_files(base_path, source):
+        st = os.stat(path)
+        fingerprint.append([os.path.basename(path), st.st_size, st.st_mtime_ns])
+    return fingerprint
+
+
+def build_pv_cube(base_path=BASE_PATH, cache_dir=None, source="densiPV"):
+    from solar_analysis import load_ceara_shape, mask_monthly_rasters
+
+    cache_dir = cache_dir or cache_dir_for(source)
+    print(f"Building PV raster cache in {cache_dir}...")
+    fingerprint = source_fingerprint(base_path, source)
+    results = mask_monthly_rasters(load_ceara_shape(base_path), base_path, source)
+
+    # Written to a temporary folder and renamed so an interrupted build never looks valid
+    tmp_dir = f"{cache_dir}.{uuid.uuid4().hex}.tmp"
+    os.makedirs(tmp_dir)
+
+    cube = np.lib.format.open_memmap(os.path.join(tmp_dir, "data.npy"), mode="w+",
+                                     dtype=np.float32, shape=(len(results),) + results[0]['data'].shape)
+    for i, result in enumerate(results):
+        cube[i] = result['data']
+    cube.flush()
+    del cube
+
+    meta = {
+        "version": CACHE_VERSION,
+        "source": source,
+        "sources": fingerprint,
+        "month_names": [r['month_name'] for r in results],
+        "vmin": [float(r['vmin']) for r in results],
+        "vmax": [float(r['vmax']) for r in results],
+        "transform": list(results[0]['transform']),
+        "crs": results[0]['crs'],
+        "flipped": results[0]['flipped'],
+    }
+    with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+        json.dump(meta, f)
+
+    # Swap the finished folder in; a concurrent build that finished first is simply replaced
+    old_dir = f"{cache_dir}.{uuid.uuid4().hex}.old"
+    try:
+        os.replace(cache_dir, old_dir)
+    except FileNotFoundError:
+        old_dir = None
+    try:
+        os.replace(tmp_dir, cache_dir)
+    except OSError:
+        # Another process moved its build in between; keep theirs
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    if old_dir:
+        shutil.rmtree(old_dir, ignore_errors=True)
+    return meta
+
+
+def read_cache_meta(cache_dir=CACHE_DIR):
+    try:
+        with open(os.path.join(cache_dir, "meta.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def load_pv_cube(base_path=BASE_PATH, cache_dir=None, source="densiPV"):
+    # Returns the same list of month dicts as process_monthly_tifs, backed by read-only memmaps
+    cache_dir = cache_dir or cache_dir_for(source)
+    meta = read_cache_meta(cache_dir)
+    if (meta is None or meta.get("version") != CACHE_VERSION or
+            meta.get("sources") != source_fingerprint(base_path, source)):
+        meta = build_pv_cube(base_path, cache_dir, source)
+
+    cube = np.load(os.path.join(cache_dir, "data.npy"), mmap_mode="r")
+    lons, lats = PixelCoordinates.pair(meta["transform"], meta["crs"], cube.shape[1:], meta["flipped"])
+
+    return [
+        {
+            'data': cube[i],
+            'lons': lons,
+            'lats': lats,
+            'month_name': month_name,
+            'vmin': meta["vmin"][i],
+            'vmax': meta["vmax"][i],
+            'transform': tuple(meta["transform"]),
+            'crs': meta["crs"],
+            'flipped': meta["flipped"],
+        }
+        for i, month_name in enumerate(meta["month_names"])
+    ]
+
+
+if __name__ == "__main__":
+    for name in RASTER_SOURCES:
+        build_pv_cube(source=name)
@@ -0,0 +1,222 @@
+# rendering.py
+# Report rendering, kept apart from the analysis: the analysis functions return plain tables
+# and describe their figures as jobs (function, keyword arguments); render_jobs draws them in
+# the --jobs process pool with the non-interactive Agg backend. Tables can also be written as CSV or
+# Parquet ("data-only" runs skip plotting entirely).
+
+import os
+
+import numpy as np
+
+from common import MONTH_NAMES
+from profiling import stage
+from parallel import pool_size, run_tasks
+
+FIGURE_FORMATS = ("pdf", "png", "html")
+TABLE_FORMATS = ("csv", "parquet")
+DEFAULT_FORMATS = ("pdf", "html")
+DPI = 300
+
+
+def parse_formats(text):
+    # "pdf,html,png,csv,parquet" or "none" -> tuple of formats, unknown names rejected
+    formats = tuple(dict.fromkeys(f.strip().lower() for f in text.split(",") if f.strip()))
+    if formats == ("none",):
+        return ()
+    unknown = [f for f in formats if f not in FIGURE_FORMATS + TABLE_FORMATS]
+    if unknown or not formats:
+        raise ValueError(f"unknown output format(s) {unknown or [text]}; "
+                         f"choose from {', '.join(FIGURE_FORMATS + TABLE_FORMATS)} or none")
+    if "parquet" in formats and not parquet_available():
+        raise ValueError("parquet output needs pyarrow or fastparquet installed")
+    return formats
+
+
+def parquet_available():
+    for engine in ("pyarrow", "fastparquet"):
+        try:
+            __import__(engine)
+            return True
+        except ImportError:
+            pass
+    return False
+
+
+def figure_formats(formats):
+    return [f for f in formats if f in FIGURE_FORMATS]
+
+
+def table_formats(formats):
+    return [f for f in formats if f in TABLE_FORMATS]
+
+
+# =========================== TABLES ===========================
+def hour_table(table):
+    # month x hour table -> flat frame with a month column and string hour columns (Parquet needs them)
+    frame = table.copy()
+    frame.columns = [f"{h:02d}h" if isinstance(h, (int, np.integer)) else str(h) for h in frame.columns]
+    frame.insert(0, "month", frame.index)
+    return frame.reset_index(drop=True)
+
+
+def save_table(frame, path_base, formats):
+    paths = []
+    for ext in table_formats(formats):
+        path = f"{path_base}.{ext}"
+        if ext == "csv":
+            frame.to_csv(path, index=False)
+        else:
+            frame.to_parquet(path, index=False)
+        print(f"Saved: {path}")
+        paths.append(path)
+    return paths
+
+
+# =========================== FIGURE JOBS ===========================
+def _pyplot():
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def _savefig(plt, path_base, formats, **kwargs):
+    paths = []
+    for ext in formats:
+        if ext == "html":
+            continue
+        path = f"{path_base}.{ext}"
+        plt.savefig(path, format=ext, dpi=DPI, **kwargs)
+        paths.append(path)
+    plt.close()
+    return paths
+
+
+def render_heatmap(data, path_base, cbar_label, fmt, formats):
+    plt = _pyplot()
+    import seaborn as sns
+
+    plt.figure(figsize=(16, 8))
+    sns.heatmap(data, annot=True, fmt=fmt, cmap=sns.color_palette("turbo", as_cmap=True), linewidths=0.5,
+                cbar_kws={'label': cbar_label, 'shrink': 0.8},
+                annot_kws={'size': 9})
+    plt.xlabel("Hour of Day", fontsize=12)
+    plt.ylabel("Month", fontsize=12)
+    plt.xticks(rotation=45, ha='right')
+    plt.yticks(rotation=0)
+    plt.tight_layout()
+    return _savefig(plt, path_base, formats, bbox_inches='tight')
+
+
+def render_solar_surface(z, path_base, formats):
+    plt = _pyplot()
+    X, Y = np.meshgrid(np.arange(24), np.arange(12))
+
+    fig = plt.figure(figsize=(16, 10))
+    ax = fig.add_subplot(111, projection='3d')
+    surf = ax.plot_surface(X, Y, z, cmap='turbo', edgecolor='k', linewidth=0.3, alpha=0.9)
+    ax.set_xlabel('Hour of Day', labelpad=15)
+    ax.set_ylabel('Month', labelpad=15)
+    ax.set_zlabel('PV Production\n(kWh/m²)', labelpad=15)
+    ax.set_xticks(np.arange(0, 24, 3))
+    ax.set_xticklabels([f"{h:02d}h" for h in range(0, 24, 3)])
+    ax.set_yticks(np.arange(12))
+    ax.set_yticklabels(MONTH_NAMES)
+    ax.view_init(elev=30, azim=-60)
+    fig.colorbar(surf, shrink=0.6, pad=0.1, label='PV Production (kWh/m²)')
+    plt.tight_layout()
+    return _savefig(plt, path_base, formats)
+
+
+def render_solar_html(z, path_base, formats):
+    import plotly.graph_objects as go
+
+    figly = go.Figure(data=[go.Surface(z=z, colorscale='Turbo')])
+    figly.update_layout(scene=dict(xaxis_title="Hour", yaxis_title="Month", zaxis_title="PV Production (kWh/m²)"),
+                        width=1200, height=800)
+    path = f"{path_base}.html"
+    figly.write_html(path)
+    return [path]
+
+
+def render_wind_surface(z, path_base, formats):
+    plt = _pyplot()
+    X, Y = np.meshgrid(np.arange(24), np.arange(12))
+
+    fig = plt.figure(figsize=(16, 10))
+    ax = fig.add_subplot(111, projection='3d')
+    surf = ax.plot_surface(X, Y, z, cmap='turbo', edgecolor='k', linewidth=0.3, alpha=0.9, antialiased=True)
+
+    ax.set_xlabel('Hour of Day', labelpad=15, fontsize=12)
+    ax.set_ylabel('Month', labelpad=15, fontsize=12)
+    ax.set_zlabel('Standard Deviation\n(kWh/m²)', labelpad=15, fontsize=12)
+
+    ax.set_xticks(np.arange(0, 24, 3))
+    ax.set_xticklabels([f"{h:02d}h" for h in range(0, 24, 3)])
+    ax.set_yticks(np.arange(12))
+    ax.set_yticklabels(MONTH_NAMES)
+
+    ax.view_init(elev=30, azim=-60)
+
+    cbar = fig.colorbar(surf, shrink=0.6, aspect=20, pad=0.1)
+    cbar.set_label('Standard Deviation (kWh/m²)', rotation=270, labelpad=20, fontsize=11)
+
+    plt.tight_layout()
+    return _savefig(plt, path_base, formats, bbox_inches='tight')
+
+
+def render_wind_html(z, path_base, formats):
+    import plotly.graph_objects as go
+
+    figly = go.Figure(data=[go.Surface(
+        z=z, x=np.arange(24), y=np.arange(12),
+        colorscale='Turbo',
+        colorbar=dict(title="Std Dev<br>(kWh/m²)", thickness=20),
+        contours_z=dict(show=True, usecolormap=True, project_z=True)
+    )])
+
+    figly.update_layout(
+        scene=dict(
+            xaxis_title="Hour of Day",
+            yaxis_title="Month",
+            zaxis_title="Std Dev (kWh/m²)",
+            xaxis=dict(tickvals=np.arange(0,24,3), ticktext=[f"{h:02d}h" for h in range(0,24,3)]),
+            yaxis=dict(tickvals=list(range(12)), ticktext=MONTH_NAMES),
+        ),
+        width=1200, height=800,
+        margin=dict(l=0, r=0, b=0, t=40)
+    )
+
+    path = f"{path_base}.html"
+    figly.write_html(path, include_plotlyjs='cdn')
+    return [path]
+
+
+def figure_job(function, path_base, formats, **kwargs):
+    # Static figures are skipped when only html is asked for, and the other way round
+    static = [f for f in formats if f in ("pdf", "png")]
+    if function in (render_solar_html, render_wind_html):
+        if "html" not in formats:
+            return []
+    elif not static:
+        return []
+    return [(function, dict(kwargs, path_base=path_base, formats=static))]
+
+
+def _run_job(job):
+    function, kwargs = job
+    return function(**kwargs)
+
+
+def render_jobs(jobs, max_workers=None):
+    # Each job draws one figure. With --jobs > 1 (or max_workers) they go to a spawn pool, sized like
+    # every other pool by the worker count and the memory budget, clear of the parent's HDF5/netCDF threads
+    if not jobs:
+        return []
+    with stage("rendering", figures=len(jobs), workers=pool_size(len(jobs), "figure", max_workers)):
+        results = run_tasks(_run_job, [(job,) for job in jobs], "figure", jobs=max_workers)
+
+    paths = [path for result in results for path in result]
+    for path in paths:
+        print(f"Saved: {os.path.basename(path)}")
+    return paths
@@ -0,0 +1,116 @@
+# result_cache.py
+# Content-addressed cache of computed result tables (solar df_mean, wind mean/std/cv/energy
+# density, capacity factor). Keys hash the coordinates, the input file signatures, the
+# analysis parameters and the source code of the computing modules, so any change in inputs
+# or code gives a new key. Entries are pickles evicted least-recently-used past a size bound.
+
+import os
+import json
+import uuid
+import hashlib
+import pandas as pd
+
+
+CACHE_DIR = os.path.join("./output", "cache", "results")
+MAX_BYTES = 256 * 1024**2
+CODE_FILES = ["solar_analysis.py", "wind_analysis.py", "month_hour_stats.py", "spatial_index.py",
+              "raster_cache.py", "era5_store.py", "aggregate_store.py", "solar_sources.py", "era5_download.py",
+              "common.py"]
+
+_code_version = None
+
+
+def code_version():
+    global _code_version
+    if _code_version is None:
+        digest = hashlib.sha256()
+        here = os.path.dirname(os.path.abspath(__file__))
+        for name in CODE_FILES:
+            with open(os.path.join(here, name), "rb") as f:
+                digest.update(name.encode() + f.read())
+        _code_version = digest.hexdigest()
+    return _code_version
+
+
+def file_stat_signature(path):
+    # [size, mtime_ns] of an input file, or None when it does not exist
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+
+def make_key(kind, **parts):
+    payload = json.dumps({"kind": kind, "code": code_version(), **parts}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ResultCache:
+    def __init__(self, cache_dir=None, max_bytes=MAX_BYTES):
+        self.cache_dir = cache_dir or CACHE_DIR
+        self.max_bytes = max_bytes
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pkl")
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            value = pd.read_pickle(path)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # Truncated or unreadable entry: drop it and recompute (another process may have already)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            return None
+        try:
+            os.utime(path)  # mtime marks the last use for LRU eviction
+        except OSError:
+            pass  # evicted by another process since it was read: the value is still good
+        return value
+
+    def put(self, key, value):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self.path(key)
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        pd.to_pickle(value, tmp)
+        os.replace(tmp, path)
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".pkl"):
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime_ns, st.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        if os.path.isdir(self.cache_dir):
+            for entry in os.scandir(self.cache_dir):
+                os.remove(entry.path)
+
+
+_default_cache = None
+
+
+def default_result_cache():
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ResultCache()
+    return _default_cache
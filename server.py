@@ -0,0 +1,246 @@
+# server.py
+# Local analysis service: the libraries, masked rasters, spatial index, capacity-factor raster and
+# regional ERA5 stores are loaded once and kept warm, and requests are answered with JSON tables.
+#   GET /solar?lat=-3.73&lon=-38.52[&sampling=bilinear][&source=daily]
+#   GET /wind?lat=-3.73&lon=-38.52
+#   GET /timings   -> per-endpoint request timings (count, mean, p50, p95, max) and the latest requests
+# Requests are served by a fixed pool of worker threads.
+# Run with: python server.py --port 8765 --workers 4 [--regional]
+
+import argparse
+import json
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+
+from common import SOLAR_SOURCES
+
+
+TIMING_HISTORY = 1000
+
+
+def table_json(table):
+    # month x hour DataFrame -> {"index": months, "columns": hours, "data": rows}, NaN as null
+    values = np.asarray(table.values, dtype=float)
+    return {"index": [str(i) for i in table.index], "columns": [str(c) for c in table.columns],
+            "data": np.where(np.isnan(values), None, values).tolist()}
+
+
+class AnalysisState:
+    # Everything a request needs that is expensive to load, loaded once and shared by the workers
+    def __init__(self, API_KEY="", regional=False, use_cache=True, source="densiPV"):
+        self.API_KEY = API_KEY
+        self.regional = regional
+        self.use_cache = use_cache
+        self.default_source = source
+        self._lock = threading.Lock()
+        self._cf_lock = threading.Lock()
+        self._rasters = {}
+        self._indexes = {}
+        self._cf_src = None
+        self.stores = {}
+
+    def warm(self):
+        import os
+        import rasterio
+        from era5_store import ensure_regional_store, open_store
+        from wind_analysis import GEOTIFF_FILE
+
+        self.monthly_rasters(self.default_source)
+        if os.path.exists(GEOTIFF_FILE):
+            self._cf_src = rasterio.open(GEOTIFF_FILE)
+        if self.regional:
+            for product in ("wind", "ssrd"):
+                path = ensure_regional_store(product, self.API_KEY)
+                if path is not None:
+                    self.stores[product] = open_store(path)
+        return self
+
+    def monthly_rasters(self, source):
+        # Rasters and their RasterIndex per source; sources on one grid share the index
+        with self._lock:
+            if source not in self._rasters:
+                from solar_analysis import load_monthly_rasters
+                from spatial_index import RasterIndex
+
+                rasters = load_monthly_rasters(source=source)
+                index = next((i for i in self._indexes.values() if i.matches(rasters[0])), None)
+                self._rasters[source] = rasters
+                self._indexes[source] = index or RasterIndex.from_rasters(rasters)
+            return self._rasters[source], self._indexes[source]
+
+    def capacity_factor(self, lat, lon):
+        from wind_analysis import DEFAULT_CAPACITY_FACTOR, sample_raster_points
+
+        if self._cf_src is None:
+            return DEFAULT_CAPACITY_FACTOR
+        with self._cf_lock:  # GDAL dataset handles are not thread-safe
+            value = sample_raster_points(self._cf_src, np.array([lat]), np.array([lon]))[0]
+        return DEFAULT_CAPACITY_FACTOR if np.isnan(value) else float(value)
+
+    def solar(self, lat, lon, sampling="nearest", source=None):
+        from solar_analysis import get_solar_tables, get_ssrd_tables
+
+        source = source or self.default_source
+        rasters, index = self.monthly_rasters(source)
+        cache = None if self.use_cache else False
+        result = {"df_mean": table_json(get_solar_tables(lat, lon, rasters, sampling, cache=cache, source=source,
+                                                         index=index)['df_mean'])}
+        if "ssrd" in self.stores:
+            era5 = get_ssrd_tables(lat, lon, self.API_KEY, regional=True, cache=cache, store=self.stores["ssrd"])
+            result["era5"] = {key: table_json(table) for key, table in era5.items()}
+        return result
+
+    def wind(self, lat, lon):
+        from wind_analysis import get_wind_tables
+
+        if self.regional and "wind" not in self.stores:
+            return None
+        stats = get_wind_tables(lat, lon, self.API_KEY, self.capacity_factor(lat, lon), self.regional,
+                                cache=None if self.use_cache else False, store=self.stores.get("wind"))
+        if stats is None:
+            return None
+        result = {key: table_json(stats[key]) for key in ["mean", "std", "cv", "energy_density"]}
+        result["capacity_factor"] = float(stats["capacity_factor"])
+        return result
+
+    def close(self):
+        from era5_download import NETCDF_LOCK
+
+        if self._cf_src is not None:
+            self._cf_src.close()
+        for rasters in self._rasters.values():
+            if hasattr(rasters, "close"):
+                rasters.close()  # the HDF5 source keeps its file open
+        with NETCDF_LOCK:
+            for ds in self.stores.values():
+                ds.close()
+
+
+class RequestTimings:
+    def __init__(self, history=TIMING_HISTORY):
+        self._lock = threading.Lock()
+        self.records = deque(maxlen=history)
+
+    def record(self, endpoint, status, seconds):
+        with self._lock:
+            self.records.append({"endpoint": endpoint, "status": status, "ms": seconds * 1e3, "time": time.time()})
+
+    def summary(self, latest=20):
+        with self._lock:
+            records = list(self.records)
+        endpoints = {}
+        for endpoint in sorted({r["endpoint"] for r in records}):
+            ms = np.array([r["ms"] for r in records if r["endpoint"] == endpoint])
+            endpoints[endpoint] = {"count": int(ms.size), "mean_ms": float(ms.mean()),
+                                   "p50_ms": float(np.percentile(ms, 50)), "p95_ms": float(np.percentile(ms, 95)),
+                                   "max_ms": float(ms.max())}
+        return {"endpoints": endpoints, "latest": records[-latest:]}
+
+
+class AnalysisHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        start = time.perf_counter()
+        url = urlparse(self.path)
+        status, body = self.route(url.path, {k: v[-1] for k, v in parse_qs(url.query).items()})
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+        if url.path != "/timings":
+            self.server.timings.record(url.path, status, time.perf_counter() - start)
+
+    def route(self, path, params):
+        state = self.server.state
+        if path == "/timings":
+            return 200, self.server.timings.summary()
+        if path not in ("/solar", "/wind"):
+            return 404, {"error": f"Unknown endpoint {path}; use /solar, /wind or /timings"}
+        try:
+            lat = float(params["lat"])
+            lon = float(params["lon"])
+        except (KeyError, ValueError):
+            return 400, {"error": "lat and lon query parameters are required numbers"}
+
+        try:
+            if path == "/solar":
+                sampling = params.get("sampling", "nearest")
+                source = params.get("source")
+                if sampling not in ("nearest", "bilinear"):
+                    return 400, {"error": f"Unknown sampling {sampling!r}"}
+                if source is not None and source not in SOLAR_SOURCES:
+                    return 400, {"error": f"Unknown source {source!r}; choose from {', '.join(SOLAR_SOURCES)}"}
+                tables = state.solar(lat, lon, sampling, source)
+            else:
+                tables = state.wind(lat, lon)
+                if tables is None:
+                    return 404, {"error": "No ERA5 wind data available for this point"}
+        except ValueError as e:
+            return 400, {"error": str(e)}
+        except Exception as e:
+            return 500, {"error": f"{type(e).__name__}: {e}"}
+        return 200, {"lat": lat, "lon": lon, "tables": tables}
+
+    def log_message(self, format, *args):
+        pass  # request timings are kept in /timings instead of one stderr line per request
+
+
+class AnalysisServer(HTTPServer):
+    # HTTPServer whose requests run on a fixed pool of worker threads
+    def __init__(self, address, state, workers=4):
+        super().__init__(address, AnalysisHandler)
+        self.state = state
+        self.timings = RequestTimings()
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="analysis")
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._process_request, request, client_address)
+
+    def _process_request(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=True)
+
+
+def serve(port=8765, host="127.0.0.1", workers=4, API_KEY="", regional=False, use_cache=True, source="densiPV"):
+    print("Loading rasters, spatial index and ERA5 stores...")
+    start = time.perf_counter()
+    state = AnalysisState(API_KEY, regional, use_cache, source).warm()
+    server = AnalysisServer((host, port), state, workers)
+    print(f"Ready in {time.perf_counter() - start:.1f} s → "
+          f"http://{host}:{server.server_port}/solar?lat=-3.73&lon=-38.52")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        state.close()
+
+
+if __name__ == "__main__":
+    from main import API_KEY
+
+    parser = argparse.ArgumentParser(description="Serve solar and wind tables as JSON from a warm process")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=4, help="Worker threads answering requests (default: 4)")
+    parser.add_argument("--regional", action="store_true", help="Serve ERA5 data from the regional stores")
+    parser.add_argument("--solar-source", choices=SOLAR_SOURCES, default="densiPV")
+    parser.add_argument("--no-cache", action="store_true", help="Do not read or write the result cache")
+    args = parser.parse_args()
+    serve(args.port, args.host, args.workers, API_KEY, args.regional, not args.no_cache, args.solar_source)
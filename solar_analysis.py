@@ -1,266 +1,525 @@
 # solar_analysis.py
+# rasterio, geopandas, pyproj and xarray are imported inside the functions that read rasters,
+# shapefiles or NetCDF files, so importing this module (and the cached point path) stays light.
 
 
 import os
-import rasterio
-import seaborn as sns
-import geopandas as gpd
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-import plotly.graph_objects as go
-import xarray as xr
-from rasterio.mask import mask
-from pyproj import Transformer
-import cdsapi
-from mpl_toolkits.mplot3d import Axes3D
+from common import MONTH_NAMES, SOLAR_SOURCES, site_output_dir
+from raster_cache import RASTER_SOURCES, load_pv_cube
+from result_cache import default_result_cache, make_key, file_stat_signature
+from spatial_index import PixelCoordinates, RasterIndex
+from era5_download import (YEARS, MANIFEST_NAME, NETCDF_LOCK, era5_request, cds_client_factory, download_era5,
+                           file_year, manifest_signature)
+from era5_store import ensure_regional_store, iter_point_series, open_store, read_store_signature, store_file
+from aggregate_store import AggregateStore, aggregate_path
+from month_hour_stats import MonthHourAccumulator
+from profiling import stage
+from parallel import run_tasks, files_size
+from solar_sources import H5Rasters, h5_path, open_h5_rasters, source_signature
+from rendering import (DEFAULT_FORMATS, figure_formats, table_formats, figure_job, render_jobs, render_heatmap,
+                       render_solar_surface, render_solar_html, hour_table, save_table)
+
+
+DAYS_PER_MONTH = [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+BASE_PATH = r"./input"
+
+
+# =========================== INPUT AND SHAPEFILE ===========================
+def load_ceara_shape(base_path=BASE_PATH):
+    import geopandas as gpd
 
+    ceara_shape_path = os.path.join(base_path, "ceara_onshore.shp")
+
+    with stage("shapefile load"):
+        gdf_ceara = gpd.read_file(ceara_shape_path)
+        if gdf_ceara.crs is None:
+            gdf_ceara = gdf_ceara.set_crs("EPSG:4326")
+        else:
+            gdf_ceara = gdf_ceara.to_crs("EPSG:4326")
+    return gdf_ceara
+
+
+# =========================== BASIC FUNCTIONS ===========================
+def process_monthly_tifs(month_num, gdf_ceara, base_path=BASE_PATH, source="densiPV"):
+    # Raises on a missing or unreadable month, so the 12 months always line up.
+    # Memory per month: only the window cropped to the state is read, as float32, and every step
+    # after the read works in place on it. Peak ~12 bytes per window pixel (rasterio's masked read:
+    # data, its mask and the shape mask), ~4 bytes per pixel kept (the float32 data; lons/lats are
+    # computed from the transform). The 560 x 463 Ceará window: ~3 MB peak, ~1 MB kept
+    import rasterio
+    from rasterio.mask import mask
+
+    spec = RASTER_SOURCES[source]
+    raster_path = os.path.join(base_path, spec["pattern"].format(month=month_num))
+    if not os.path.exists(raster_path):
+        raise FileNotFoundError(f"File not found: {raster_path}")
+
+    try:
+        with stage("raster masking", month=month_num, source=source), rasterio.open(raster_path) as src:
+            gdf_temp = gdf_ceara.to_crs(src.crs)
+            out_image, out_transform = mask(src, gdf_temp.geometry, crop=True, filled=False)
+            crs = src.crs.to_string()
+
+        band = out_image.data[0].astype(np.float32, copy=False)
+        if spec["monthly_total"]:
+            band /= DAYS_PER_MONTH[month_num-1]
+        band[np.ma.getmaskarray(out_image)[0]] = np.nan
+        band[band < 1e-10] = np.nan
+        del out_image
+
+        # South-up view (no copy); the lons/lats follow the same orientation
+        data = np.flipud(band)
+        lons, lats = PixelCoordinates.pair(out_transform, crs, data.shape, flipped=True)
+        vmin, vmax = np.percentile(band[~np.isnan(band)], [2, 98], overwrite_input=True)
+
+        return {
+            'data': data,
+            'lons': lons,
+            'lats': lats,
+            'month_name': MONTH_NAMES[month_num-1],
+            'vmin': vmin,
+            'vmax': vmax,
+            'transform': tuple(out_transform)[:6],
+            'crs': crs,
+            'flipped': True
+        }
+    except Exception as e:
+        e.add_note(f"Error in the month: {month_num:02d} ({raster_path})")
+        raise
+
+
+def load_monthly_rasters(base_path=BASE_PATH, use_cache=True, source="densiPV"):
+    # Shapefile and the 12 masked rasters are loaded once and can be shared by many sites.
+    # source: "densiPV", "daily" or "h5" (see solar_sources); the HDF5 months are read lazily
+    with stage("raster load", source=source, cached=use_cache):
+        if source == "h5":
+            return open_h5_rasters(h5_path(base_path), grid=lambda: load_monthly_rasters(base_path, use_cache))
+        if use_cache:
+            return load_pv_cube(base_path, source=source)
+
+        return mask_monthly_rasters(load_ceara_shape(base_path), base_path, source)
+
+
+def mask_monthly_rasters(gdf_ceara, base_path=BASE_PATH, source="densiPV"):
+    # The 12 months in order, masked in parallel with --jobs when the rasters are large enough to pay for it
+    spec = RASTER_SOURCES[source]
+    paths = [os.path.join(base_path, spec["pattern"].format(month=month)) for month in range(1, 13)]
+    return run_tasks(process_monthly_tifs, [(month, gdf_ceara, base_path, source) for month in range(1, 13)],
+                     "month", input_bytes=files_size(paths))
+
+
+def extract_values_by_coordinates(lats, lons, monthly_rasters, method="nearest", index=None):
+    # Returns a (n_sites, n_months) array of monthly values, NaN where the site is off the raster
+    if not monthly_rasters:
+        return np.full((np.size(lats), 0), np.nan)
+    if index is None or not index.matches(monthly_rasters[0]):
+        index = RasterIndex.from_rasters(monthly_rasters)
+
+    # All months normally share one grid; any month on a different grid gets its own index
+    layers = [r['data'] for r in monthly_rasters]
+    if all(index.matches(r) for r in monthly_rasters[1:]):
+        return index.sample(layers, lats, lons, method)
+
+    values = np.full((np.size(lats), len(monthly_rasters)), np.nan, dtype=layers[0].dtype)
+    for i, result in enumerate(monthly_rasters):
+        month_index = index if index.matches(result) else RasterIndex.from_rasters([result])
+        values[:, i] = month_index.sample([result['data']], lats, lons, method)[:, 0]
+    return values
+
+
+def compare_solar_sources(lats, lons, sources=SOLAR_SOURCES, method="nearest", base_path=BASE_PATH):
+    # Monthly daily-density values of every site in every source: (site, source) rows x month columns.
+    # Sources on the same grid share one spatial index; unavailable sources are skipped with a message
+    lats = np.atleast_1d(np.asarray(lats, dtype=float))
+    lons = np.atleast_1d(np.asarray(lons, dtype=float))
+    index = None
+    frames = []
+    for source in sources:
+        try:
+            monthly_rasters = load_monthly_rasters(base_path, source=source)
+        except (FileNotFoundError, ValueError) as e:
+            print(f"Skipping solar source {source}: {e}")
+            continue
+        if index is None or not index.matches(monthly_rasters[0]):
+            index = RasterIndex.from_rasters(monthly_rasters)
+        values = extract_values_by_coordinates(lats, lons, monthly_rasters, method, index)
+        if isinstance(monthly_rasters, H5Rasters):
+            monthly_rasters.close()
+        frame = pd.DataFrame(values, columns=[r['month_name'] for r in monthly_rasters])
+        frame.insert(0, "source", source)
+        frame.insert(0, "lon", lons)
+        frame.insert(0, "lat", lats)
+        frame.insert(0, "site", np.arange(lats.size))
+        frames.append(frame)
+    if not frames:
+        return pd.DataFrame(columns=["site", "lat", "lon", "source"] + MONTH_NAMES)
+    return pd.concat(frames, ignore_index=True).sort_values(["site", "source"], kind="stable", ignore_index=True)
+
+
+# =========================== HOURLY PROFILES ===========================
+HOURS_HL = np.linspace(0, 24, 241)
+PROFILE_CHUNK_SITES = 8  # sites per block, ~0.7 MB of float64 work arrays per site keeps blocks cache-friendly
+
+
+def fourier_function(t, P, A0, An, Bn):
+    # Vectorized over harmonics; A0 (...,), An/Bn (..., N), t (T,) -> (..., T)
+    t = np.asarray(t, dtype=float)
+    n = np.arange(1, np.shape(An)[-1] + 1)
+    angle = 2 * np.pi * n[:, None] * t[None, :] / P
+    return np.asarray(A0)[..., None] + np.asarray(An) @ np.cos(angle) + np.asarray(Bn) @ np.sin(angle)
+
+
+def fourier_coefficients(monthly_values, num_harmonics=6):
+    # monthly_values (..., M) -> A0 (...,), An (..., N), Bn (..., N)
+    monthly_values = np.asarray(monthly_values)
+    M = monthly_values.shape[-1]
+    monthly_days = np.linspace(0, 365.25, num=M, endpoint=False) + (365.25 / (2 * M))
+    P = 365.25
+
+    angle = 2 * np.pi * np.arange(1, num_harmonics + 1)[:, None] * monthly_days[None, :] / P
+    A0 = np.mean(monthly_values, axis=-1)
+    An = (2/M) * np.sum(monthly_values[..., None, :] * np.cos(angle), axis=-1)
+    Bn = (2/M) * np.sum(monthly_values[..., None, :] * np.sin(angle), axis=-1)
+    return A0, An, Bn, P
+
+
+def solar_declination(n):
+    return 23.45 * np.sin(np.deg2rad(360 * (284 + n) / 365))
+
+
+def equation_of_time(n):
+    B = np.deg2rad((360/365) * (n - 81))
+    return 9.87*np.sin(2*B) - 7.53*np.cos(B) - 1.5*np.sin(B)
+
+
+def sunrise_hour(latitude, decl):
+    ha = np.degrees(np.arccos(-np.tan(np.deg2rad(latitude)) * np.tan(np.deg2rad(decl))))
+    return 12 - ha/15, 12 + ha/15
+
+
+def generate_hourly_profiles(days_of_year, daily_densities, latitudes, local_longitudes, timezone=-3):
+    # daily_densities (S, D), latitudes/local_longitudes (S,) -> hourly energy (S, D, 24)
+    I0 = 1367; Kb = 0.98; Kd = 0.13
+    std_longitude = timezone * 15
+    latitudes = np.asarray(latitudes, dtype=float)[:, None, None]
+    local_longitudes = np.asarray(local_longitudes, dtype=float)[:, None, None]
+    days_of_year = np.asarray(days_of_year, dtype=float)[None, :, None]
+
+    EoT = equation_of_time(days_of_year)
+    time_correction = (4 * (std_longitude - local_longitudes) + EoT) / 60
+    decl = solar_declination(days_of_year)
+    sunrise, sunset = sunrise_hour(latitudes, decl)
+
+    # cos(omega) = cos(15*(h + tc - 12)) expanded as cos(a + b) so the only trig work on the
+    # (S, D, 241) grid is done on the hour axis and on the (S, D) correction separately
+    hour_angle = np.deg2rad(15 * HOURS_HL)
+    shift = np.deg2rad(15 * (time_correction - 12))
+    cos_theta = np.cos(hour_angle) * np.cos(shift)
+    cos_theta -= np.sin(hour_angle) * np.sin(shift)
+    cos_theta *= np.cos(np.deg2rad(latitudes)) * np.cos(np.deg2rad(decl))
+    cos_theta += np.sin(np.deg2rad(latitudes)) * np.sin(np.deg2rad(decl))
+
+    # sunrise <= h + tc <= sunset and cos_theta > 0
+    lit = (HOURS_HL >= sunrise - time_correction) & (HOURS_HL <= sunset - time_correction)
+    lit &= cos_theta > 0
+
+    # I0 * Kb ** (1 / cos) * cos + I0 * Kd * cos, zero outside daylight
+    irradiance = np.maximum(cos_theta, np.finfo(float).tiny, out=cos_theta)
+    ratio = np.reciprocal(irradiance)
+    ratio *= np.log(Kb)
+    np.exp(ratio, out=ratio)
+    ratio += Kd
+    irradiance *= ratio
+    irradiance *= lit
+    irradiance *= I0 / 1000.0
+    del ratio, lit
+
+    # Trapezoid rule on the uniform 0.1 h grid
+    step = HOURS_HL[1] - HOURS_HL[0]
+    model_energy = step * (irradiance.sum(axis=-1) - (irradiance[..., 0] + irradiance[..., -1]) / 2)
+    scale = np.divide(daily_densities, model_energy, out=np.ones_like(model_energy), where=model_energy > 0)
+    irradiance *= scale[..., None]
+
+    # Same linear interpolation as np.interp at the 25 full hours, applied along the last axis
+    position = np.interp(np.arange(0, 25, 1), HOURS_HL, np.arange(HOURS_HL.size))
+    left = np.minimum(np.floor(position).astype(np.intp), HOURS_HL.size - 2)
+    weight = (np.arange(0, 25, 1) - HOURS_HL[left]) / (HOURS_HL[left + 1] - HOURS_HL[left])
+    hourly_irradiance = irradiance[..., left] + (irradiance[..., left + 1] - irradiance[..., left]) * weight
+
+    return (hourly_irradiance[..., :-1] + hourly_irradiance[..., 1:]) / 2
+
+
+def calculate_monthly_hourly_profiles(lats, lons, monthly_values, num_harmonics=6, chunk_size=PROFILE_CHUNK_SITES):
+    # monthly_values (S, 12) -> month x hour mean profiles (S, 12, 24), processed in blocks of sites
+    lats = np.atleast_1d(np.asarray(lats, dtype=float))
+    lons = np.atleast_1d(np.asarray(lons, dtype=float))
+    monthly_values = np.atleast_2d(monthly_values)
+    days_of_year = np.arange(1, 366)
+    month_starts = np.cumsum([0] + DAYS_PER_MONTH[:-1])
+
+    profiles = np.empty((lats.size, len(DAYS_PER_MONTH), 24))
+    for start in range(0, lats.size, chunk_size):
+        end = start + chunk_size
+        with stage("fourier fit"):
+            A0, An, Bn, P = fourier_coefficients(monthly_values[start:end], num_harmonics)
+            daily_densities = fourier_function(days_of_year, P, A0, An, Bn)
+        with stage("hourly synthesis"):
+            annual_hourly_data = generate_hourly_profiles(days_of_year, daily_densities, lats[start:end],
+                                                          lons[start:end])
+            profiles[start:end] = (np.add.reduceat(annual_hourly_data, month_starts, axis=1) /
+                                   np.asarray(DAYS_PER_MONTH)[None, :, None])
+    return profiles
+
+
+def profile_dataframe(profile):
+    df_mean = pd.DataFrame(profile, index=MONTH_NAMES, columns=[f"{h:02d}h" for h in range(24)])
+    return df_mean.round(6)
+
+
+def calculate_monthly_hourly_profile(lat, lon, monthly_values, num_harmonics=6):
+    profiles = calculate_monthly_hourly_profiles(lat, lon, np.asarray(monthly_values)[None, :], num_harmonics)
+    return profile_dataframe(profiles[0])
+
+
+# =========================== DOWNLOAD ERA5 ===========================
+def download_ssrd(lat, lon, API_KEY, output_dir, client_factory=None, years=YEARS):
+    print(f"Downloading ERA5 SSRD ({years[0]}–{years[-1]})...")
+    jobs = [(os.path.join(output_dir, f"ssrd_{year}.nc"),
+             era5_request("surface_solar_radiation_downwards", year, [lat, lon, lat, lon]))
+            for year in years]
+    with stage("ERA5 download", product="ssrd"):
+        results = download_era5(jobs, ["ssrd"], client_factory or cds_client_factory(API_KEY),
+                                os.path.join(output_dir, MANIFEST_NAME))
+    return [path for path, error in results.items() if error is None]
+
+
+# =========================== ERA5 SSRD STATISTICS ===========================
+SSRD_BLOCK_HOURS = 744  # dask chunk of the yearly files: one month of hourly values per block
+J_PER_KWH = 3.6e6
+
+
+def ssrd_local_times(times, timezone=-3):
+    # ERA5 ssrd at valid_time T is the energy accumulated over the hour ending at T: label it by the
+    # start of that hour, in local time, so the hours line up with the Fourier profile
+    return pd.DatetimeIndex(np.asarray(times).ravel()) + pd.Timedelta(hours=timezone - 1)
+
+
+def update_ssrd_accumulator(acc, point_data, timezone=-3):
+    time_name = "valid_time" if "valid_time" in point_data.coords else "time"
+    kwh = point_data["ssrd"].values.astype(np.float32) / np.float32(J_PER_KWH)  # J/m² -> kWh/m²
+    acc.update(ssrd_local_times(point_data[time_name].values, timezone), kwh)
+    return acc
+
+
+def ssrd_file_accumulator(nc_file, lat, lon, timezone=-3, block=SSRD_BLOCK_HOURS):
+    # Lazy (dask-backed) read of one yearly file: only one block of `block` hours is in memory at a time
+    import xarray as xr
+
+    acc = MonthHourAccumulator()
+    with NETCDF_LOCK, stage("dataset open", file=os.path.basename(nc_file)):
+        ds = xr.open_dataset(nc_file, chunks={})
+    try:
+        time_name = "valid_time" if "valid_time" in ds.coords else "time"
+        point = ds[["ssrd"]].sel(latitude=lat, longitude=lon, method='nearest').chunk({time_name: block})
+        offsets = np.cumsum((0,) + point.chunks[time_name])
+        with stage("aggregation", file=os.path.basename(nc_file)):
+            for start, stop in zip(offsets[:-1], offsets[1:]):
+                with NETCDF_LOCK:
+                    values = point.isel({time_name: slice(start, stop)}).compute(scheduler="synchronous")
+                update_ssrd_accumulator(acc, values, timezone)
+    finally:
+        with NETCDF_LOCK:
+            ds.close()
+    return acc
+
+
+def ssrd_statistics_from_accumulator(acc):
+    mean = acc.mean_table()
+    std = acc.std_table()
+    cv = (std / mean * 100).fillna(0)
+    return {'mean': mean, 'std': std, 'cv': cv}
+
+
+def ssrd_source(name, checksum, timezone):
+    # Aggregate-store signature of a year: its source file, and the time zone its hours are labelled in
+    return [name, checksum, timezone]
+
+
+def compute_ssrd_statistics(nc_files, lat, lon, timezone=-3, aggregates=None):
+    # Yearly ssrd_<year>.nc files -> hourly kWh/m² month x hour mean/std/CV, one stored state per year.
+    # aggregates: AggregateStore of the site; the years missing from it are read in parallel with --jobs
+    # and merged in file order
+    nc_files = sorted(nc_files)
+    checksums = dict(manifest_signature(nc_files))
+    sources = [ssrd_source(os.path.basename(f), checksums.get(os.path.basename(f)) or file_stat_signature(f),
+                           timezone) for f in nc_files]
+    year_accs = [aggregates.get(file_year(f), source) if aggregates is not None else None
+                 for f, source in zip(nc_files, sources)]
+    missing = [i for i, year_acc in enumerate(year_accs) if year_acc is None]
+    computed = run_tasks(ssrd_file_accumulator, [(nc_files[i], lat, lon, timezone) for i in missing], "year",
+                         input_bytes=files_size(nc_files[i] for i in missing))
+    for i, year_acc in zip(missing, computed):
+        year_accs[i] = year_acc
+        if aggregates is not None:
+            aggregates.put(file_year(nc_files[i]), sources[i], year_acc)
+    if aggregates is not None:
+        aggregates.save()
+
+    acc = MonthHourAccumulator()
+    for year_acc in year_accs:
+        acc.merge(year_acc)
+    return ssrd_statistics_from_accumulator(acc)
+
+
+def ssrd_statistics_from_store(store, lat, lon, timezone=-3, aggregates=None):
+    # Same statistics from the regional store; each year is keyed by the checksum of its source file.
+    # A store path is opened once, and only if a year is missing from the aggregates
+    acc = MonthHourAccumulator()
+    ds = None if isinstance(store, str) else store
+    try:
+        for name, checksum in read_store_signature(store) or []:
+            year = file_year(name)
+            source = ssrd_source(name, checksum or file_stat_signature(store_file(store)), timezone)
+            year_acc = aggregates.get(year, source) if aggregates is not None else None
+            if year_acc is None:
+                ds = open_store(store) if ds is None else ds
+                year_acc = MonthHourAccumulator()
+                for values in iter_point_series(ds, lat, lon, ["ssrd"], block=SSRD_BLOCK_HOURS, years=[year]):
+                    update_ssrd_accumulator(year_acc, values, timezone)
+                if aggregates is not None:
+                    aggregates.put(year, source, year_acc)
+            acc.merge(year_acc)
+    finally:
+        if ds is not None and ds is not store:
+            with NETCDF_LOCK:
+                ds.close()
+    if aggregates is not None:
+        aggregates.save()
+    return ssrd_statistics_from_accumulator(acc)
+
+
+def get_ssrd_tables(lat, lon, API_KEY, regional=False, output_dir=None, cache=None, store=None):
+    # ERA5 SSRD statistics; None when no SSRD data is available. cache=False disables the per-year
+    # aggregate store. store: regional store path or open dataset, skips the download check
+    aggregates = AggregateStore(aggregate_path("ssrd", lat, lon, regional)) if cache is not False else None
+    if regional:
+        store = ensure_regional_store("ssrd", API_KEY) if store is None else store
+        return None if store is None else ssrd_statistics_from_store(store, lat, lon, aggregates=aggregates)
+
+    if output_dir is None:
+        output_dir = site_output_dir(lat, lon)
+        os.makedirs(output_dir, exist_ok=True)
+    nc_files = [f for f in download_ssrd(lat, lon, API_KEY, output_dir) if os.path.exists(f)]
+    return compute_ssrd_statistics(nc_files, lat, lon, aggregates=aggregates) if nc_files else None
+
+
+# =========================== GRAPHICS ===========================
+def solar_figure_jobs(df_mean, figures_pdf_folder, lat_str, lon_str, formats=DEFAULT_FORMATS, era5_stats=None):
+    # Figure jobs for rendering.render_jobs; nothing is drawn here
+    Z = df_mean.values
+    heatmap_base = os.path.join(figures_pdf_folder, f"Solar_Monthly_Average_PV_Density_{lat_str}_{lon_str}")
+    surface_base = os.path.join(figures_pdf_folder, f"Solar_PV_Production_3D_{lat_str}_{lon_str}")
+    jobs = (figure_job(render_heatmap, heatmap_base, formats, data=df_mean,
+                       cbar_label="PV Production Density (kWh/m²)", fmt=".4f")
+            + figure_job(render_solar_surface, surface_base, formats, z=Z)
+            + figure_job(render_solar_html, surface_base, formats, z=Z))
+
+    if era5_stats is not None:
+        heatmaps = [
+            (era5_stats['mean'], "Solar_ERA5_Monthly_Average_Irradiation", "Average Irradiation (kWh/m²)", ".4f"),
+            (era5_stats['std'], "Solar_ERA5_Standard_Deviation", "Standard Deviation (kWh/m²)", ".4f"),
+            (era5_stats['cv'], "Solar_ERA5_Coefficient_of_Variation", "Coefficient of Variation (%)", ".1f"),
+        ]
+        for data, base_name, cbar_label, fmt in heatmaps:
+            path_base = os.path.join(figures_pdf_folder, f"{base_name}_{lat_str}_{lon_str}")
+            jobs += figure_job(render_heatmap, path_base, formats, data=data, cbar_label=cbar_label, fmt=fmt)
+    return jobs
+
+
+def save_solar_tables(df_mean, tables_folder, lat_str, lon_str, formats, era5_stats=None):
+    path_base = os.path.join(tables_folder, f"Solar_Monthly_Average_PV_Density_{lat_str}_{lon_str}")
+    paths = save_table(hour_table(df_mean), path_base, formats)
+    for key in ["mean", "std", "cv"] if era5_stats is not None else []:
+        path_base = os.path.join(tables_folder, f"Solar_ERA5_{key}_{lat_str}_{lon_str}")
+        paths += save_table(hour_table(era5_stats[key]), path_base, formats)
+    return paths
+
+
+def get_solar_tables(lat, lon, monthly_rasters=None, sampling="nearest", num_harmonics=6, cache=None,
+                     source="densiPV", index=None):
+    # Result tables only (no download, no figures); cache=False disables the result cache.
+    # monthly_rasters (and a RasterIndex on their grid), when given, must come from `source`
+    cache = default_result_cache() if cache is None else cache
+    key = make_key("solar", lat=round(float(lat), 6), lon=round(float(lon), 6), sampling=sampling,
+                   num_harmonics=num_harmonics, source=source, sources=source_signature(source, BASE_PATH))
+    tables = cache.get(key) if cache else None
+    if tables is not None:
+        return tables
+
+    loaded = monthly_rasters is None
+    if loaded:
+        monthly_rasters = load_monthly_rasters(source=source)
+
+    values = extract_values_by_coordinates(lat, lon, monthly_rasters, sampling, index)[0]
+    if loaded and isinstance(monthly_rasters, H5Rasters):
+        monthly_rasters.close()
+    monthly_values = {result['month_name']: val for result, val in zip(monthly_rasters, values)}
+
+    values_list = list(monthly_values.values())
+
+    # =========================== HOURLY PROFILES ===========================
+    tables = {'df_mean': calculate_monthly_hourly_profile(lat, lon, values_list, num_harmonics)}
+    if cache:
+        cache.put(key, tables)
+    return tables
 
-def run_solar_analysis(lat: float, lon: float, API_KEY: str):
+
+def run_solar_analysis(lat: float, lon: float, API_KEY: str, monthly_rasters=None, sampling="nearest",
+                       regional=False, use_cache=True, formats=DEFAULT_FORMATS, jobs=None, source="densiPV"):
+    # Figures go to `jobs` when a list is given (rendered later by the caller), otherwise they are rendered here
     print(f"\n{'='*70}")
     print(f"SOLAR ANALYSIS → Lat: {lat:.2f}° | Lon: {lon:.2f}°")
     print(f"{'='*70}")
-    month_names = ["Jan","Feb","Mar","Apr","May","Jun","Jul","Aug","Sep","Oct","Nov","Dec"]
     # =========================== FOLDERS ===========================
-    coord_folder = f"{lat:.2f}_{lon:.2f}".replace('-', 'm').replace('.', 'p')
-    output_dir = os.path.join("./output", coord_folder)
+    output_dir = site_output_dir(lat, lon)
     figures_pdf_folder = os.path.join(output_dir, "figures_pdf")
+    tables_folder = os.path.join(output_dir, "tables")
 
     os.makedirs(output_dir, exist_ok=True)
-    os.makedirs(figures_pdf_folder, exist_ok=True)
+    if figure_formats(formats):
+        os.makedirs(figures_pdf_folder, exist_ok=True)
+    if table_formats(formats):
+        os.makedirs(tables_folder, exist_ok=True)
 
     lat_str = f"Lat_{str(lat).replace('-', 'm').replace('.', 'p')}"
     lon_str = f"Lon_{str(lon).replace('-', 'm').replace('.', 'p')}"
 
-    # =========================== INPUT AND SHAPEFILE ===========================
-    base_path = r"./input"
-    ceara_shape_path = os.path.join(base_path, "ceara_onshore.shp")
-
-    gdf_ceara = gpd.read_file(ceara_shape_path)
-    if gdf_ceara.crs is None:
-        gdf_ceara = gdf_ceara.set_crs("EPSG:4326")
-    else:
-        gdf_ceara = gdf_ceara.to_crs("EPSG:4326")
-
-    # =========================== BASIC FUNCTIONS ===========================
-    def process_monthly_tifs(month_num):
-        month_names = ["Jan", "Feb", "Mar", "Apr", "May", "Jun",
-                       "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
-        
-        raster_path = os.path.join(base_path, f"ceara_densiPV_{month_num:02d}.tif")
-        if not os.path.exists(raster_path):
-            print(f"File not found: {raster_path}")
-            return None
-
-        try:
-            with rasterio.open(raster_path) as src:
-                gdf_temp = gdf_ceara.to_crs(src.crs)
-                out_image, out_transform = mask(src, gdf_temp.geometry, crop=True)
-                out_meta = src.meta.copy()
-                out_meta.update({
-                    "driver": "GTiff",
-                    "height": out_image.shape[1],
-                    "width": out_image.shape[2],
-                    "transform": out_transform
-                })
-
-            days_in_month = [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31][month_num-1]
-            solar_energy_density = out_image[0] / days_in_month
-
-            height, width = solar_energy_density.shape
-            x_coords = np.linspace(out_transform.c + out_transform.a/2, out_transform.c + out_transform.a*(width-0.5), width)
-            y_coords = np.linspace(out_transform.f + out_transform.e*(height-0.5), out_transform.f + out_transform.e/2, height)
-            x_mesh, y_mesh = np.meshgrid(x_coords, y_coords)
-
-            transformer = Transformer.from_crs(src.crs, "EPSG:4326", always_xy=True)
-            lons, lats = transformer.transform(x_mesh, y_mesh)
-
-            solar_energy_density = np.flipud(solar_energy_density)
-            filtered = np.where(solar_energy_density < 1e-10, np.nan, solar_energy_density)
-            vmin, vmax = np.nanpercentile(filtered[~np.isnan(filtered)], [2, 98])
-
-            return {
-                'data': filtered,
-                'lons': lons,
-                'lats': lats,
-                'month_name': month_names[month_num-1],
-                'vmin': vmin,
-                'vmax': vmax
-            }
-        except Exception as e:
-            print(f"Error in the month: {month_num:02d}: {e}")
-            return None
-
-    def extract_value_by_coordinate(lat, lon, data, lons, lats):
-        distances = np.sqrt((lons - lon)**2 + (lats - lat)**2)
-        row, col = np.unravel_index(np.argmin(distances), distances.shape)
-        if distances[row, col] > 0.02:
-            print(f"Warning: Point far from the raster: ({distances[row, col]:.4f}°)")
-            return np.nan
-        return data[row, col]
-
     # =========================== EXTRACT MONTH VALUES ===========================
-    monthly_values = {}
-    for month in range(1, 13):
-        result = process_monthly_tifs(month)
-        if result:
-            val = extract_value_by_coordinate(lat, lon, result['data'], result['lons'], result['lats'])
-            monthly_values[result['month_name']] = val if val is not None else np.nan
-
-    values_list = list(monthly_values.values())
-
-    # =========================== HOURLY PROFILES ===========================
-    def fourier_function(t, P, A0, An, Bn):
-        result = A0
-        for n in range(len(An)):
-            result += An[n] * np.cos(2 * np.pi * (n+1) * t / P) + Bn[n] * np.sin(2 * np.pi * (n+1) * t / P)
-        return result
-
-    def solar_declination(n):
-        return 23.45 * np.sin(np.deg2rad(360 * (284 + n) / 365))
-
-    def equation_of_time(n):
-        B = np.deg2rad((360/365) * (n - 81))
-        return 9.87*np.sin(2*B) - 7.53*np.cos(B) - 1.5*np.sin(B)
-
-    def sunrise_hour(latitude, decl):
-        ha = np.degrees(np.arccos(-np.tan(np.deg2rad(latitude)) * np.tan(np.deg2rad(decl))))
-        return 12 - ha/15, 12 + ha/15
-
-    def generate_hourly_profile_day(day_of_year, daily_density, latitude, local_longitude, timezone=-3):
-        I0 = 1367; Kb = 0.98; Kd = 0.13
-        std_longitude = timezone * 15
-        EoT = equation_of_time(day_of_year)
-        time_correction = (4 * (std_longitude - local_longitude) + EoT) / 60
-        decl = solar_declination(day_of_year)
-        sunrise, sunset = sunrise_hour(latitude, decl)
-
-        hours_HL = np.linspace(0, 24, 241)
-        irradiance = np.zeros_like(hours_HL)
-
-        for i, h_HL in enumerate(hours_HL):
-            h_TSL = h_HL + time_correction
-            if sunrise <= h_TSL <= sunset:
-                omega = 15 * (h_TSL - 12)
-                cos_theta = (np.sin(np.deg2rad(latitude)) * np.sin(np.deg2rad(decl)) +
-                             np.cos(np.deg2rad(latitude)) * np.cos(np.deg2rad(decl)) * np.cos(np.deg2rad(omega)))
-                if cos_theta > 0:
-                    Ib = I0 * Kb ** (1 / cos_theta)
-                    Id = I0 * Kd * cos_theta
-                    irradiance[i] = (Ib * cos_theta + Id) / 1000.0
-
-        model_energy = np.trapezoid(irradiance, hours_HL)
-        if model_energy > 0:
-            irradiance *= daily_density / model_energy
-
-        full_hours = np.arange(0, 25, 1)
-        hourly_irradiance = np.interp(full_hours, hours_HL, irradiance)
-        hourly_energy = np.zeros(24)
-        for hour in range(24):
-            hourly_energy[hour] = (hourly_irradiance[hour] + hourly_irradiance[hour+1]) / 2
-
-        return hourly_energy
-
-    def calculate_monthly_hourly_profile(lat, lon, monthly_values, num_harmonics=6):
-        M = len(monthly_values)
-        monthly_days = np.linspace(0, 365.25, num=M, endpoint=False) + (365.25 / (2 * M))
-        P = 365.25
-
-        A0 = np.mean(monthly_values)
-        An = [ (2/M) * np.sum(monthly_values * np.cos(2*np.pi*n*monthly_days/P)) for n in range(1, num_harmonics+1) ]
-        Bn = [ (2/M) * np.sum(monthly_values * np.sin(2*np.pi*n*monthly_days/P)) for n in range(1, num_harmonics+1) ]
-
-        days_of_year = np.arange(1, 366)
-        daily_densities = [fourier_function(d, P, A0, An, Bn) for d in days_of_year]
-
-        annual_hourly_data = np.zeros((365, 24))
-        for day in range(365):
-            annual_hourly_data[day] = generate_hourly_profile_day(day + 1, daily_densities[day], lat, lon)
-
-        days_per_month = [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
-        month_names = ["Jan","Feb","Mar","Apr","May","Jun","Jul","Aug","Sep","Oct","Nov","Dec"]
-        monthly_means = []
-        start = 0
-        for days in days_per_month:
-            end = start + days
-            monthly_means.append(annual_hourly_data[start:end].mean(axis=0))
-            start = end
-
-        df_mean = pd.DataFrame(monthly_means, index=month_names, columns=[f"{h:02d}h" for h in range(24)])
-        return df_mean.round(6)
-
-    df_mean = calculate_monthly_hourly_profile(lat, lon, values_list)
-
-    # =========================== DOWNLOAD ERA5 ===========================
-    print("Downloading ERA5 SSRD (1999–2018)...")
-    c = cdsapi.Client(url="https://cds.climate.copernicus.eu/api", key=API_KEY)
-
-    years = [str(y) for y in range(1999, 2019)]
-    for year in years:
-        fp = os.path.join(output_dir, f"ssrd_{year}.nc")
-        if os.path.exists(fp):
-            continue
-        c.retrieve("reanalysis-era5-single-levels", {
-            "product_type": "reanalysis",
-            "variable": "surface_solar_radiation_downwards",
-            "year": year,
-            "month": [f"{m:02d}" for m in range(1,13)],
-            "day": [f"{d:02d}" for d in range(1,32)],
-            "time": [f"{h:02d}:00" for h in range(24)],
-            "area": [lat, lon, lat, lon],
-            "format": "netcdf"
-        }, fp)
-
-    # =========================== GRAPHICS ===========================
-    cmap = sns.color_palette("turbo", as_cmap=True)
-
-    def save_clean_heatmap(data, base_name, cbar_label, fmt=".4f"):
-        plt.figure(figsize=(16, 8))
-        sns.heatmap(data, annot=True, fmt=fmt, cmap=cmap, linewidths=0.5,
-                    cbar_kws={'label': cbar_label, 'shrink': 0.8},
-                    annot_kws={'size': 9})
-        plt.xlabel("Hour of Day", fontsize=12)
-        plt.ylabel("Month", fontsize=12)
-        plt.xticks(rotation=45, ha='right')
-        plt.yticks(rotation=0)
-        plt.tight_layout()
-        path = os.path.join(figures_pdf_folder, f"{base_name}_{lat_str}_{lon_str}.pdf")
-        plt.savefig(path, format='pdf', dpi=300, bbox_inches='tight')
-        plt.close()
-        print(f"Saved: {os.path.basename(path)}")
-
-    save_clean_heatmap(df_mean, "Solar_Monthly_Average_PV_Density", "PV Production Density (kWh/m²)")
-
-    # 3D
-    X, Y = np.meshgrid(np.arange(24), np.arange(12))
-    Z = df_mean.values
+    with stage("solar tables", source=source):
+        df_mean = get_solar_tables(lat, lon, monthly_rasters, sampling, cache=None if use_cache else False,
+                                   source=source)['df_mean']
+
+    # =========================== ERA5 SSRD ===========================
+    with stage("ssrd tables", regional=regional):
+        era5_stats = get_ssrd_tables(lat, lon, API_KEY, regional, output_dir, cache=None if use_cache else False)
+    if era5_stats is None:
+        print("No SSRD files found. Skipping the ERA5 solar statistics.")
+
+    with stage("table export"):
+        save_solar_tables(df_mean, tables_folder, lat_str, lon_str, formats, era5_stats)
+    figure_jobs = solar_figure_jobs(df_mean, figures_pdf_folder, lat_str, lon_str, formats, era5_stats)
+    if jobs is None:
+        render_jobs(figure_jobs)
+    else:
+        jobs.extend(figure_jobs)
 
-    fig = plt.figure(figsize=(16, 10))
-    ax = fig.add_subplot(111, projection='3d')
-    surf = ax.plot_surface(X, Y, Z, cmap='turbo', edgecolor='k', linewidth=0.3, alpha=0.9)
-    ax.set_xlabel('Hour of Day', labelpad=15)
-    ax.set_ylabel('Month', labelpad=15)
-    ax.set_zlabel('PV Production\n(kWh/m²)', labelpad=15)
-    ax.set_xticks(np.arange(0, 24, 3))
-    ax.set_xticklabels([f"{h:02d}h" for h in range(0, 24, 3)])
-    ax.set_yticks(np.arange(12))
-    ax.set_yticklabels(month_names)
-    ax.view_init(elev=30, azim=-60)
-    fig.colorbar(surf, shrink=0.6, pad=0.1, label='PV Production (kWh/m²)')
-    plt.tight_layout()
-    plt.savefig(os.path.join(figures_pdf_folder, f"Solar_PV_Production_3D_{lat_str}_{lon_str}.pdf"), dpi=300)
-    plt.close()
-
-    # HTML interativo
-    figly = go.Figure(data=[go.Surface(z=Z, colorscale='Turbo')])
-    figly.update_layout(scene=dict(xaxis_title="Hour", yaxis_title="Month", zaxis_title="PV Production (kWh/m²)"),
-                        width=1200, height=800)
-    figly.write_html(os.path.join(figures_pdf_folder, f"Solar_PV_Production_3D_{lat_str}_{lon_str}.html"))
-
-    print(f"\nSOLAR ANALYSIS COMPLETED!\nAll files in: {figures_pdf_folder}\n")
+    print(f"\nSOLAR ANALYSIS COMPLETED!\nAll files in: {output_dir}\n")
     print(f"{'='*70}\n")
+    return df_mean
 
 
 #if __name__ == "__main__":
     #API_KEY = "SUA_CHAVE_AQUI_PARA_TESTE"
-    #run_solar_analysis(-3.73, -38.52, API_KEY)
\ No newline at end of file
+    #run_solar_analysis(-3.73, -38.52, API_KEY)
@@ -0,0 +1,176 @@
+# solar_map.py
+# Map mode: the Fourier -> hourly solar profile for every valid pixel of the masked Ceará grid in
+# one vectorized pass. Rows are processed in blocks (memory bounded by the block, optionally in
+# parallel with dask) and each block is written straight into month x hour stacks: one 24-band
+# GeoTIFF per month (band = hour) or a single NetCDF4 file (month, hour, y, x).
+
+import os
+import numpy as np
+
+from common import MONTH_NAMES
+from solar_analysis import load_monthly_rasters, calculate_monthly_hourly_profiles
+
+
+MAP_DIR = "./output/map"
+MAP_FORMATS = ("tif", "nc")
+BLOCK_ROWS = 16  # ~7k pixels of a 463-column row block, ~8 MB of float32 output per block
+
+
+def block_profiles(lats, lons, values, num_harmonics=6):
+    # values (rows, cols, 12) -> (rows, cols, 12, 24) float32 profiles, NaN where any month is missing
+    valid = np.isfinite(values).all(axis=-1)
+    profiles = np.full(valid.shape + (12, 24), np.nan, dtype=np.float32)
+    if valid.any():
+        profiles[valid] = calculate_monthly_hourly_profiles(lats[valid], lons[valid], values[valid], num_harmonics)
+    return profiles
+
+
+def block_rows_of(layer, start, stop):
+    # Rows start:stop of an array, or of a lazy layer (solar_sources.H5Layer) through its [rows, cols] reads
+    if isinstance(layer, np.ndarray):
+        return layer[start:stop]
+    return layer[np.arange(start, stop)[:, None], np.arange(layer.shape[1])[None, :]]
+
+
+def block_inputs(monthly_rasters, start, stop):
+    lats = np.asarray(monthly_rasters[0]['lats'][start:stop], dtype=float)
+    lons = np.asarray(monthly_rasters[0]['lons'][start:stop], dtype=float)
+    values = np.stack([block_rows_of(r['data'], start, stop) for r in monthly_rasters], axis=-1)
+    return lats, lons, values
+
+
+# =========================== WRITERS ===========================
+class TifStackWriter:
+    # One tiled, deflate-compressed GeoTIFF per month with 24 hourly bands
+    def __init__(self, output_dir, height, width, transform, crs):
+        import rasterio
+        from rasterio.transform import Affine
+
+        self.paths = [os.path.join(output_dir, f"solar_hourly_pv_density_{m:02d}_{name}.tif")
+                      for m, name in enumerate(MONTH_NAMES, 1)]
+        profile = dict(driver="GTiff", height=height, width=width, count=24, dtype="float32",
+                       crs=crs, transform=Affine(*transform), nodata=np.nan, tiled=True,
+                       blockxsize=256, blockysize=256, compress="deflate", predictor=3)
+        self.datasets = [rasterio.open(path + ".tmp", "w", **profile) for path in self.paths]
+        for ds in self.datasets:
+            ds.descriptions = tuple(f"{h:02d}h" for h in range(24))
+            ds.update_tags(units="kWh/m2")
+
+    def write(self, row, block):
+        # block (rows, cols, 12, 24), north-up rows starting at `row`
+        from rasterio.windows import Window
+        window = Window(0, row, block.shape[1], block.shape[0])
+        for month, ds in enumerate(self.datasets):
+            ds.write(np.moveaxis(block[:, :, month, :], -1, 0), window=window)
+
+    def close(self, commit=True):
+        for ds, path in zip(self.datasets, self.paths):
+            ds.close()
+            if commit:
+                os.replace(path + ".tmp", path)
+            else:
+                os.remove(path + ".tmp")
+        return self.paths
+
+
+class NetCDFStackWriter:
+    # (month, hour, y, x) float32 variable, zlib-compressed and chunked one month x all hours x row block
+    def __init__(self, output_dir, height, width, transform, crs, block_rows=BLOCK_ROWS):
+        import netCDF4
+
+        self.path = os.path.join(output_dir, "solar_hourly_pv_density.nc")
+        self.nc = netCDF4.Dataset(self.path + ".tmp", "w", format="NETCDF4")
+        a, _, c, _, e, f = transform
+        for name, size in [("month", 12), ("hour", 24), ("y", height), ("x", width)]:
+            self.nc.createDimension(name, size)
+        self.nc.createVariable("month", "i4", ("month",))[:] = np.arange(1, 13)
+        self.nc.createVariable("hour", "i4", ("hour",))[:] = np.arange(24)
+        self.nc.createVariable("y", "f8", ("y",))[:] = f + e * (np.arange(height) + 0.5)
+        self.nc.createVariable("x", "f8", ("x",))[:] = c + a * (np.arange(width) + 0.5)
+        var = self.nc.createVariable("pv_density", "f4", ("month", "hour", "y", "x"), zlib=True, complevel=4,
+                                     shuffle=True, chunksizes=(1, 24, min(block_rows, height), width),
+                                     fill_value=np.float32(np.nan))
+        var.units = "kWh/m2"
+        var.long_name = "Mean hourly PV production density"
+        self.nc.setncattr("crs", crs)
+        self.nc.setncattr("transform", list(transform))
+
+    def write(self, row, block):
+        self.nc["pv_density"][:, :, row:row + block.shape[0], :] = np.transpose(block, (2, 3, 0, 1))
+
+    def close(self, commit=True):
+        self.nc.close()
+        if commit:
+            os.replace(self.path + ".tmp", self.path)
+        else:
+            os.remove(self.path + ".tmp")
+        return [self.path]
+
+
+# =========================== MAP MODE ===========================
+def run_solar_map(monthly_rasters=None, output_dir=MAP_DIR, map_format="tif", num_harmonics=6,
+                  block_rows=BLOCK_ROWS, workers=1, source="densiPV"):
+    # workers > 1 computes that many row blocks at once with dask's process scheduler.
+    # monthly_rasters, when given, must come from `source`
+    if map_format not in MAP_FORMATS:
+        raise ValueError(f"map_format must be one of {MAP_FORMATS}, got {map_format!r}")
+    if monthly_rasters is None:
+        monthly_rasters = load_monthly_rasters(source=source)
+    if len(monthly_rasters) != 12:
+        raise ValueError(f"map mode needs the 12 monthly rasters, got {len(monthly_rasters)}")
+
+    first = monthly_rasters[0]
+    if first.get('transform') is None or first.get('crs') is None:
+        raise ValueError(f"map mode needs a georeferenced grid; solar source {source!r} has no transform/crs")
+    height, width = first['data'].shape
+    flipped = first.get('flipped', False)
+    os.makedirs(output_dir, exist_ok=True)
+
+    print(f"\n{'='*70}")
+    print(f"SOLAR MAP ({source}) → {height} x {width} grid, {block_rows}-row blocks, {workers} worker(s)")
+    print(f"{'='*70}")
+
+    writer_class = TifStackWriter if map_format == "tif" else NetCDFStackWriter
+    writer = writer_class(output_dir, height, width, first['transform'], first['crs'])
+
+    def write(start, stop, block):
+        # The cached rasters are stored south-up (flipped); the stacks are written north-up
+        if flipped:
+            writer.write(height - stop, block[::-1])
+        else:
+            writer.write(start, block)
+
+    blocks = [(start, min(start + block_rows, height)) for start in range(0, height, block_rows)]
+    try:
+        if workers <= 1:
+            for start, stop in blocks:
+                write(start, stop, block_profiles(*block_inputs(monthly_rasters, start, stop), num_harmonics))
+                print(f"\rRows {stop}/{height}", end="")
+        else:
+            import dask
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            # One pool for the whole run; only `workers` blocks are in flight at a time to bound memory
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool, dask.config.set(pool=pool):
+                for group in range(0, len(blocks), workers):
+                    batch = blocks[group:group + workers]
+                    tasks = [dask.delayed(block_profiles)(*block_inputs(monthly_rasters, start, stop), num_harmonics)
+                             for start, stop in batch]
+                    for (start, stop), block in zip(batch, dask.compute(*tasks, scheduler="processes")):
+                        write(start, stop, block)
+                    print(f"\rRows {batch[-1][1]}/{height}", end="")
+        print()
+    except BaseException:
+        writer.close(commit=False)
+        raise
+    paths = writer.close()
+
+    for path in paths:
+        print(f"Saved: {path}")
+    print(f"\nSOLAR MAP COMPLETED!\nAll files in: {output_dir}\n")
+    return paths
+
+
+if __name__ == "__main__":
+    run_solar_map()
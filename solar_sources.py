@@ -0,0 +1,159 @@
+# solar_sources.py
+# Data-access layer for the solar inputs that can feed the hourly profile:
+#   densiPV - ceara_densiPV_XX.tif, monthly totals (divided by the days of the month)
+#   daily   - densidade_energia_solar_diaria_ceara_XX.tif, daily density
+#   h5      - solar_data_completo.h5, a (12, rows, cols) or (rows, cols, 12) daily-density dataset
+# Every source is exposed as the same list of 12 month dicts used by extract_values_by_coordinates,
+# so one RasterIndex serves all sources on the same grid. The HDF5 months are never loaded: each
+# layer reads only the row slices that contain requested pixels.
+
+import os
+import weakref
+import numpy as np
+
+from common import MONTH_NAMES, SOLAR_SOURCES
+from era5_download import NETCDF_LOCK
+from raster_cache import RASTER_SOURCES, source_fingerprint
+from result_cache import file_stat_signature
+
+
+H5_NAME = "solar_data_completo.h5"
+H5_DATA_NAMES = ["daily_density", "solar_energy_density", "densidade_energia_solar_diaria", "data"]
+LAT_NAMES = ["lat", "lats", "latitude"]
+LON_NAMES = ["lon", "lons", "longitude"]
+
+
+def h5_path(base_path):
+    return os.path.join(base_path, H5_NAME)
+
+
+def source_signature(source, base_path):
+    # Signature of the files behind a source, for result-cache keys
+    if source == "h5":
+        return file_stat_signature(h5_path(base_path))
+    if source not in RASTER_SOURCES:
+        raise ValueError(f"Unknown solar source {source!r}; choose from {', '.join(SOLAR_SOURCES)}")
+    return source_fingerprint(base_path, source)
+
+
+class H5Layer:
+    # One month of an HDF5 dataset, indexed like a 2-D array (layer[rows, cols]) but read row slice
+    # by row slice; flip_rows maps south-up index rows onto a north-up dataset
+    def __init__(self, dataset, month, month_axis, flip_rows=False, fill_value=None):
+        self.dataset = dataset
+        self.month = month
+        self.month_axis = month_axis
+        self.flip_rows = flip_rows
+        self.fill_value = fill_value
+        shape = list(dataset.shape)
+        del shape[month_axis]
+        self.shape = tuple(shape)
+        self.dtype = np.result_type(dataset.dtype, np.float32)
+
+    def _read_row(self, row, start, stop):
+        if self.month_axis == 0:
+            return self.dataset[self.month, row, start:stop]
+        return self.dataset[row, start:stop, self.month]
+
+    def __getitem__(self, key):
+        rows, cols = np.broadcast_arrays(*(np.asarray(k, dtype=np.intp) for k in key))
+        if self.flip_rows:
+            rows = self.shape[0] - 1 - rows
+        values = np.empty(rows.shape, dtype=self.dtype)
+        with NETCDF_LOCK:
+            for row in np.unique(rows):
+                hit = rows == row
+                start, stop = cols[hit].min(), cols[hit].max() + 1
+                values[hit] = self._read_row(row, start, stop)[cols[hit] - start]
+        # Same masking as process_monthly_tifs: fill values and zeros outside the state are NaN
+        if self.fill_value is not None:
+            values[values == self.fill_value] = np.nan
+        values[values < 1e-10] = np.nan
+        return values
+
+
+class H5Rasters(list):
+    # The 12 month dicts of open_h5_rasters and the HDF5 file behind their layers. close() (or a with
+    # block) closes the file; otherwise it is closed once the list itself is released
+    def __init__(self, months, h5):
+        super().__init__(months)
+        self._close = weakref.finalize(self, h5.close)
+
+    def close(self):
+        self._close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def h5_layout(h5):
+    # Names of the monthly dataset and of the optional latitude/longitude datasets
+    import h5py
+
+    datasets = []
+    h5.visititems(lambda name, obj: datasets.append(name) if isinstance(obj, h5py.Dataset) else None)
+    leaf = {name: name.rsplit("/", 1)[-1].lower() for name in datasets}
+
+    candidates = [name for name in datasets
+                  if h5[name].ndim == 3 and 12 in (h5[name].shape[0], h5[name].shape[-1])
+                  and np.issubdtype(h5[name].dtype, np.number)]
+    if not candidates:
+        raise ValueError(f"{h5.filename}: no (12, rows, cols) or (rows, cols, 12) dataset found")
+    candidates.sort(key=lambda name: H5_DATA_NAMES.index(leaf[name]) if leaf[name] in H5_DATA_NAMES
+                    else len(H5_DATA_NAMES))
+    data = candidates[0]
+
+    lat = next((name for name in datasets if leaf[name] in LAT_NAMES), None)
+    lon = next((name for name in datasets if leaf[name] in LON_NAMES), None)
+    return {"data": data, "month_axis": 0 if h5[data].shape[0] == 12 else 2, "lat": lat, "lon": lon}
+
+
+def open_h5_rasters(path, grid=None):
+    # Month dicts backed by H5Layer. Coordinates come from lat/lon datasets in the file (1-D axes
+    # or 2-D meshes); without them the dataset must be north-up on the grid of `grid` (densiPV month
+    # dicts, or a function returning them, only called in that case)
+    import h5py
+
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        raise ValueError(f"{path} is missing or empty; no HDF5 solar data to read")
+    try:
+        h5 = h5py.File(path, "r")
+    except OSError as e:
+        raise ValueError(f"{path} is not a readable HDF5 file: {e}") from e
+    try:
+        return H5Rasters(h5_months(h5, path, grid), h5)
+    except Exception:
+        h5.close()
+        raise
+
+
+def h5_months(h5, path, grid):
+    layout = h5_layout(h5)
+    dataset = h5[layout["data"]]
+    fill_value = dataset.attrs.get("_FillValue", dataset.attrs.get("nodata", dataset.fillvalue))
+    shape = tuple(n for axis, n in enumerate(dataset.shape) if axis != layout["month_axis"])
+
+    if layout["lat"] and layout["lon"]:
+        lats = np.asarray(h5[layout["lat"]][...], dtype=float)
+        lons = np.asarray(h5[layout["lon"]][...], dtype=float)
+        if lats.ndim == 1:
+            lons, lats = np.meshgrid(lons, lats)
+        if lats.shape != shape:
+            raise ValueError(f"{path}: latitude/longitude shape {lats.shape} does not match the data {shape}")
+        grid_info = {'lons': lons, 'lats': lats, 'transform': None, 'crs': None, 'flipped': False}
+        flip_rows = False
+    else:
+        grid = grid() if callable(grid) else grid
+        if grid is None or grid[0]['data'].shape != shape:
+            raise ValueError(f"{path}: no latitude/longitude datasets and the data {shape} "
+                             "is not on the PV raster grid")
+        first = grid[0]
+        grid_info = {key: first.get(key) for key in ('lons', 'lats', 'transform', 'crs', 'flipped')}
+        flip_rows = bool(first.get('flipped', False))
+
+    return [dict(grid_info, data=H5Layer(dataset, month, layout["month_axis"], flip_rows, fill_value),
+                 month_name=MONTH_NAMES[month], vmin=np.nan, vmax=np.nan)
+            for month in range(12)]
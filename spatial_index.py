@@ -0,0 +1,215 @@
+# spatial_index.py
+# Point sampling index shared by every raster on the same grid.
+# Regular grids (affine transform known) are located in O(1) by inverting the transform;
+# grids known only by their 2-D lon/lat meshes use a KD-tree (O(log n)).
+# PixelCoordinates stands in for the lon/lat meshes of an affine grid.
+
+import numpy as np
+
+
+MAX_DISTANCE = 0.02  # degrees, points farther than this from the nearest pixel are NaN
+
+
+class PixelCoordinates:
+    # Longitude (axis="lon") or latitude (axis="lat") of the pixel centres of an affine grid, computed
+    # from the transform for the rows or pixels asked for instead of stored as a float64 mesh.
+    # Indexes like the mesh it replaces ([start:stop], [rows, cols], np.asarray for the full grid),
+    # in the orientation of the data (flipped=True: row 0 is the last row of the transform)
+    ndim = 2
+    dtype = np.dtype(np.float64)
+
+    def __init__(self, transform, crs, shape, flipped=False, axis="lon"):
+        self.transform = tuple(transform[:6])
+        self.crs = crs
+        self.shape = tuple(shape)
+        self.flipped = flipped
+        self.axis = axis
+        self._transformer = None
+
+    @classmethod
+    def pair(cls, transform, crs, shape, flipped=False):
+        # (lons, lats) of one grid
+        return cls(transform, crs, shape, flipped, "lon"), cls(transform, crs, shape, flipped, "lat")
+
+    def __getstate__(self):
+        # The pyproj transformer is rebuilt on first use after unpickling (process pool results)
+        return dict(self.__dict__, _transformer=None)
+
+    def transformer(self):
+        if self._transformer is None:
+            from pyproj import Transformer
+            self._transformer = Transformer.from_crs(self.crs, "EPSG:4326", always_xy=True)
+        return self._transformer
+
+    def same_grid(self, other):
+        return (isinstance(other, PixelCoordinates) and self.transform == other.transform and
+                self.crs == other.crs and self.shape == other.shape and self.flipped == other.flipped)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        rows, cols = key if isinstance(key, tuple) else (key, slice(None))
+        if isinstance(rows, slice) or isinstance(cols, slice):
+            # Windows: the outer product of the selected rows and columns
+            r = np.arange(*rows.indices(self.shape[0])) if isinstance(rows, slice) else np.asarray(rows)
+            c = np.arange(*cols.indices(self.shape[1])) if isinstance(cols, slice) else np.asarray(cols)
+            values = self._compute(*np.ix_(np.atleast_1d(r), np.atleast_1d(c)))
+            return values.reshape(np.shape(r) + np.shape(c))
+        return self._compute(*np.broadcast_arrays(np.asarray(rows), np.asarray(cols)))
+
+    def __array__(self, dtype=None, copy=None):
+        values = self[:, :]
+        return values if dtype is None else values.astype(dtype)
+
+    def _compute(self, rows, cols):
+        if self.flipped:
+            rows = (self.shape[0] - 1) - rows
+        a, b, c, d, e, f = self.transform
+        x = c + a * (cols + 0.5) + b * (rows + 0.5)
+        y = f + d * (cols + 0.5) + e * (rows + 0.5)
+        lons, lats = self.transformer().transform(np.atleast_1d(x), np.atleast_1d(y))
+        return np.asarray(lons if self.axis == "lon" else lats, dtype=np.float64).reshape(np.shape(x))
+
+
+class RasterIndex:
+    def __init__(self, lons, lats, transform=None, crs=None, flipped=False, max_distance=MAX_DISTANCE):
+        # lons/lats: 2-D pixel-centre coordinates in EPSG:4326, same orientation as the data.
+        # transform: (a, b, c, d, e, f) affine of the grid in its native crs; flipped=True when
+        # the data rows were flipped upside down (row 0 = southernmost) as in process_monthly_tifs.
+        self.lons = lons
+        self.lats = lats
+        self.shape = lons.shape
+        self.transform = tuple(transform[:6]) if transform is not None else None
+        self.crs = crs
+        self.flipped = flipped
+        self.max_distance = max_distance
+        self._transformer = None
+        self._tree = None
+
+    @classmethod
+    def from_rasters(cls, monthly_rasters, **kwargs):
+        first = monthly_rasters[0]
+        return cls(first['lons'], first['lats'], transform=first.get('transform'),
+                   crs=first.get('crs'), flipped=first.get('flipped', False), **kwargs)
+
+    def matches(self, result):
+        lons = result['lons']
+        if lons is self.lons:
+            return True
+        if isinstance(lons, PixelCoordinates) or isinstance(self.lons, PixelCoordinates):
+            return isinstance(lons, PixelCoordinates) and lons.same_grid(self.lons)
+        return lons.shape == self.shape and np.array_equal(lons, self.lons)
+
+    # ----------------------------------------------------------------- location
+    def _fractional_affine(self, lats, lons):
+        if self._transformer is None:
+            from pyproj import Transformer
+            self._transformer = Transformer.from_crs("EPSG:4326", self.crs, always_xy=True)
+        x, y = self._transformer.transform(lons, lats)
+        # Inverse of the full affine, so rotated/sheared grids (b, d != 0) are located too
+        a, b, c, d, e, f = self.transform
+        dx = np.asarray(x) - c
+        dy = np.asarray(y) - f
+        det = a * e - b * d
+        cols = (e * dx - b * dy) / det - 0.5
+        rows = (a * dy - d * dx) / det - 0.5
+        if self.flipped:
+            rows = (self.shape[0] - 1) - rows
+        return rows, cols
+
+    def _fractional_tree(self, lats, lons):
+        if self._tree is None:
+            from scipy.spatial import cKDTree
+            self._tree = cKDTree(np.column_stack([np.ravel(self.lons), np.ravel(self.lats)]))
+        _, flat = self._tree.query(np.column_stack([lons, lats]))
+        rows, cols = np.unravel_index(flat, self.shape)
+
+        # Sub-pixel offset from the local Jacobian of the lon/lat grid around the nearest pixel
+        height, width = self.shape
+        r0, r1 = np.clip(rows - 1, 0, height - 1), np.clip(rows + 1, 0, height - 1)
+        c0, c1 = np.clip(cols - 1, 0, width - 1), np.clip(cols + 1, 0, width - 1)
+        dr = np.maximum(r1 - r0, 1)
+        dc = np.maximum(c1 - c0, 1)
+        j00 = (self.lons[rows, c1] - self.lons[rows, c0]) / dc
+        j10 = (self.lats[rows, c1] - self.lats[rows, c0]) / dc
+        j01 = (self.lons[r1, cols] - self.lons[r0, cols]) / dr
+        j11 = (self.lats[r1, cols] - self.lats[r0, cols]) / dr
+        det = j00 * j11 - j01 * j10
+        d_lon = lons - self.lons[rows, cols]
+        d_lat = lats - self.lats[rows, cols]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            off_c = np.where(det != 0, (j11 * d_lon - j01 * d_lat) / det, 0.0)
+            off_r = np.where(det != 0, (j00 * d_lat - j10 * d_lon) / det, 0.0)
+        return rows + np.clip(off_r, -0.499, 0.499), cols + np.clip(off_c, -0.499, 0.499)
+
+    def locate(self, lats, lons):
+        # Fractional (row, col) of each point in data index space
+        lats = np.atleast_1d(np.asarray(lats, dtype=float))
+        lons = np.atleast_1d(np.asarray(lons, dtype=float))
+        if self.transform is not None and self.crs is not None:
+            return self._fractional_affine(lats, lons)
+        return self._fractional_tree(lats, lons)
+
+    def nearest(self, lats, lons):
+        # Nearest pixel (row, col) of each point and its distance in degrees (NaN for NaN coordinates)
+        lats = np.atleast_1d(np.asarray(lats, dtype=float))
+        lons = np.atleast_1d(np.asarray(lons, dtype=float))
+        return self._nearest_from_fractional(*self._locate_finite(lats, lons), lats, lons)
+
+    def _locate_finite(self, lats, lons):
+        # locate() with non-finite coordinates replaced by a placeholder (the KD-tree rejects NaN); their
+        # distance is still computed from the original coordinates, so it stays NaN and they count as far
+        valid = np.isfinite(lats) & np.isfinite(lons)
+        if valid.all():
+            return self.locate(lats, lons)
+        return self.locate(np.where(valid, lats, 0.0), np.where(valid, lons, 0.0))
+
+    def _nearest_from_fractional(self, rows_f, cols_f, lats, lons):
+        rows = np.clip(np.floor(np.nan_to_num(rows_f) + 0.5).astype(np.intp), 0, self.shape[0] - 1)
+        cols = np.clip(np.floor(np.nan_to_num(cols_f) + 0.5).astype(np.intp), 0, self.shape[1] - 1)
+        distance = np.sqrt((self.lons[rows, cols] - lons)**2 + (self.lats[rows, cols] - lats)**2)
+        return rows, cols, distance
+
+    # ----------------------------------------------------------------- sampling
+    def sample(self, layers, lats, lons, method="nearest"):
+        # layers: list of 2-D arrays (or a 3-D stack) on this grid -> (n_points, n_layers)
+        lats = np.atleast_1d(np.asarray(lats, dtype=float))
+        lons = np.atleast_1d(np.asarray(lons, dtype=float))
+        dtype = np.result_type(*[layer.dtype for layer in layers]) if len(layers) else float
+        values = np.full((lats.size, len(layers)), np.nan, dtype=dtype)
+
+        rows_f, cols_f = self._locate_finite(lats, lons)
+        rows, cols, distance = self._nearest_from_fractional(rows_f, cols_f, lats, lons)
+        far = ~np.isfinite(distance) | (distance > self.max_distance)
+        if far.any():
+            print(f"Warning: {far.sum()} point(s) far from the raster (> {self.max_distance}°)")
+
+        if method == "nearest":
+            for i, layer in enumerate(layers):
+                values[:, i] = layer[rows, cols]
+        elif method == "bilinear":
+            rows_f = np.clip(rows_f, 0, self.shape[0] - 1)
+            cols_f = np.clip(cols_f, 0, self.shape[1] - 1)
+            r0 = np.minimum(np.floor(rows_f).astype(np.intp), self.shape[0] - 2)
+            c0 = np.minimum(np.floor(cols_f).astype(np.intp), self.shape[1] - 2)
+            wr = rows_f - r0
+            wc = cols_f - c0
+            corners = [(r0, c0, (1 - wr) * (1 - wc)), (r0, c0 + 1, (1 - wr) * wc),
+                       (r0 + 1, c0, wr * (1 - wc)), (r0 + 1, c0 + 1, wr * wc)]
+            for i, layer in enumerate(layers):
+                total = np.zeros(lats.size)
+                weight = np.zeros(lats.size)
+                for r, c, w in corners:
+                    v = np.asarray(layer[r, c], dtype=float)
+                    ok = ~np.isnan(v)
+                    total[ok] += w[ok] * v[ok]
+                    weight[ok] += w[ok]
+                # NaN neighbours (outside the mask) are dropped and the weights renormalised
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    values[:, i] = np.where(weight > 0, total / weight, np.nan)
+        else:
+            raise ValueError(f"Unknown sampling method: {method}")
+
+        values[far] = np.nan
+        return values
@@ -0,0 +1,33 @@
+import os
+import pytest
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(autouse=True)
+def repo_cwd(monkeypatch):
+    # The modules resolve ./input and ./output relative to the working directory
+    monkeypatch.chdir(REPO_ROOT)
+
+
+@pytest.fixture(scope="session", autouse=True)
+def isolated_pv_cube(tmp_path_factory):
+    # Built once per run from ./input (session-wide, so module fixtures see it too): no test reuses
+    # or rewrites the repository's own cube
+    import raster_cache
+
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(raster_cache, "CACHE_DIR", str(tmp_path_factory.mktemp("pv_cube") / "pv_cube"))
+        yield
+
+
+@pytest.fixture(autouse=True)
+def isolated_caches(tmp_path, monkeypatch):
+    # Result cache and aggregate store per test, outside ./output/cache
+    import aggregate_store
+    import result_cache
+
+    monkeypatch.setattr(result_cache, "CACHE_DIR", str(tmp_path / "cache" / "results"))
+    monkeypatch.setattr(result_cache, "_default_cache", None)
+    monkeypatch.setattr(aggregate_store, "AGGREGATE_DIR", str(tmp_path / "cache" / "aggregates"))
@@ -0,0 +1,64 @@
+# Local stand-in for the CDS API: writes small ERA5-like NetCDF files from the request
+import numpy as np
+import requests
+import xarray as xr
+
+import era5_download
+
+
+SHORT_NAMES = {
+    "100m_u_component_of_wind": "u100",
+    "100m_v_component_of_wind": "v100",
+    "surface_solar_radiation_downwards": "ssrd",
+}
+
+
+def write_era5_file(path, request, truncate=False, seed=0):
+    times = era5_download.expected_times(request)
+    if truncate:
+        times = times[: len(times) // 2]
+    north, west, south, east = request["area"]
+    lats = np.arange(north, south - 1e-9, -0.25)
+    lons = np.arange(west, east + 1e-9, 0.25)
+    variables = request["variable"] if isinstance(request["variable"], list) else [request["variable"]]
+
+    rng = np.random.default_rng(seed)
+    shape = (len(times), lats.size, lons.size)
+    ds = xr.Dataset(
+        {SHORT_NAMES[v]: (("valid_time", "latitude", "longitude"), rng.gamma(4.0, 1.5, shape).astype("float32"))
+         for v in variables},
+        coords={"valid_time": times, "latitude": lats, "longitude": lons},
+    )
+    with era5_download.NETCDF_LOCK:
+        ds.to_netcdf(path)
+
+
+class StubClient:
+    # script: list of actions per call ("ok", "fail", "unauthorized", "truncate"); the last action repeats
+    def __init__(self, script=("ok",)):
+        self.script = list(script)
+        self.calls = []
+
+    def retrieve(self, dataset, request, target):
+        action = self.script[min(len(self.calls), len(self.script) - 1)]
+        self.calls.append((dataset, request["year"], target))
+        if action == "fail":
+            raise RuntimeError("stub: service unavailable")
+        if action == "unauthorized":
+            response = requests.Response()
+            response.status_code = 401
+            raise requests.HTTPError("401 Client Error: Unauthorized (stub)", response=response)
+        write_era5_file(target, request, truncate=(action == "truncate"), seed=int(request["year"]))
+
+
+def small_request(year="2001", variable="surface_solar_radiation_downwards", area=(-3.5, -38.75, -3.75, -38.5)):
+    return {
+        "product_type": "reanalysis",
+        "variable": variable,
+        "year": year,
+        "month": ["01"],
+        "day": ["01", "02"],
+        "time": [f"{h:02d}:00" for h in range(24)],
+        "area": list(area),
+        "format": "netcdf",
+    }
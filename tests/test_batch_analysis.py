@@ -0,0 +1,132 @@
+import json
+from functools import partial
+
+import numpy as np
+import pandas as pd
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+
+import batch_analysis
+import era5_store
+from batch_analysis import load_sites, run_batch_analysis
+from era5_download import era5_request
+from era5_stub import write_era5_file
+from solar_analysis import get_solar_tables
+from wind_analysis import read_capacity_factors, wind_statistics_from_store, DEFAULT_CAPACITY_FACTOR
+
+
+NODATA = -9999.0
+WIND = ["100m_u_component_of_wind", "100m_v_component_of_wind"]
+
+
+def test_csv_column_aliases(tmp_path):
+    path = tmp_path / "sites.csv"
+    path.write_text("Name,Latitude,LNG\nA,-3.7300001,-38.52\nB,-5.0,-40.0\n")
+    sites = load_sites(str(path))
+    assert list(sites.columns) == ["site_id", "lat", "lon"]
+    assert sites["site_id"].tolist() == ["A", "B"]
+    assert sites["lat"].tolist() == [-3.73, -5.0]
+    assert sites["lon"].tolist() == [-38.52, -40.0]
+
+    # y/x aliases, no id column: the row number is the id
+    path.write_text("y,x\n-4.0,-39.0\n")
+    assert load_sites(str(path)).values.tolist() == [["0", -4.0, -39.0]]
+
+    path.write_text("a,b\n1,2\n")
+    with pytest.raises(ValueError):
+        load_sites(str(path))
+
+
+def test_sites_without_valid_coordinates_are_skipped(tmp_path, capsys):
+    path = tmp_path / "sites.csv"
+    path.write_text("lat,lon\n-3.7,-38.5\n,-38.6\nabc,-38.7\n-3.9,inf\n-4.0,-39.0\n")
+    sites = load_sites(str(path))
+    assert sites.values.tolist() == [["0", -3.7, -38.5], ["4", -4.0, -39.0]]
+    assert "skipping 3 site(s) without valid coordinates: 1, 2, 3" in capsys.readouterr().out
+
+    path.write_text("lat,lon\n,\n")
+    with pytest.raises(ValueError, match="no site with valid"):
+        load_sites(str(path))
+
+
+def test_geojson_with_and_without_crs(tmp_path):
+    import geopandas as gpd
+    from shapely.geometry import Point
+
+    # No crs member: GeoJSON coordinates are WGS84
+    plain = tmp_path / "plain.geojson"
+    plain.write_text(json.dumps({"type": "FeatureCollection", "features": [
+        {"type": "Feature", "properties": {"id": 7}, "geometry": {"type": "Point", "coordinates": [-38.52, -3.73]}}]}))
+    sites = load_sites(str(plain))
+    assert sites.values.tolist() == [["7", -3.73, -38.52]]
+
+    # Projected points are converted to lat/lon
+    utm = gpd.GeoDataFrame({"site_id": ["p"]}, geometry=[Point(-38.52, -3.73)], crs="EPSG:4326").to_crs("EPSG:31984")
+    projected = tmp_path / "projected.geojson"
+    utm.to_file(projected, driver="GeoJSON")
+    sites = load_sites(str(projected))
+    assert sites["site_id"].tolist() == ["p"]
+    np.testing.assert_allclose(sites[["lat", "lon"]].values, [[-3.73, -38.52]], atol=1e-6)
+
+
+def test_batch_capacity_factors_sample_the_raster(tmp_path):
+    # 0.1° grid over -3.0..-4.0, -39.0..-38.0; one nodata pixel
+    band = np.random.default_rng(2).uniform(0.2, 0.6, (10, 10)).astype("float32")
+    band[4, 6] = NODATA
+    path = str(tmp_path / "cf.tif")
+    with rasterio.open(path, "w", driver="GTiff", height=10, width=10, count=1, dtype="float32",
+                       crs="EPSG:4326", transform=from_origin(-39.0, -3.0, 0.1, 0.1), nodata=NODATA) as dst:
+        dst.write(band, 1)
+
+    sites = tmp_path / "sites.csv"
+    sites.write_text("id,lat,lon\na,-3.05,-38.95\nb,-3.92,-38.13\nc,-3.45,-38.35\nd,-6.0,-38.5\n")
+    sites = load_sites(str(sites))
+    values = read_capacity_factors(sites["lat"].values, sites["lon"].values, path)
+    np.testing.assert_allclose(values, [band[0, 0], band[9, 8], DEFAULT_CAPACITY_FACTOR, DEFAULT_CAPACITY_FACTOR],
+                               rtol=1e-6)
+
+
+def test_batch_run_writes_the_site_tables(tmp_path, monkeypatch):
+    # 12 monthly rasters, a capacity-factor raster and a regional wind store over the same 0.1° area
+    rng = np.random.default_rng(4)
+    lons, lats = np.meshgrid(-38.8 + 0.1 * (np.arange(5) + 0.5), (-3.4 - 0.1 * (np.arange(5) + 0.5))[::-1])
+    rasters = [{'data': rng.uniform(4.0, 7.0, (5, 5)).astype(np.float32), 'lats': lats, 'lons': lons,
+                'month_name': name, 'transform': (0.1, 0.0, -38.8, 0.0, -0.1, -3.4), 'crs': "EPSG:4326",
+                'flipped': True} for name in batch_analysis.MONTH_NAMES]
+    band = rng.uniform(0.2, 0.6, (5, 5)).astype("float32")
+    cf_path = str(tmp_path / "cf.tif")
+    with rasterio.open(cf_path, "w", driver="GTiff", height=5, width=5, count=1, dtype="float32",
+                       crs="EPSG:4326", transform=from_origin(-38.8, -3.4, 0.1, 0.1), nodata=NODATA) as dst:
+        dst.write(band, 1)
+    files = []
+    for year in ["2003", "2004"]:
+        files.append(str(tmp_path / f"wind100m_{year}.nc"))
+        write_era5_file(files[-1], era5_request(WIND, year, [-3.5, -38.75, -3.75, -38.5]), seed=int(year))
+    store = era5_store.build_regional_store("wind", files, region_dir=str(tmp_path))
+
+    monkeypatch.setattr(batch_analysis, "load_monthly_rasters", lambda source: rasters)
+    monkeypatch.setattr(batch_analysis, "read_capacity_factors", partial(read_capacity_factors, geotiff_file=cf_path))
+    monkeypatch.setattr(batch_analysis, "ensure_regional_store", lambda product, API_KEY: store)
+    sites_path = tmp_path / "sites.csv"
+    sites_path.write_text("id,lat,lon\na,-3.55,-38.65\nbad,,-38.6\nb,-3.72,-38.52\n")
+    output_dir = tmp_path / "batch"
+    run_batch_analysis(str(sites_path), "", output_dir=str(output_dir), regional=True, use_cache=False)
+
+    solar = pd.read_csv(output_dir / "solar_monthly_average_pv_density.csv", dtype={"site_id": str})
+    cf = pd.read_csv(output_dir / "wind_capacity_factor.csv", dtype={"site_id": str})
+    assert solar["site_id"].tolist() == ["a"] * 12 + ["b"] * 12
+    assert cf["site_id"].tolist() == ["a", "b"]
+    np.testing.assert_allclose(cf["capacity_factor"], [band[1, 1], band[3, 2]], rtol=1e-6)
+
+    for i, (site_id, lat, lon) in enumerate([("a", -3.55, -38.65), ("b", -3.72, -38.52)]):
+        expected = get_solar_tables(lat, lon, rasters, cache=False)['df_mean']
+        rows = solar[solar["site_id"] == site_id]
+        assert rows["month"].tolist() == batch_analysis.MONTH_NAMES
+        np.testing.assert_allclose(rows.iloc[:, 4:].values, expected.values, atol=1e-6)
+
+        stats = wind_statistics_from_store(store, lat, lon, cf["capacity_factor"][i])
+        for key in ["mean", "std", "cv", "energy_density"]:
+            table = pd.read_csv(output_dir / f"wind_{key}.csv", dtype={"site_id": str})
+            rows = table[table["site_id"] == site_id]
+            np.testing.assert_allclose(rows.iloc[:, 4:].values, stats[key].values, rtol=1e-6)
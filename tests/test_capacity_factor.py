@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+
+from wind_analysis import read_capacity_factors, read_capacity_factor, sample_raster_points, DEFAULT_CAPACITY_FACTOR
+
+
+NODATA = -9999.0
+
+
+@pytest.fixture
+def cf_raster(tmp_path):
+    # 40 x 60 EPSG:4326 grid of 0.05° over part of Ceará, tiled so windowed reads touch single blocks
+    rng = np.random.default_rng(3)
+    band = rng.uniform(0.2, 0.6, (40, 60)).astype("float32")
+    band[5, 7] = NODATA
+    band[6, 8] = np.nan
+    path = str(tmp_path / "cf.tif")
+    transform = from_origin(-40.0, -3.0, 0.05, 0.05)
+    with rasterio.open(path, "w", driver="GTiff", height=40, width=60, count=1, dtype="float32",
+                       crs="EPSG:4326", transform=transform, nodata=NODATA, tiled=True,
+                       blockxsize=16, blockysize=16) as dst:
+        dst.write(band, 1)
+    return path, band, transform
+
+
+def pixel_centre(transform, row, col):
+    lon, lat = transform @ (col + 0.5, row + 0.5)
+    return lat, lon
+
+
+def test_capacity_factors_match_full_band_lookup(cf_raster):
+    path, band, transform = cf_raster
+    rng = np.random.default_rng(4)
+    rows = rng.integers(0, 40, 500)
+    cols = rng.integers(0, 60, 500)
+    lats, lons = pixel_centre(transform, rows, cols)
+
+    expected = band[rows, cols].astype(float)
+    expected[(expected == NODATA) | np.isnan(expected)] = DEFAULT_CAPACITY_FACTOR
+    np.testing.assert_array_equal(read_capacity_factors(lats, lons, path), expected)
+
+
+def test_out_of_bounds_and_nodata_fall_back(cf_raster):
+    path, band, transform = cf_raster
+    lats, lons = zip(pixel_centre(transform, 5, 7), pixel_centre(transform, 6, 8), (-10.0, -45.0),
+                     pixel_centre(transform, 0, 0))
+    values = read_capacity_factors(lats, lons, path)
+    np.testing.assert_array_equal(values[:3], DEFAULT_CAPACITY_FACTOR)
+    assert values[3] == pytest.approx(band[0, 0])
+
+    assert read_capacity_factor(-10.0, -45.0, path) == DEFAULT_CAPACITY_FACTOR
+    assert read_capacity_factors([-3.5], [-39.0], str(cf_raster[0]) + ".missing")[0] == DEFAULT_CAPACITY_FACTOR
+
+
+def test_reads_only_the_pixels_requested(cf_raster):
+    path, band, transform = cf_raster
+
+    class Recorder:
+        # Proxies a dataset and records the windows requested
+        def __init__(self, src):
+            self.src = src
+            self.windows = []
+
+        def __getattr__(self, name):
+            return getattr(self.src, name)
+
+        def read(self, *args, window=None, **kwargs):
+            self.windows.append(window)
+            return self.src.read(*args, window=window, **kwargs)
+
+    lat, lon = pixel_centre(transform, 12, 30)
+    with rasterio.open(path) as src:
+        recorder = Recorder(src)
+        values = sample_raster_points(recorder, np.array([lat, lat, lat]), np.array([lon, lon, lon]))
+
+    assert len(recorder.windows) == 1
+    assert (recorder.windows[0].height, recorder.windows[0].width) == (1, 1)
+    np.testing.assert_allclose(values, band[12, 30])
@@ -0,0 +1,156 @@
+import os
+import json
+import socket
+
+import pytest
+import requests
+
+import era5_download
+from era5_download import download_era5, validate_netcdf, MANIFEST_NAME
+from era5_stub import StubClient, small_request
+
+
+def run(tmp_path, client, years=("2001",), retries=3):
+    jobs = [(str(tmp_path / f"ssrd_{y}.nc"), small_request(y)) for y in years]
+    results = download_era5(jobs, ["ssrd"], lambda: client, str(tmp_path / MANIFEST_NAME),
+                            max_workers=2, retries=retries, backoff=0)
+    return jobs, results
+
+
+def test_truncated_file_is_rejected_then_valid_one_accepted(tmp_path):
+    client = StubClient(["truncate", "ok"])
+    jobs, results = run(tmp_path, client)
+    target, request = jobs[0]
+
+    assert results[target] is None
+    assert len(client.calls) == 2
+    validate_netcdf(target, ["ssrd"], request)
+    assert [p for p in os.listdir(tmp_path) if p.endswith(".part")] == []
+    manifest = json.load(open(tmp_path / MANIFEST_NAME))
+    assert manifest["ssrd_2001.nc"]["sha256"] == era5_download.file_sha256(target)
+
+
+def test_retries_until_success(tmp_path):
+    client = StubClient(["fail", "fail", "fail", "ok"])
+    jobs, results = run(tmp_path, client, retries=3)
+    assert results[jobs[0][0]] is None
+    assert len(client.calls) == 4
+
+
+def test_gives_up_after_retries(tmp_path):
+    client = StubClient(["fail"])
+    jobs, results = run(tmp_path, client, retries=2)
+    assert isinstance(results[jobs[0][0]], era5_download.DownloadError)
+    assert len(client.calls) == 3
+    assert not os.path.exists(jobs[0][0])
+
+
+def test_permanent_error_fails_at_once_and_cancels_queued_years(tmp_path):
+    client = StubClient(["unauthorized"])
+    jobs, results = run(tmp_path, client, years=[str(y) for y in range(2001, 2009)], retries=3)
+
+    assert all(isinstance(results[target], era5_download.DownloadError) for target, _ in jobs)
+    attempted = [year for _, year, _ in client.calls]
+    assert len(attempted) == len(set(attempted)) <= 2  # no retries, and nothing started after the failure
+    assert sum("cancelled" in str(error) for error in results.values()) == len(jobs) - len(attempted)
+
+
+def test_missing_key_fails_without_retrying(tmp_path):
+    factory_calls = []
+
+    def factory():
+        factory_calls.append(1)
+        raise Exception("Missing/incomplete configuration file: .cdsapirc")
+
+    jobs = [(str(tmp_path / f"ssrd_{y}.nc"), small_request(y)) for y in ("2001", "2002", "2003", "2004")]
+    results = download_era5(jobs, ["ssrd"], factory, str(tmp_path / MANIFEST_NAME), max_workers=1, backoff=0)
+    assert all(isinstance(error, era5_download.PermanentDownloadError) or "cancelled" in str(error)
+               for error in results.values())
+    assert len(factory_calls) == 1
+
+
+def http_error(status):
+    response = requests.Response()
+    response.status_code = status
+    return requests.HTTPError(f"{status} error", response=response)
+
+
+def chained(error, cause):
+    error.__cause__ = cause
+    return error
+
+
+@pytest.mark.parametrize("error, permanent", [
+    (http_error(401), True),
+    (http_error(404), True),
+    (chained(requests.ConnectionError("resolve"), socket.gaierror(socket.EAI_NONAME, "unknown host")), True),
+    (http_error(429), False),
+    (http_error(503), False),
+    (requests.Timeout("read timed out"), False),
+    (chained(requests.ConnectionError("reset"), ConnectionResetError()), False),
+    (RuntimeError("service unavailable"), False),
+])
+def test_permanent_and_transient_errors(error, permanent):
+    assert era5_download.is_permanent(error) is permanent
+
+
+def test_resumes_from_manifest(tmp_path):
+    run(tmp_path, StubClient(), years=("2001", "2002"))
+    os.remove(tmp_path / "ssrd_2002.nc")
+
+    client = StubClient()
+    jobs, results = run(tmp_path, client, years=("2001", "2002"))
+    assert all(error is None for error in results.values())
+    assert [year for _, year, _ in client.calls] == ["2002"]
+
+
+def test_invalid_file_from_before_manifest_is_deleted(tmp_path):
+    target = tmp_path / "ssrd_2001.nc"
+    target.write_bytes(b"half a download")
+
+    jobs, results = run(tmp_path, StubClient(["fail"]), retries=0)
+    assert isinstance(results[str(target)], era5_download.DownloadError)
+    assert not target.exists()
+
+
+def test_unreachable_endpoint_fails_within_the_retry_budget(tmp_path, monkeypatch):
+    # The real CDS client against a closed local port: each attempt must fail at once (no internal
+    # cdsapi retries), so the file gives up after RETRIES retries of fetch_file
+    monkeypatch.setattr(era5_download, "CDS_URL", "http://127.0.0.1:9/api")
+    client = era5_download.cds_client_factory("00000000-0000-0000-0000-000000000000")()
+    calls = []
+    retrieve = client.retrieve
+    client.retrieve = lambda *args: calls.append(args) or retrieve(*args)
+
+    target = str(tmp_path / "ssrd_2001.nc")
+    with pytest.raises(era5_download.DownloadError, match="failed after"):
+        era5_download.fetch_file(client, target, small_request("2001"), ["ssrd"], backoff=0)
+    assert len(calls) == era5_download.RETRIES + 1
+    assert not os.path.exists(target)
+
+
+def test_manifests_sharing_a_file_keep_each_others_entries(tmp_path):
+    # Two managers opened on the same manifest (solar and wind processes) must not erase each other
+    jobs, _ = run(tmp_path, StubClient(), years=("2001", "2002"))
+    path = str(tmp_path / MANIFEST_NAME)
+    os.remove(path)
+    first = era5_download.DownloadManifest(path)
+    second = era5_download.DownloadManifest(path)
+    for manifest, (target, request) in zip((first, second), jobs):
+        manifest.record(target, request, era5_download.file_sha256(target))
+
+    assert sorted(json.load(open(path))) == ["ssrd_2001.nc", "ssrd_2002.nc"]
+
+
+def test_manifest_lock_without_fcntl(tmp_path, monkeypatch):
+    # Windows has no fcntl: the lock file is locked and unlocked through msvcrt.locking
+    calls = []
+    msvcrt = type("msvcrt", (), {"LK_LOCK": 1, "LK_UNLCK": 0,
+                                 "locking": staticmethod(lambda fd, mode, size: calls.append(mode))})
+    monkeypatch.setattr(era5_download, "fcntl", None)
+    monkeypatch.setattr(era5_download, "msvcrt", msvcrt)
+
+    jobs, results = run(tmp_path, StubClient())
+    assert results[jobs[0][0]] is None
+    assert calls == [1, 0]
+    assert list(json.load(open(tmp_path / MANIFEST_NAME))) == ["ssrd_2001.nc"]
@@ -0,0 +1,40 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+
+HEAVY = ["matplotlib", "seaborn", "plotly", "mpl_toolkits", "geopandas", "rasterio", "xarray", "pyproj",
+         "cdsapi", "netCDF4", "h5py", "dask"]
+IMPORT_BUDGET = 1.0  # seconds for the launcher and both analysis modules in a fresh interpreter
+
+
+def fresh_import(statement):
+    # Imports in a new interpreter started in the repo root (see conftest); returns the seconds spent and the heavy modules left in sys.modules
+    code = ("import json, sys, time\n"
+            "start = time.perf_counter()\n"
+            f"{statement}\n"
+            "seconds = time.perf_counter() - start\n"
+            f"print(json.dumps([seconds, [m for m in {HEAVY!r} if m in sys.modules]]))")
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.splitlines()[-1])
+
+
+@pytest.mark.parametrize("statement", [
+    "import main",
+    "import solar_analysis",
+    "import wind_analysis",
+    "import batch_analysis",
+    "import server",
+    "import wind_grid",
+])
+def test_import_loads_no_heavy_dependency(statement):
+    _, loaded = fresh_import(statement)
+    assert loaded == []
+
+
+def test_import_time_budget():
+    # Best of three, so one slow start on a busy machine does not fail the suite
+    seconds = min(fresh_import("import main, solar_analysis, wind_analysis")[0] for _ in range(3))
+    assert seconds < IMPORT_BUDGET, f"cold import took {seconds:.2f} s (budget {IMPORT_BUDGET} s)"
@@ -0,0 +1,90 @@
+import os
+
+import pandas as pd
+import pytest
+
+import parallel
+from era5_download import era5_request
+from era5_stub import write_era5_file
+from parallel import configure, pool_size, run_tasks
+from profiling import stage, start_profiling, stop_profiling
+from solar_analysis import load_ceara_shape, process_monthly_tifs
+from wind_analysis import compute_wind_statistics
+
+
+WIND = ["100m_u_component_of_wind", "100m_v_component_of_wind"]
+AREA = [-3.5, -38.75, -3.75, -38.5]
+
+
+@pytest.fixture(autouse=True)
+def serial_afterwards():
+    yield
+    configure(1, None)
+
+
+def square_and_pid(x):
+    if x < 0:
+        raise ValueError(f"negative task {x}")
+    return x * x, os.getpid()
+
+
+def staged_square(x):
+    with stage("square", x=x):
+        return x * x
+
+
+def test_pool_size_respects_jobs_tasks_and_memory_budget():
+    configure(8, memory_budget_mb=450)
+    assert pool_size(12, "month") == 2  # 450 MB / 200 MB per month task
+    assert pool_size(12, "year") == 3
+    assert pool_size(1, "year") == 1
+    assert pool_size(12, "figure") == 1
+    configure(2, memory_budget_mb=10_000)
+    assert pool_size(12, "month") == 2
+
+
+def test_pool_results_come_back_in_task_order():
+    configure(2, memory_budget_mb=10_000)
+    results = run_tasks(square_and_pid, [(x,) for x in range(6)], "year")
+    assert [value for value, _ in results] == [x * x for x in range(6)]
+    assert os.getpid() not in {pid for _, pid in results}
+
+
+def test_first_failing_task_is_raised_with_its_context():
+    configure(2, memory_budget_mb=10_000)
+    with pytest.raises(ValueError, match="negative task -1") as info:
+        run_tasks(square_and_pid, [(1,), (-1,), (2,), (-2,)], "year")
+    assert any("year task 2/4" in note for note in info.value.__notes__)
+
+
+def test_worker_stages_reach_the_parent_profile(tmp_path):
+    configure(2, memory_budget_mb=10_000)
+    start_profiling(str(tmp_path / "profile.jsonl"))
+    try:
+        assert run_tasks(staged_square, [(x,) for x in range(4)], "year") == [0, 1, 4, 9]
+    finally:
+        profiler = parallel.active_profiler()
+        stop_profiling()
+    squares = [r for r in profiler.records if r["name"] == "square"]
+    assert sorted(r["args"]["x"] for r in squares) == [0, 1, 2, 3]
+    assert os.getpid() not in {r["pid"] for r in squares}
+
+
+def test_missing_month_raises_instead_of_being_skipped(tmp_path):
+    with pytest.raises(FileNotFoundError, match="ceara_densiPV_01.tif"):
+        process_monthly_tifs(1, load_ceara_shape(), str(tmp_path))
+
+
+def test_parallel_years_match_the_serial_statistics(tmp_path, monkeypatch):
+    files = []
+    for year in ["2003", "2004", "2005"]:
+        path = str(tmp_path / f"wind100m_{year}.nc")
+        write_era5_file(path, era5_request(WIND, year, AREA), seed=int(year))
+        files.append(path)
+    serial = compute_wind_statistics(files, -3.6, -38.6, 0.45)
+
+    monkeypatch.setattr(parallel, "POOL_MIN_BYTES", 0)
+    configure(2, memory_budget_mb=10_000)
+    pooled = compute_wind_statistics(files, -3.6, -38.6, 0.45)
+    for key in ["mean", "std", "cv", "energy_density"]:
+        pd.testing.assert_frame_equal(pooled[key], serial[key], check_exact=True)
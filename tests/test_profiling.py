@@ -0,0 +1,73 @@
+import json
+import sys
+import threading
+
+import numpy as np
+import pytest
+
+import profiling
+from profiling import stage, start_profiling, stop_profiling
+from solar_analysis import calculate_monthly_hourly_profiles
+
+
+@pytest.fixture(autouse=True)
+def no_profile_left():
+    yield
+    profiling._profiler = None
+
+
+def test_stage_is_a_shared_no_op_when_not_profiling():
+    assert stop_profiling() is None
+    assert stage("raster masking", month=1) is stage("fourier fit")
+    with stage("raster masking"):
+        pass
+    assert profiling._profiler is None
+
+
+def test_nested_stages_written_as_json_lines(tmp_path):
+    data = tmp_path / "input.bin"
+    data.write_bytes(b"\0" * 200_000)
+    start_profiling(str(tmp_path / "profile.jsonl"))
+    with stage("outer", site=1):
+        with stage("inner"):
+            data.read_bytes()
+    path = stop_profiling()
+
+    with open(path) as f:
+        records = {r["name"]: r for r in map(json.loads, f)}
+    outer, inner = records["outer"], records["inner"]
+    assert (outer["depth"], inner["depth"]) == (0, 1)
+    assert outer["args"] == {"site": 1} and "args" not in inner
+    assert outer["wall_s"] >= inner["wall_s"] >= 0 and outer["cpu_s"] >= 0
+    assert outer["start_s"] <= inner["start_s"]
+    if sys.platform.startswith("linux"):
+        assert inner["bytes_read"] >= 200_000
+        assert outer["peak_rss_mb"] > 0
+
+
+def test_chrome_trace_covers_profile_stages_and_threads(tmp_path):
+    start_profiling(str(tmp_path / "trace.json"))
+    lats = np.full(20, -5.0)
+    lons = np.full(20, -39.5)
+    calculate_monthly_hourly_profiles(lats, lons, np.full((20, 12), 150.0), chunk_size=8)
+
+    def worker():
+        with stage("ERA5 request", file="ssrd_2001.nc"):
+            pass
+    thread = threading.Thread(target=worker, name="download")
+    thread.start()
+    thread.join()
+    with pytest.raises(RuntimeError), stage("aggregation"):
+        raise RuntimeError("failed stage")
+    path = stop_profiling()
+
+    with open(path) as f:
+        events = json.load(f)["traceEvents"]
+    spans = [e for e in events if e["ph"] == "X"]
+    names = [e["name"] for e in spans]
+    assert names.count("fourier fit") == 3 and names.count("hourly synthesis") == 3
+    request = next(e for e in spans if e["name"] == "ERA5 request")
+    assert request["tid"] == thread.ident and request["args"]["file"] == "ssrd_2001.nc"
+    assert next(e for e in spans if e["name"] == "aggregation")["args"]["error"] == "RuntimeError"
+    assert {"name": "download"} in [e["args"] for e in events if e["ph"] == "M"]
+    assert all(e["dur"] >= 0 for e in spans)
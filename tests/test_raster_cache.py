@@ -0,0 +1,49 @@
+import os
+import numpy as np
+
+import raster_cache
+
+
+def test_cache_is_built_reused_and_invalidated(tmp_path):
+    cache_dir = str(tmp_path / "pv_cube")
+    first = raster_cache.load_pv_cube(cache_dir=cache_dir)
+    assert len(first) == 12
+    assert first[0]['data'].dtype == np.float32
+    assert isinstance(first[0]['data'], np.memmap)
+    assert not [p for p in os.listdir(tmp_path) if p.endswith(".tmp")]
+
+    meta_mtime = os.stat(os.path.join(cache_dir, "meta.json")).st_mtime_ns
+    raster_cache.load_pv_cube(cache_dir=cache_dir)
+    assert os.stat(os.path.join(cache_dir, "meta.json")).st_mtime_ns == meta_mtime
+
+    # A changed source invalidates the cache
+    meta = raster_cache.read_cache_meta(cache_dir)
+    meta["sources"][0][2] += 1
+    with open(os.path.join(cache_dir, "meta.json"), "w") as f:
+        import json
+        json.dump(meta, f)
+    rebuilt = raster_cache.load_pv_cube(cache_dir=cache_dir)
+    assert raster_cache.read_cache_meta(cache_dir)["sources"] == raster_cache.source_fingerprint()
+    np.testing.assert_array_equal(np.asarray(rebuilt[3]['data']), np.asarray(first[3]['data']))
+
+
+def test_coordinates_follow_the_transform_without_meshes(tmp_path):
+    import pickle
+    from pyproj import Transformer
+    from spatial_index import PixelCoordinates
+
+    first = raster_cache.load_pv_cube(cache_dir=str(tmp_path / "pv_cube"))[0]
+    lons, lats = first['lons'], first['lats']
+    assert isinstance(lons, PixelCoordinates) and lons.shape == first['data'].shape
+    assert not {"lons.npy", "lats.npy"} & set(os.listdir(tmp_path / "pv_cube"))
+
+    # Same values as the south-up lon/lat meshes the rasters used to carry
+    a, _, c, _, e, f = first['transform']
+    height, width = lons.shape
+    x_mesh, y_mesh = np.meshgrid(c + a * (np.arange(width) + 0.5), (f + e * (np.arange(height) + 0.5))[::-1])
+    mesh_lons, mesh_lats = Transformer.from_crs(first['crs'], "EPSG:4326", always_xy=True).transform(x_mesh, y_mesh)
+    np.testing.assert_allclose(np.asarray(lons), mesh_lons, rtol=0, atol=1e-9)
+    np.testing.assert_allclose(lats[10:20], mesh_lats[10:20], rtol=0, atol=1e-9)
+    rows, cols = np.array([0, 5, height - 1]), np.array([width - 1, 7, 0])
+    np.testing.assert_allclose(lats[rows, cols], mesh_lats[rows, cols], rtol=0, atol=1e-9)
+    assert pickle.loads(pickle.dumps(lons)).same_grid(lons)
@@ -0,0 +1,57 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from rendering import (parse_formats, figure_job, render_jobs, render_heatmap, render_solar_surface,
+                       render_solar_html, hour_table, save_table, MONTH_NAMES)
+
+
+def month_hour_table(seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(rng.random((12, 24)), index=MONTH_NAMES,
+                        columns=pd.RangeIndex(24, name="Hour"))
+
+
+def test_parse_formats():
+    assert parse_formats("pdf,html") == ("pdf", "html")
+    assert parse_formats(" PNG, csv,png ") == ("png", "csv")
+    assert parse_formats("none") == ()
+    with pytest.raises(ValueError):
+        parse_formats("pdf,svg")
+    with pytest.raises(ValueError):
+        parse_formats("")
+
+
+def test_figure_jobs_follow_formats():
+    table = month_hour_table()
+    assert figure_job(render_heatmap, "x", ("csv",), data=table, cbar_label="", fmt=".1f") == []
+    assert figure_job(render_solar_html, "x", ("pdf",), z=table.values) == []
+    [(function, kwargs)] = figure_job(render_solar_surface, "x", ("html", "png", "csv"), z=table.values)
+    assert function is render_solar_surface
+    assert kwargs["formats"] == ["png"]
+
+
+def test_render_jobs_in_process_pool(tmp_path):
+    table = month_hour_table()
+    formats = ("png", "html")
+    jobs = (figure_job(render_heatmap, str(tmp_path / "heatmap"), formats, data=table, cbar_label="kWh/m²",
+                       fmt=".2f")
+            + figure_job(render_solar_surface, str(tmp_path / "surface"), formats, z=table.values)
+            + figure_job(render_solar_html, str(tmp_path / "surface"), formats, z=table.values))
+
+    paths = render_jobs(jobs, max_workers=2)
+
+    assert sorted(os.path.basename(p) for p in paths) == ["heatmap.png", "surface.html", "surface.png"]
+    assert all(os.path.getsize(p) > 0 for p in paths)
+
+
+def test_tables_are_written_without_figures(tmp_path):
+    table = month_hour_table()
+    [path] = save_table(hour_table(table), str(tmp_path / "solar"), ("pdf", "csv"))
+
+    frame = pd.read_csv(path)
+    assert list(frame.columns) == ["month"] + [f"{h:02d}h" for h in range(24)]
+    assert list(frame["month"]) == MONTH_NAMES
+    np.testing.assert_allclose(frame.iloc[:, 1:].values, table.values)
@@ -0,0 +1,68 @@
+import os
+import time
+import pandas as pd
+
+from result_cache import ResultCache, make_key
+
+
+def test_round_trip_and_miss(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    key = make_key("solar", lat=-3.73, lon=-38.52)
+    assert cache.get(key) is None
+
+    table = pd.DataFrame({"a": [1.0, 2.0]})
+    cache.put(key, {"df_mean": table})
+    assert cache.get(key)["df_mean"].equals(table)
+
+
+def test_key_changes_with_inputs():
+    assert make_key("solar", lat=-3.73, lon=-38.52) != make_key("solar", lat=-3.73, lon=-38.53)
+    assert make_key("solar", lat=-3.73, sources=[["a.tif", 1, 2]]) != make_key("solar", lat=-3.73, sources=[["a.tif", 1, 3]])
+
+
+def test_lru_eviction_keeps_recently_used(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    for name in ["a", "b", "c"]:
+        cache.put(name, {"value": "x" * 1000})
+        time.sleep(0.01)
+    cache.get("a")  # refresh a, so b is now the least recently used
+
+    cache.max_bytes = 2 * os.path.getsize(cache.path("a")) + 10
+    cache.evict()
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+
+
+def test_corrupt_entry_is_dropped(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    with open(cache.path("bad"), "wb") as f:
+        f.write(b"not a pickle")
+    assert cache.get("bad") is None
+    assert not os.path.exists(cache.path("bad"))
+
+
+def test_corrupt_entry_removed_by_another_process(tmp_path, monkeypatch):
+    cache = ResultCache(str(tmp_path))
+    cache.put("k", 1)
+
+    def read_pickle(path):
+        os.remove(path)  # a concurrent get() dropped the same entry first
+        raise EOFError("truncated")
+
+    monkeypatch.setattr(pd, "read_pickle", read_pickle)
+    assert cache.get("k") is None
+
+
+def test_hit_evicted_by_another_process_is_still_returned(tmp_path, monkeypatch):
+    cache = ResultCache(str(tmp_path))
+    cache.put("k", {"value": 1})
+    read_pickle = pd.read_pickle
+
+    def read_then_evict(path):
+        value = read_pickle(path)
+        os.remove(path)  # another process's eviction, between the read and the LRU touch
+        return value
+
+    monkeypatch.setattr(pd, "read_pickle", read_then_evict)
+    assert cache.get("k") == {"value": 1}
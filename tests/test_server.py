@@ -0,0 +1,87 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+import era5_store
+from era5_download import era5_request
+from era5_stub import write_era5_file
+from server import AnalysisServer, AnalysisState
+from solar_analysis import get_solar_tables
+from wind_analysis import wind_statistics_from_store, DEFAULT_CAPACITY_FACTOR
+
+
+AREA = [-3.5, -38.75, -3.75, -38.5]
+WIND = ["100m_u_component_of_wind", "100m_v_component_of_wind"]
+
+
+@pytest.fixture(scope="module")
+def server(tmp_path_factory):
+    folder = tmp_path_factory.mktemp("server")
+    files = []
+    for year in ["2010", "2011"]:
+        path = str(folder / f"wind100m_{year}.nc")
+        write_era5_file(path, era5_request(WIND, year, AREA), seed=int(year))
+        files.append(path)
+    store = era5_store.build_regional_store("wind", files, region_dir=str(folder))
+
+    state = AnalysisState(regional=True, use_cache=False)
+    state.monthly_rasters("densiPV")
+    state.stores["wind"] = era5_store.open_store(store)
+
+    httpd = AnalysisServer(("127.0.0.1", 0), state, workers=4)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_port}", store
+    httpd.shutdown()
+    httpd.server_close()
+    state.close()
+
+
+def get(url):
+    try:
+        with urllib.request.urlopen(url, timeout=60) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def test_solar_and_wind_tables(server):
+    base, store = server
+    status, body = get(f"{base}/solar?lat=-3.73&lon=-38.52")
+    assert status == 200
+    expected = get_solar_tables(-3.73, -38.52, cache=False)['df_mean']
+    np.testing.assert_allclose(body["tables"]["df_mean"]["data"], expected.values, atol=1e-8)
+    assert body["tables"]["df_mean"]["index"][0] == "Jan"
+
+    status, body = get(f"{base}/wind?lat=-3.6&lon=-38.6")
+    assert status == 200
+    expected = wind_statistics_from_store(store, -3.6, -38.6, DEFAULT_CAPACITY_FACTOR)
+    assert body["tables"]["capacity_factor"] == DEFAULT_CAPACITY_FACTOR
+    for key in ["mean", "std", "cv", "energy_density"]:
+        np.testing.assert_allclose(body["tables"][key]["data"], expected[key].values, rtol=1e-6)
+
+
+def test_concurrent_requests_and_timings(server):
+    base, _ = server
+    urls = [f"{base}/solar?lat={-3.5 - i * 0.1}&lon=-39.0" for i in range(6)] + [f"{base}/wind?lat=-3.6&lon=-38.6"] * 4
+    with ThreadPoolExecutor(8) as pool:
+        statuses = [status for status, _ in pool.map(get, urls)]
+    assert statuses == [200] * len(urls)
+
+    status, body = get(f"{base}/timings")
+    assert status == 200
+    assert body["endpoints"]["/solar"]["count"] >= 6
+    assert body["endpoints"]["/wind"]["p95_ms"] >= body["endpoints"]["/wind"]["p50_ms"]
+
+
+def test_bad_requests(server):
+    base, _ = server
+    assert get(f"{base}/solar?lat=abc&lon=1")[0] == 400
+    assert get(f"{base}/solar?lat=-3.7&lon=-38.5&sampling=cubic")[0] == 400
+    assert get(f"{base}/solar?lat=-3.7&lon=-38.5&source=nope")[0] == 400
+    assert get(f"{base}/other")[0] == 404
@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+import era5_store
+import solar_analysis
+from era5_download import era5_request
+from era5_stub import write_era5_file
+from aggregate_store import AggregateStore
+from solar_analysis import compute_ssrd_statistics, ssrd_statistics_from_store
+
+
+AREA = [-3.5, -38.75, -3.75, -38.5]
+
+
+@pytest.fixture(scope="module")
+def ssrd_files(tmp_path_factory):
+    folder = tmp_path_factory.mktemp("ssrd")
+    files = []
+    for year in ["2005", "2006", "2007"]:
+        path = str(folder / f"ssrd_{year}.nc")
+        write_era5_file(path, era5_request("surface_solar_radiation_downwards", year, AREA), seed=int(year))
+        with xr.open_dataset(path) as ds:
+            ds = (ds * 3.6e5).load()  # stub values -> a realistic J/m² scale
+        ds.to_netcdf(path)
+        files.append(path)
+    return files
+
+
+def reference_statistics(nc_files, lat, lon):
+    # Whole-series pandas version of the streaming statistics
+    with xr.open_mfdataset(nc_files, combine='by_coords') as ds:
+        series = ds["ssrd"].sel(latitude=lat, longitude=lon, method='nearest').to_series()
+    kwh = series / 3.6e6
+    local = kwh.index - pd.Timedelta(hours=4)  # hour ending at T -> start hour, UTC-3
+    grouped = kwh.groupby([local.month, local.hour])
+    mean = grouped.mean().values.reshape(12, 24)
+    std = grouped.std().values.reshape(12, 24)
+    return mean, std
+
+
+def test_ssrd_statistics_match_whole_series(ssrd_files):
+    mean, std = reference_statistics(ssrd_files, -3.6, -38.6)
+    stats = compute_ssrd_statistics(ssrd_files, -3.6, -38.6)
+    np.testing.assert_allclose(stats['mean'].values, mean, rtol=1e-5)
+    np.testing.assert_allclose(stats['std'].values, std, rtol=1e-4)
+    np.testing.assert_allclose(stats['cv'].values, std / mean * 100, rtol=1e-4)
+
+
+def test_years_are_aggregated_individually(ssrd_files, tmp_path, monkeypatch):
+    path = str(tmp_path / "ssrd.npz")
+    calls = []
+    read_file = solar_analysis.ssrd_file_accumulator
+    monkeypatch.setattr(solar_analysis, "ssrd_file_accumulator",
+                        lambda path, *args, **kwargs: calls.append(path) or read_file(path, *args, **kwargs))
+
+    first = compute_ssrd_statistics(ssrd_files[:2], -3.6, -38.6, aggregates=AggregateStore(path))
+    assert len(calls) == 2
+    again = compute_ssrd_statistics(ssrd_files[:2], -3.6, -38.6, aggregates=AggregateStore(path))
+    assert len(calls) == 2
+    pd.testing.assert_frame_equal(first['mean'], again['mean'])
+
+    # Appending a year only reads the new file
+    full = compute_ssrd_statistics(ssrd_files, -3.6, -38.6, aggregates=AggregateStore(path))
+    assert calls[2:] == [ssrd_files[2]]
+    # Another time zone labels the hours differently, so its years are read again
+    compute_ssrd_statistics(ssrd_files[:1], -3.6, -38.6, timezone=0, aggregates=AggregateStore(path))
+    assert calls[3:] == ssrd_files[:1]
+    np.testing.assert_allclose(full['std'].values,
+                               compute_ssrd_statistics(ssrd_files, -3.6, -38.6)['std'].values, rtol=1e-6)
+
+
+def test_store_statistics_match_yearly_files(ssrd_files, tmp_path, monkeypatch):
+    store = era5_store.build_regional_store("ssrd", ssrd_files, region_dir=str(tmp_path))
+    expected = compute_ssrd_statistics(ssrd_files, -3.6, -38.6)
+    path = str(tmp_path / "ssrd_regional.npz")
+    for _ in range(2):
+        result = ssrd_statistics_from_store(store, -3.6, -38.6, aggregates=AggregateStore(path))
+        for key in expected:
+            np.testing.assert_allclose(result[key].values, expected[key].values, rtol=1e-6)
+        monkeypatch.setattr(solar_analysis, "open_store", None)  # stored years never open the store
+
+    blocks = list(era5_store.iter_point_series(store, -3.6, -38.6, ["ssrd"], block=5000, years=[2006]))
+    assert [b.sizes["valid_time"] for b in blocks] == [5000, 8760 - 5000]
+    assert all((b["valid_time"].dt.year == 2006).all() for b in blocks)
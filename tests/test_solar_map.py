@@ -0,0 +1,91 @@
+import concurrent.futures
+
+import dask.multiprocessing
+import h5py
+import numpy as np
+import pytest
+import rasterio
+import xarray as xr
+
+from solar_analysis import calculate_monthly_hourly_profile
+from solar_map import run_solar_map
+from solar_sources import open_h5_rasters
+
+
+def synthetic_rasters(height=9, width=5):
+    # 12 south-up ("flipped") monthly layers on a 0.1° EPSG:4326 grid, one pixel masked in May
+    rng = np.random.default_rng(7)
+    transform = (0.1, 0.0, -40.0, 0.0, -0.1, -3.0)
+    lons, lats = np.meshgrid(-40.0 + 0.1 * (np.arange(width) + 0.5),
+                             (-3.0 - 0.1 * (np.arange(height) + 0.5))[::-1])
+    rasters = []
+    for month in range(12):
+        data = rng.uniform(4.0, 7.0, (height, width)).astype(np.float32)
+        data[0, 0] = np.nan
+        if month == 4:
+            data[2, 3] = np.nan
+        rasters.append({'data': data, 'lats': lats, 'lons': lons, 'month_name': str(month),
+                        'transform': transform, 'crs': "EPSG:4326", 'flipped': True})
+    return rasters
+
+
+def point_profile(rasters, row, col):
+    values = [r['data'][row, col] for r in rasters]
+    return calculate_monthly_hourly_profile(rasters[0]['lats'][row, col], rasters[0]['lons'][row, col], values).values
+
+
+def test_tif_stack_matches_point_path(tmp_path):
+    rasters = synthetic_rasters()
+    paths = run_solar_map(rasters, str(tmp_path), "tif", block_rows=4)
+    assert len(paths) == 12
+
+    stack = np.stack([rasterio.open(p).read() for p in paths])  # (month, hour, y, x), north-up
+    height = rasters[0]['data'].shape[0]
+    for row, col in [(1, 1), (8, 4), (4, 0)]:
+        np.testing.assert_allclose(stack[:, :, height - 1 - row, col], point_profile(rasters, row, col), atol=1e-6)
+    assert np.isnan(stack[:, :, height - 1, 0]).all()
+    assert np.isnan(stack[:, :, height - 1 - 2, 3]).all()
+
+    with rasterio.open(paths[0]) as src:
+        assert src.crs.to_string() == "EPSG:4326"
+        assert src.xy(0, 0) == pytest.approx((-39.95, -3.05))
+
+
+def test_netcdf_stack_and_parallel_blocks(tmp_path, monkeypatch):
+    rasters = synthetic_rasters()
+    [serial] = run_solar_map(rasters, str(tmp_path / "serial"), "nc", block_rows=2)
+    pools = []
+
+    class CountingPool(concurrent.futures.ProcessPoolExecutor):
+        def __init__(self, *args, **kwargs):
+            pools.append(self)
+            super().__init__(*args, **kwargs)
+
+    monkeypatch.setattr(concurrent.futures, "ProcessPoolExecutor", CountingPool)
+    monkeypatch.setattr(dask.multiprocessing, "ProcessPoolExecutor", CountingPool)
+    [parallel] = run_solar_map(rasters, str(tmp_path / "parallel"), "nc", block_rows=2, workers=2)
+    assert len(pools) == 1  # one pool for the five row blocks
+
+    with xr.open_dataset(serial) as a, xr.open_dataset(parallel) as b:
+        assert a["pv_density"].dims == ("month", "hour", "y", "x")
+        np.testing.assert_array_equal(a["pv_density"].values, b["pv_density"].values)
+        np.testing.assert_allclose(a["pv_density"].values[:, :, 0, 1], point_profile(rasters, 8, 1), atol=1e-6)
+
+
+def test_h5_source_matches_the_arrays(tmp_path):
+    rasters = synthetic_rasters()
+    cube = np.stack([np.nan_to_num(r['data'][::-1]) for r in rasters])  # north-up, 0 outside the mask
+    with h5py.File(tmp_path / "solar.h5", "w") as h5:
+        h5.create_dataset("daily_density", data=cube)
+
+    [expected] = run_solar_map(rasters, str(tmp_path / "arrays"), "nc", block_rows=4)
+    [from_h5] = run_solar_map(open_h5_rasters(str(tmp_path / "solar.h5"), rasters), str(tmp_path / "h5"), "nc",
+                              block_rows=4, source="h5")
+    with xr.open_dataset(expected) as a, xr.open_dataset(from_h5) as b:
+        np.testing.assert_array_equal(a["pv_density"].values, b["pv_density"].values)
+
+
+def test_grid_without_transform_is_rejected(tmp_path):
+    rasters = [dict(r, transform=None, crs=None) for r in synthetic_rasters()]
+    with pytest.raises(ValueError, match="georeferenced"):
+        run_solar_map(rasters, str(tmp_path), "nc", source="h5")
@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+
+from solar_analysis import (MONTH_NAMES, DAYS_PER_MONTH, calculate_monthly_hourly_profile,
+                            calculate_monthly_hourly_profiles, solar_declination, equation_of_time,
+                            sunrise_hour)
+
+
+# Previous scalar implementation, kept as the reference for the vectorized engine
+def reference_profile_day(day_of_year, daily_density, latitude, local_longitude, timezone=-3):
+    I0 = 1367; Kb = 0.98; Kd = 0.13
+    EoT = equation_of_time(day_of_year)
+    time_correction = (4 * (timezone * 15 - local_longitude) + EoT) / 60
+    decl = solar_declination(day_of_year)
+    sunrise, sunset = sunrise_hour(latitude, decl)
+
+    hours_HL = np.linspace(0, 24, 241)
+    irradiance = np.zeros_like(hours_HL)
+    for i, h_HL in enumerate(hours_HL):
+        h_TSL = h_HL + time_correction
+        if sunrise <= h_TSL <= sunset:
+            omega = 15 * (h_TSL - 12)
+            cos_theta = (np.sin(np.deg2rad(latitude)) * np.sin(np.deg2rad(decl)) +
+                         np.cos(np.deg2rad(latitude)) * np.cos(np.deg2rad(decl)) * np.cos(np.deg2rad(omega)))
+            if cos_theta > 0:
+                irradiance[i] = (I0 * Kb ** (1 / cos_theta) * cos_theta + I0 * Kd * cos_theta) / 1000.0
+
+    model_energy = np.trapezoid(irradiance, hours_HL)
+    if model_energy > 0:
+        irradiance *= daily_density / model_energy
+    hourly = np.interp(np.arange(0, 25, 1), hours_HL, irradiance)
+    return np.array([(hourly[h] + hourly[h + 1]) / 2 for h in range(24)])
+
+
+def reference_profile(lat, lon, monthly_values, num_harmonics=6):
+    M = len(monthly_values)
+    monthly_days = np.linspace(0, 365.25, num=M, endpoint=False) + (365.25 / (2 * M))
+    P = 365.25
+    A0 = np.mean(monthly_values)
+    An = [(2/M) * np.sum(monthly_values * np.cos(2*np.pi*n*monthly_days/P)) for n in range(1, num_harmonics+1)]
+    Bn = [(2/M) * np.sum(monthly_values * np.sin(2*np.pi*n*monthly_days/P)) for n in range(1, num_harmonics+1)]
+
+    daily = []
+    for d in range(1, 366):
+        value = A0
+        for n in range(num_harmonics):
+            value += An[n] * np.cos(2*np.pi*(n+1)*d/P) + Bn[n] * np.sin(2*np.pi*(n+1)*d/P)
+        daily.append(value)
+    annual = np.array([reference_profile_day(d + 1, daily[d], lat, lon) for d in range(365)])
+    bounds = np.cumsum([0] + DAYS_PER_MONTH)
+    return np.array([annual[bounds[m]:bounds[m + 1]].mean(axis=0) for m in range(12)])
+
+
+SITES = [(-3.73, -38.52), (-7.2, -39.3), (-5.0, -40.0)]
+VALUES = np.array([
+    [0.639, 0.645, 0.650, 0.595, 0.640, 0.637, 0.676, 0.754, 0.779, 0.772, 0.738, 0.680],
+    [0.70, 0.66, 0.64, 0.60, 0.58, 0.55, 0.60, 0.68, 0.75, 0.78, 0.76, 0.73],
+    [0.61, 0.60, 0.62, 0.60, 0.62, 0.63, 0.68, 0.76, 0.80, 0.79, 0.75, 0.68],
+], dtype=np.float32)
+
+
+def test_vectorized_profiles_match_reference_loop():
+    lats = [s[0] for s in SITES]
+    lons = [s[1] for s in SITES]
+    profiles = calculate_monthly_hourly_profiles(lats, lons, VALUES, chunk_size=2)
+    for i, (lat, lon) in enumerate(SITES):
+        expected = reference_profile(lat, lon, list(VALUES[i]))
+        np.testing.assert_allclose(profiles[i], expected, rtol=0, atol=1e-9)
+
+
+def test_single_site_dataframe_layout():
+    df_mean = calculate_monthly_hourly_profile(-3.73, -38.52, VALUES[0])
+    assert isinstance(df_mean, pd.DataFrame)
+    assert list(df_mean.index) == MONTH_NAMES
+    assert list(df_mean.columns) == [f"{h:02d}h" for h in range(24)]
+    np.testing.assert_allclose(df_mean.values, reference_profile(-3.73, -38.52, list(VALUES[0])).round(6),
+                               rtol=0, atol=1e-9)
+    assert (df_mean.iloc[:, :5] == 0).all().all()  # night hours
@@ -0,0 +1,108 @@
+import h5py
+import numpy as np
+import pytest
+
+import raster_cache
+import solar_sources
+from solar_analysis import extract_values_by_coordinates, compare_solar_sources, load_monthly_rasters
+from solar_sources import open_h5_rasters
+from spatial_index import RasterIndex
+
+
+def synthetic_grid(height=6, width=4):
+    # South-up ("flipped") month dicts as produced by the PV cube, on a 0.1° EPSG:4326 grid
+    lons, lats = np.meshgrid(-40.0 + 0.1 * (np.arange(width) + 0.5),
+                             (-3.0 - 0.1 * (np.arange(height) + 0.5))[::-1])
+    return [{'data': np.zeros((height, width), np.float32), 'lons': lons, 'lats': lats, 'month_name': "",
+             'transform': (0.1, 0.0, -40.0, 0.0, -0.1, -3.0), 'crs': "EPSG:4326", 'flipped': True}]
+
+
+@pytest.fixture
+def monthly_cube():
+    rng = np.random.default_rng(11)
+    cube = rng.uniform(4.0, 7.0, (12, 6, 4)).astype(np.float32)  # north-up (month, row, col)
+    cube[:, 0, 0] = 0.0
+    return cube
+
+
+def test_h5_on_the_pv_grid_shares_its_index(tmp_path, monthly_cube, monkeypatch):
+    path = str(tmp_path / "solar.h5")
+    with h5py.File(path, "w") as h5:
+        h5.create_dataset("daily_density", data=monthly_cube, chunks=(1, 2, 4))
+
+    grid = synthetic_grid()
+    rasters = open_h5_rasters(path, grid)
+    assert len(rasters) == 12 and rasters[0]['lons'] is grid[0]['lons']
+
+    reads = []
+    read_row = solar_sources.H5Layer._read_row
+    monkeypatch.setattr(solar_sources.H5Layer, "_read_row",
+                        lambda self, row, start, stop: reads.append(stop - start) or read_row(self, row, start, stop))
+
+    index = RasterIndex.from_rasters(grid)
+    lats = [-3.05, -3.05, -3.55, -3.35]
+    lons = [-39.95, -39.75, -39.65, -39.85]
+    values = extract_values_by_coordinates(lats, lons, rasters, index=index)
+
+    expected = monthly_cube[:, [0, 0, 5, 3], [0, 2, 3, 1]].T
+    expected[expected == 0] = np.nan
+    np.testing.assert_array_equal(values, expected)
+    assert max(reads) <= 3 and len(reads) == 12 * 3  # three distinct rows per month, sliced
+
+
+def test_h5_with_own_coordinates(tmp_path, monthly_cube):
+    path = str(tmp_path / "solar.h5")
+    with h5py.File(path, "w") as h5:
+        h5.create_dataset("grid/data", data=np.moveaxis(monthly_cube, 0, -1))  # (rows, cols, 12)
+        h5.create_dataset("grid/lat", data=-3.0 - 0.1 * (np.arange(6) + 0.5))
+        h5.create_dataset("grid/lon", data=-40.0 + 0.1 * (np.arange(4) + 0.5))
+
+    values = extract_values_by_coordinates([-3.45], [-39.65], open_h5_rasters(path))
+    np.testing.assert_allclose(values[0], monthly_cube[:, 4, 3])
+
+
+def test_h5_file_is_closed_with_its_rasters(tmp_path, monthly_cube):
+    path = str(tmp_path / "solar.h5")
+    with h5py.File(path, "w") as h5:
+        h5.create_dataset("daily_density", data=monthly_cube)
+
+    with open_h5_rasters(path, synthetic_grid()) as rasters:
+        dataset = rasters[0]['data'].dataset
+        assert dataset.id.valid
+    assert not dataset.id.valid
+
+    # Released without close(): the last reference to the layer set closes the file
+    dataset = open_h5_rasters(path, synthetic_grid())[0]['data'].dataset
+    assert not dataset.id.valid
+
+    # A file that cannot be used is closed before the error propagates
+    opened = []
+    file_class = h5py.File
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(h5py, "File", lambda *args: opened.append(file_class(*args)) or opened[-1])
+        with pytest.raises(ValueError, match="not on the PV raster grid"):
+            open_h5_rasters(path, synthetic_grid(height=5))
+    assert not opened[0].id.valid
+
+
+def test_empty_h5_is_reported_and_skipped(tmp_path, capsys):
+    path = tmp_path / "solar_data_completo.h5"
+    path.write_bytes(b"")
+    with pytest.raises(ValueError, match="empty"):
+        open_h5_rasters(str(path))
+
+    table = compare_solar_sources([-3.73], [-38.52], sources=["h5"], base_path=str(tmp_path))
+    assert table.empty
+    assert "Skipping solar source h5" in capsys.readouterr().out
+
+
+def test_daily_rasters_match_monthly_totals(tmp_path):
+    daily = raster_cache.load_pv_cube(cache_dir=str(tmp_path / "daily"), source="daily")
+    monthly = load_monthly_rasters()
+    index = RasterIndex.from_rasters(monthly)
+    assert index.matches(daily[0])
+
+    lats = [-3.73, -5.2, -7.1]
+    lons = [-38.52, -39.3, -39.4]
+    np.testing.assert_allclose(extract_values_by_coordinates(lats, lons, daily, index=index),
+                               extract_values_by_coordinates(lats, lons, monthly, index=index), rtol=1e-6)
@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+
+from spatial_index import PixelCoordinates, RasterIndex
+
+
+TRANSFORM = (0.1, 0.0, -40.0, 0.0, -0.1, -3.0)
+
+
+def grid(height=8, width=6, flipped=False):
+    # lon/lat pixel centres of a 0.1° EPSG:4326 grid, optionally south-up as in process_monthly_tifs
+    lons, lats = np.meshgrid(-40.0 + 0.1 * (np.arange(width) + 0.5), -3.0 - 0.1 * (np.arange(height) + 0.5))
+    if flipped:
+        lons, lats = lons[::-1], lats[::-1]
+    return lons, lats
+
+
+def brute_force_nearest(lons, lats, lat, lon):
+    # The previous lookup: argmin of the distance to every pixel
+    distance = np.sqrt((lons - lon)**2 + (lats - lat)**2)
+    return np.unravel_index(np.argmin(distance), lons.shape)
+
+
+@pytest.mark.parametrize("flipped", [False, True])
+@pytest.mark.parametrize("affine", [True, False])
+def test_nearest_matches_brute_force(flipped, affine):
+    lons, lats = grid(flipped=flipped)
+    index = RasterIndex(lons, lats, transform=TRANSFORM if affine else None,
+                        crs="EPSG:4326" if affine else None, flipped=flipped)
+
+    rng = np.random.default_rng(3)
+    point_lats = rng.uniform(-3.8, -3.0, 200)
+    point_lons = rng.uniform(-40.0, -39.4, 200)
+    rows, cols, _ = index.nearest(point_lats, point_lons)
+
+    expected = np.array([brute_force_nearest(lons, lats, lat, lon) for lat, lon in zip(point_lats, point_lons)])
+    np.testing.assert_array_equal(rows, expected[:, 0])
+    np.testing.assert_array_equal(cols, expected[:, 1])
+
+
+def test_bilinear_sampling_and_nan_renormalisation():
+    lons, lats = grid()
+    index = RasterIndex(lons, lats, transform=TRANSFORM, crs="EPSG:4326", max_distance=0.1)
+    layer = 2.0 * lons + 3.0 * lats  # bilinear interpolation is exact on a linear field
+
+    lat, lon = -3.27, -39.82  # between rows 2-3 and columns 1-2
+    value = index.sample([layer], [lat], [lon], method="bilinear")[0, 0]
+    assert value == pytest.approx(2.0 * lon + 3.0 * lat)
+
+    # One NaN neighbour is dropped and the three remaining weights renormalised
+    holed = layer.copy()
+    holed[2, 1] = np.nan
+    wr, wc = 0.2, 0.3  # fractional offsets of the point from pixel (2, 1)
+    weights = {(2, 2): (1 - wr) * wc, (3, 1): wr * (1 - wc), (3, 2): wr * wc}
+    expected = sum(w * layer[rc] for rc, w in weights.items()) / sum(weights.values())
+    value = index.sample([holed], [lat], [lon], method="bilinear")[0, 0]
+    assert value == pytest.approx(expected)
+
+    holed[2:4, 1:3] = np.nan
+    assert np.isnan(index.sample([holed], [lat], [lon], method="bilinear")[0, 0])
+
+
+def test_points_far_from_the_grid_are_nan(capsys):
+    lons, lats = grid()
+    index = RasterIndex(lons, lats, transform=TRANSFORM, crs="EPSG:4326")
+    layer = np.arange(lons.size, dtype=float).reshape(lons.shape)
+
+    # Inside, 0.01° past the last pixel centre, and 0.03° past it
+    values = index.sample([layer], [-3.35, -3.35, -3.35], [-39.85, -39.44, -39.42])
+    assert values[0, 0] == layer[3, 1]
+    assert values[1, 0] == layer[3, 5]
+    assert np.isnan(values[2, 0])
+    assert "1 point(s) far from the raster" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize("affine", [True, False])
+def test_nan_coordinates_are_far_from_the_grid(affine, capsys):
+    lons, lats = grid()
+    index = RasterIndex(lons, lats, transform=TRANSFORM if affine else None, crs="EPSG:4326" if affine else None)
+    layer = np.arange(lons.size, dtype=float).reshape(lons.shape)
+
+    values = index.sample([layer], [-3.35, np.nan, -3.35], [-39.85, -39.85, np.nan])
+    assert values[0, 0] == layer[3, 1]
+    assert np.isnan(values[1:, 0]).all()
+    assert np.isnan(index.sample([layer], [np.nan], [-39.85], method="bilinear")[0, 0])
+    assert "2 point(s) far from the raster" in capsys.readouterr().out
+
+
+def test_rotated_transform_is_inverted():
+    # 10° rotation: the b and d terms are not zero
+    angle = np.radians(10.0)
+    transform = (0.1 * np.cos(angle), -0.1 * np.sin(angle), -40.0,
+                 -0.1 * np.sin(angle), -0.1 * np.cos(angle), -3.0)
+    lons, lats = PixelCoordinates.pair(transform, "EPSG:4326", (8, 6))
+    index = RasterIndex(np.asarray(lons), np.asarray(lats), transform=transform, crs="EPSG:4326")
+
+    rows, cols = np.meshgrid(np.arange(8), np.arange(6), indexing="ij")
+    found_rows, found_cols = index.locate(lats[rows, cols].ravel(), lons[rows, cols].ravel())
+    np.testing.assert_allclose(found_rows, rows.ravel(), atol=1e-9)
+    np.testing.assert_allclose(found_cols, cols.ravel(), atol=1e-9)
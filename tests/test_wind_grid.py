@@ -0,0 +1,66 @@
+import os
+
+import numpy as np
+import pytest
+import rasterio
+import xarray as xr
+from rasterio.transform import from_origin
+
+import era5_store
+from era5_download import era5_request
+from era5_stub import write_era5_file
+from wind_analysis import wind_statistics_from_store, DEFAULT_CAPACITY_FACTOR
+from wind_grid import STATISTICS, run_wind_grid, wind_grid_tables
+
+
+WIND = ["100m_u_component_of_wind", "100m_v_component_of_wind"]
+AREA = [-3.5, -38.75, -4.0, -38.25]  # 3 x 3 ERA5 cells
+NODATA = -9999.0
+
+
+@pytest.fixture(scope="module")
+def grid_inputs(tmp_path_factory):
+    folder = tmp_path_factory.mktemp("wind_grid")
+    files = []
+    for year in ["2003", "2004"]:
+        path = str(folder / f"wind100m_{year}.nc")
+        write_era5_file(path, era5_request(WIND, year, AREA), seed=int(year))
+        files.append(path)
+    store = era5_store.build_regional_store("wind", files, region_dir=str(folder))
+
+    # 0.05° capacity factors covering the two northern rows of cells (5 x 5 pixels per cell)
+    band = np.random.default_rng(5).uniform(0.2, 0.6, (10, 15)).astype("float32")
+    band[2, 3] = NODATA
+    cf_path = str(folder / "cf.tif")
+    with rasterio.open(cf_path, "w", driver="GTiff", height=10, width=15, count=1, dtype="float32",
+                       crs="EPSG:4326", transform=from_origin(-38.875, -3.375, 0.05, 0.05), nodata=NODATA) as dst:
+        dst.write(band, 1)
+    return store, cf_path, band
+
+
+def test_grid_matches_point_statistics(grid_inputs, tmp_path):
+    store, cf_path, band = grid_inputs
+    path = run_wind_grid(store=store, output_dir=str(tmp_path), geotiff_file=cf_path, workers=2)
+
+    # Capacity factors are the mean of the valid pixels inside each cell, 0.45 where the raster has none
+    pixels = np.where(band == NODATA, np.nan, band).reshape(2, 5, 3, 5)
+    expected_cf = np.vstack([np.nanmean(pixels, axis=(1, 3)), np.full((1, 3), DEFAULT_CAPACITY_FACTOR)])
+    with xr.open_dataset(path) as ds:
+        assert ds["mean"].encoding["chunksizes"] == (12, 24, 3, 3)
+        np.testing.assert_allclose(ds["capacity_factor"].values, expected_cf, rtol=1e-6)
+
+    for lat, lon in [(-3.5, -38.75), (-3.75, -38.5), (-4.0, -38.25)]:
+        tables = wind_grid_tables(path, lat, lon)
+        expected = wind_statistics_from_store(store, lat, lon, tables["capacity_factor"])
+        for key in STATISTICS:
+            np.testing.assert_allclose(tables[key].values, expected[key].values, rtol=1e-5)
+
+
+def test_year_range(grid_inputs, tmp_path):
+    store, cf_path, _ = grid_inputs
+    path = run_wind_grid(store=store, output_dir=str(tmp_path), years=["2004"], geotiff_file=cf_path, workers=1)
+    assert os.path.basename(path) == "wind_grid_statistics_2004_2004.nc"
+    tables = wind_grid_tables(path, -3.75, -38.5)
+    expected = wind_statistics_from_store(store, -3.75, -38.5, tables["capacity_factor"], years=[2004])
+    for key in STATISTICS:
+        np.testing.assert_allclose(tables[key].values, expected[key].values, rtol=1e-5)
@@ -0,0 +1,169 @@
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+import batch_analysis
+import era5_store
+import main
+import wind_analysis
+from aggregate_store import AggregateStore
+from era5_download import era5_request, parse_years, NETCDF_LOCK
+from era5_stub import write_era5_file
+from month_hour_stats import MonthHourAccumulator
+from wind_analysis import compute_wind_statistics, wind_statistics_from_store, POWER_DENSITY
+
+
+WIND = ["100m_u_component_of_wind", "100m_v_component_of_wind"]
+AREA = [-3.5, -38.75, -3.75, -38.5]  # 2 x 2 ERA5 cells
+
+
+@pytest.fixture(scope="module")
+def wind_files(tmp_path_factory):
+    folder = tmp_path_factory.mktemp("wind")
+    files = []
+    for year in ["2003", "2004"]:
+        path = str(folder / f"wind100m_{year}.nc")
+        write_era5_file(path, era5_request(WIND, year, AREA), seed=int(year))
+        files.append(path)
+    return files
+
+
+# Previous DataFrame + pivot_table implementation, kept as the reference
+def reference_statistics(nc_files, lat, lon, capacity_factor):
+    ds = xr.open_mfdataset(nc_files, combine='by_coords')
+    point = ds.sel(latitude=lat, longitude=lon, method='nearest')
+    df = point[['u100', 'v100']].to_dataframe().reset_index().rename(columns={'valid_time': 'Time'})
+    df['WindSpeed'] = np.sqrt(df['u100']**2 + df['v100']**2)
+    df['Month'] = df['Time'].dt.month
+    df['Hour'] = df['Time'].dt.hour
+    mean = df.pivot_table(values='WindSpeed', index='Month', columns='Hour', aggfunc='mean')
+    std = df.pivot_table(values='WindSpeed', index='Month', columns='Hour', aggfunc='std')
+    cv = (std / mean * 100).fillna(0)
+    energy_density = mean / df['WindSpeed'].mean() * capacity_factor * POWER_DENSITY
+    return {'mean': mean, 'std': std, 'cv': cv, 'energy_density': energy_density}
+
+
+def test_streaming_statistics_match_pivot_tables(wind_files):
+    expected = reference_statistics(wind_files, -3.6, -38.6, 0.45)
+    result = compute_wind_statistics(wind_files, -3.6, -38.6, 0.45)
+    for key, table in expected.items():
+        assert result[key].shape == (12, 24)
+        assert result[key].dtypes.iloc[0] == np.float32
+        np.testing.assert_allclose(result[key].values, table.values, rtol=1e-6)
+
+
+def test_accumulator_merge_equals_single_pass():
+    rng = np.random.default_rng(1)
+    times = pd.date_range("2001-01-01", "2002-12-31 23:00", freq="h")
+    values = rng.gamma(4.0, 1.5, times.size)
+    values[::97] = np.nan
+
+    single = MonthHourAccumulator().update(times, values)
+    half = times.size // 3
+    merged = MonthHourAccumulator().update(times[:half], values[:half])
+    merged.merge(MonthHourAccumulator().update(times[half:], values[half:]))
+
+    np.testing.assert_array_equal(single.count, merged.count)
+    np.testing.assert_allclose(merged.mean_table().values, single.mean_table().values, rtol=1e-12)
+    np.testing.assert_allclose(merged.std_table().values, single.std_table().values, rtol=1e-12)
+
+    frame = pd.DataFrame({"v": values, "m": times.month, "h": times.hour}).dropna()
+    np.testing.assert_allclose(single.std_table().values, frame.groupby(["m", "h"])["v"].std().values.reshape(12, 24),
+                               rtol=1e-10)
+
+
+def test_store_series_streams_without_holding_the_lock(wind_files, tmp_path, capsys):
+    store = era5_store.build_regional_store("wind", wind_files, region_dir=str(tmp_path))
+
+    expected = compute_wind_statistics(wind_files, -3.6, -38.6, 0.45)
+    result = wind_statistics_from_store(store, -3.6, -38.6, 0.45)
+    for key in expected:
+        np.testing.assert_allclose(result[key].values, expected[key].values, rtol=1e-6)
+
+    blocks = 0
+    for block in era5_store.iter_point_series(store, -3.6, -38.6, ["u100"], block=1000):
+        assert NETCDF_LOCK.acquire(blocking=False)
+        NETCDF_LOCK.release()
+        blocks += 1
+    assert blocks == int(np.ceil((8760 + 8784) / 1000))
+
+    capsys.readouterr()
+    next(era5_store.iter_point_series(store, -6.0, -38.6, ["u100"])).close()
+    assert "outside the regional ERA5 store" in capsys.readouterr().out
+
+
+def test_years_are_aggregated_once_and_ranges_served_from_the_store(wind_files, tmp_path, monkeypatch):
+    calls = []
+    read_file = wind_analysis.wind_file_accumulator
+    monkeypatch.setattr(wind_analysis, "wind_file_accumulator",
+                        lambda path, *args: calls.append(path) or read_file(path, *args))
+    path = str(tmp_path / "wind.npz")
+
+    compute_wind_statistics(wind_files[:1], -3.6, -38.6, 0.45, AggregateStore(path))
+    assert calls == wind_files[:1]
+    # Appending a year only reads the new file, and gives the tables of a fresh read
+    full = compute_wind_statistics(wind_files, -3.6, -38.6, 0.45, AggregateStore(path))
+    assert calls == wind_files
+    fresh = compute_wind_statistics(wind_files, -3.6, -38.6, 0.45)
+    for key in fresh:
+        pd.testing.assert_frame_equal(full[key], fresh[key])
+
+    # Any range straight from the store
+    second_year = compute_wind_statistics(wind_files[1:], -3.6, -38.6, 0.45)
+    stored = AggregateStore(path).accumulator(years=[2004])
+    np.testing.assert_array_equal(stored.mean_table().values, second_year['mean'].values)
+
+    # Regional store: the years are read once, a range is merged from the aggregates
+    store = era5_store.build_regional_store("wind", wind_files, region_dir=str(tmp_path))
+    aggregates = AggregateStore(str(tmp_path / "wind_regional.npz"))
+    wind_analysis.wind_statistics_from_store(store, -3.6, -38.6, 0.45, aggregates=aggregates)
+    monkeypatch.setattr(wind_analysis, "iter_point_series", None)
+    ranged = wind_analysis.wind_statistics_from_store(store, -3.6, -38.6, 0.45, parse_years("2004"),
+                                                      AggregateStore(aggregates.path))
+    np.testing.assert_allclose(ranged['std'].values, second_year['std'].values, rtol=1e-6)
+    assert parse_years("2005-2007") == ["2005", "2006", "2007"]
+    with pytest.raises(ValueError):
+        parse_years("2010-2005")
+    with pytest.raises(ValueError):
+        parse_years("2010-2999")
+
+
+def test_batch_wind_without_cache_keeps_no_aggregates(wind_files, tmp_path, monkeypatch):
+    store = era5_store.build_regional_store("wind", wind_files, region_dir=str(tmp_path))
+    monkeypatch.setattr(batch_analysis, "ensure_regional_store", lambda product, API_KEY: store)
+    monkeypatch.setattr(batch_analysis, "AggregateStore", None)  # must not be used with use_cache=False
+    sites = pd.DataFrame({"site_id": ["a"], "lat": [-3.6], "lon": [-38.6]})
+
+    stats, _ = batch_analysis.run_batch_wind(sites, "", regional=True, years=["2004"], use_cache=False)
+    expected = compute_wind_statistics(wind_files[1:], -3.6, -38.6, 0.45)
+    np.testing.assert_allclose(stats[0]['std'].values, expected['std'].values, rtol=1e-6)
+
+
+def test_regional_store_is_opened_and_scanned_once(wind_files, tmp_path, monkeypatch):
+    store = era5_store.build_regional_store("wind", wind_files, region_dir=str(tmp_path))
+    opened = []
+    monkeypatch.setattr(wind_analysis, "open_store", lambda path: opened.append(path) or era5_store.open_store(path))
+    wind_statistics_from_store(store, -3.6, -38.6, 0.45)
+    assert opened == [store]
+
+    monkeypatch.setattr(batch_analysis, "ensure_regional_store", lambda product, API_KEY: store)
+    monkeypatch.setattr(batch_analysis, "open_store", lambda path: opened.append(path) or era5_store.open_store(path))
+    scans = []
+    scan = era5_store.scan_year_ranges
+    monkeypatch.setattr(era5_store, "_YEAR_RANGES", {})
+    monkeypatch.setattr(era5_store, "scan_year_ranges", lambda year_of: scans.append(year_of.size) or scan(year_of))
+    sites = pd.DataFrame({"site_id": ["a", "b"], "lat": [-3.6, -3.75], "lon": [-38.6, -38.5]})
+    stats, _ = batch_analysis.run_batch_wind(sites, "", regional=True, use_cache=False)
+    assert opened == [store, store]
+    assert scans == [8760 + 8784]
+    expected = compute_wind_statistics(wind_files, -3.75, -38.5, 0.45)
+    np.testing.assert_allclose(stats[1]['mean'].values, expected['mean'].values, rtol=1e-6)
+
+
+@pytest.mark.parametrize("mode", ["--regional", "--wind-grid"])
+def test_years_outside_the_regional_store_are_rejected(mode, monkeypatch, capsys):
+    monkeypatch.setattr("sys.argv", ["main.py", mode, "--years", "2015-2020"])
+    with pytest.raises(SystemExit):
+        main.main()
+    assert "within the regional store" in capsys.readouterr().err
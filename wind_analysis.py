@@ -1,203 +1,299 @@
 # wind_analysis.py
+# rasterio and xarray are imported inside the functions that read the GeoTIFF and the NetCDF files.
 
 import os
-import rasterio
 import numpy as np
-import pandas as pd
-import xarray as xr
-import matplotlib.pyplot as plt
-import seaborn as sns
-import cdsapi
-from mpl_toolkits.mplot3d import Axes3D
-import plotly.graph_objects as go
+from common import site_output_dir
+from era5_download import (YEARS, MANIFEST_NAME, NETCDF_LOCK, era5_request, cds_client_factory, download_era5,
+                           manifest_signature, file_year)
+from era5_store import ensure_regional_store, iter_point_series, open_store, read_store_signature, store_file
+from aggregate_store import AggregateStore, aggregate_path
+from result_cache import default_result_cache, make_key, file_stat_signature
+from month_hour_stats import MonthHourAccumulator
+from profiling import stage
+from parallel import run_tasks, files_size
+from rendering import (DEFAULT_FORMATS, figure_formats, table_formats, figure_job, render_jobs, render_heatmap,
+                       render_wind_surface, render_wind_html, hour_table, save_table)
+
+
+INPUT_FOLDER = r"./input"
+GEOTIFF_FILE = os.path.join(INPUT_FOLDER, "ceara_cf_onshore_offshore_iec_ii.tif")
+
+POWER_DENSITY = 0.004  # kW/m²
+DEFAULT_CAPACITY_FACTOR = 0.45
+
+
+# =========================== DOWNLOAD ERA5  ===========================
+def download_wind(lat, lon, API_KEY, output_dir, client_factory=None, years=YEARS):
+    print(f"Downloading ERA5 100m wind data ({years[0]}–{years[-1]})...")
+    jobs = [(os.path.join(output_dir, f"wind100m_{year}.nc"),
+             era5_request(["100m_u_component_of_wind", "100m_v_component_of_wind"], year, [lat, lon, lat, lon]))
+            for year in years]
+    with stage("ERA5 download", product="wind"):
+        results = download_era5(jobs, ["u100", "v100"], client_factory or cds_client_factory(API_KEY),
+                                os.path.join(output_dir, MANIFEST_NAME))
+    return [path for path, error in results.items() if error is None]
+
+
+# =========================== CAPACITY FACTOR ===========================
+def sample_raster_points(src, lats, lons, band=1):
+    # 1 x 1 windowed reads of the distinct pixels hit, so memory scales with the points and not with
+    # the raster (GDAL's block cache lets neighbouring points share one decoded tile).
+    # NaN off-raster or on nodata
+    from rasterio.transform import rowcol
+    from rasterio.windows import Window
+    values = np.full(lats.size, np.nan)
+    rows, cols = rowcol(src.transform, lons, lats)
+    rows = np.atleast_1d(np.asarray(rows))
+    cols = np.atleast_1d(np.asarray(cols))
+    inside = (rows >= 0) & (rows < src.height) & (cols >= 0) & (cols < src.width)
+    if not inside.any():
+        return values
+
+    pixels, inverse = np.unique(np.stack([rows[inside], cols[inside]], axis=1), axis=0, return_inverse=True)
+    read = np.array([src.read(band, window=Window(col, row, 1, 1))[0, 0] for row, col in pixels], dtype=float)
+    if src.nodata is not None:
+        read[read == src.nodata] = np.nan
+    values[inside] = read[inverse.ravel()]
+    return values
+
+
+def read_capacity_factors(lats, lons, geotiff_file=GEOTIFF_FILE):
+    # One raster open for any number of sites; falls back to 0.45 off-raster or on nodata
+    lats = np.atleast_1d(np.asarray(lats, dtype=float))
+    lons = np.atleast_1d(np.asarray(lons, dtype=float))
+    capacity_factors = np.full(lats.size, DEFAULT_CAPACITY_FACTOR)
+    if not os.path.exists(geotiff_file):
+        return capacity_factors
+
+    import rasterio
+
+    try:
+        with stage("capacity factor", sites=lats.size), rasterio.open(geotiff_file) as src:
+            values = sample_raster_points(src, lats, lons)
+        valid = ~np.isnan(values)
+        capacity_factors[valid] = values[valid]
+    except Exception as e:
+        print(f"Error reading GeoTIFF: {e}")
+    return capacity_factors
+
+
+def read_capacity_factor(lat, lon, geotiff_file=GEOTIFF_FILE):
+    capacity_factor = read_capacity_factors(lat, lon, geotiff_file)[0]
+    if capacity_factor != DEFAULT_CAPACITY_FACTOR:
+        print(f"GeoTIFF capacity factor: {capacity_factor:.4f}")
+    return capacity_factor
+
+
+# =========================== WIND DATA PROCESSING ===========================
+def update_wind_accumulator(acc, point_data):
+    # Folds one block of a point's u100/v100 series into the month x hour accumulator
+    time_name = 'valid_time' if 'valid_time' in point_data.coords else 'time'
+    u = point_data['u100'].values
+    v = point_data['v100'].values
+    acc.update(point_data[time_name].values, np.sqrt(u**2 + v**2))
+    return acc
+
+
+def wind_file_accumulator(file_path, lat, lon):
+    import xarray as xr
+
+    with stage("dataset open", file=os.path.basename(file_path)), NETCDF_LOCK, xr.open_dataset(file_path) as ds:
+        point_data = ds.sel(latitude=lat, longitude=lon, method='nearest')[['u100', 'v100']].load()
+    with stage("aggregation", file=os.path.basename(file_path)):
+        return update_wind_accumulator(MonthHourAccumulator(), point_data)
+
+
+def compute_wind_statistics(nc_files, lat, lon, capacity_factor, aggregates=None):
+    # One accumulator per year-file (read in parallel with --jobs), merged in file order: memory does
+    # not grow with the number of years and the result does not depend on the number of workers.
+    # aggregates: AggregateStore of the site; stored years are not read again and new ones are appended
+    nc_files = sorted(f for f in nc_files if os.path.exists(f))
+    checksums = dict(manifest_signature(nc_files))
+    sources = [[os.path.basename(f), checksums.get(os.path.basename(f)) or file_stat_signature(f)] for f in nc_files]
+    year_accs = [aggregates.get(file_year(f), source) if aggregates is not None else None
+                 for f, source in zip(nc_files, sources)]
+    missing = [i for i, year_acc in enumerate(year_accs) if year_acc is None]
+    computed = run_tasks(wind_file_accumulator, [(nc_files[i], lat, lon) for i in missing], "year",
+                         input_bytes=files_size(nc_files[i] for i in missing))
+    for i, year_acc in zip(missing, computed):
+        year_accs[i] = year_acc
+        if aggregates is not None:
+            aggregates.put(file_year(nc_files[i]), sources[i], year_acc)
+    if aggregates is not None:
+        aggregates.save()
+
+    acc = MonthHourAccumulator()
+    for year_acc in year_accs:
+        acc.merge(year_acc)
+    return wind_statistics_from_accumulator(acc, capacity_factor)
+
+
+def wind_statistics_from_store(store, lat, lon, capacity_factor, years=None, aggregates=None):
+    # Year by year from the regional store, each keyed by the checksum of its source file.
+    # years: restrict to these years; aggregates as in compute_wind_statistics.
+    # A store path is opened once, and only if a year is missing from the aggregates
+    wanted = None if years is None else {int(y) for y in years}
+    acc = MonthHourAccumulator()
+    found = set()
+    ds = None if isinstance(store, str) else store
+    try:
+        with stage("aggregation", store=True):
+            for name, checksum in read_store_signature(store) or []:
+                year = file_year(name)
+                if wanted is not None and year not in wanted:
+                    continue
+                found.add(year)
+                source = [name, checksum or file_stat_signature(store_file(store))]
+                year_acc = aggregates.get(year, source) if aggregates is not None else None
+                if year_acc is None:
+                    ds = open_store(store) if ds is None else ds
+                    year_acc = MonthHourAccumulator()
+                    for point_data in iter_point_series(ds, lat, lon, ["u100", "v100"], years=[year]):
+                        update_wind_accumulator(year_acc, point_data)
+                    if aggregates is not None:
+                        aggregates.put(year, source, year_acc)
+                acc.merge(year_acc)
+    finally:
+        if ds is not None and ds is not store:
+            with NETCDF_LOCK:
+                ds.close()
+    if aggregates is not None:
+        aggregates.save()
+    if wanted is not None and wanted - found:
+        print(f"Warning: years not in the regional ERA5 store: {', '.join(map(str, sorted(wanted - found)))}")
+    return wind_statistics_from_accumulator(acc, capacity_factor)
+
+
+# =========================== ESTATISTICS ===========================
+def wind_statistics_from_accumulator(acc, capacity_factor):
+    mean = acc.mean_table()
+    std = acc.std_table()
+    cv = (std / mean * 100).fillna(0)
 
+    global_mean = acc.global_mean()
+    energy_density = mean / global_mean * capacity_factor * POWER_DENSITY
 
-def run_wind_analysis(lat: float, lon: float, API_KEY: str):
+    return {'mean': mean, 'std': std, 'cv': cv, 'energy_density': energy_density}
+
+
+# =========================== GRAPHICS ===========================
+def wind_figure_jobs(stats, capacity_factor, figures_pdf_folder, lat_str, lon_str, formats=DEFAULT_FORMATS, suffix=""):
+    # Figure jobs for rendering.render_jobs; nothing is drawn here. suffix is appended to every file name
+    std_density = stats['std'] * capacity_factor * POWER_DENSITY
+    heatmaps = [
+        (stats['energy_density'], "Wind_Monthly_Average_Energy_Density", "Average Energy Density (kWh/m²)", ".5f"),
+        (std_density, "Wind_Monthly_Standard_Deviation", "Standard Deviation (kWh/m²)", ".5f"),
+        (stats['cv'], "Wind_Coefficient_of_Variation", "Coefficient of Variation (%)", ".1f"),
+    ]
+    jobs = []
+    for data, base_name, cbar_label, fmt in heatmaps:
+        path_base = os.path.join(figures_pdf_folder, f"{base_name}_{lat_str}_{lon_str}{suffix}")
+        jobs += figure_job(render_heatmap, path_base, formats, data=data, cbar_label=cbar_label, fmt=fmt)
+
+    surface_base = os.path.join(figures_pdf_folder, f"Wind_Standard_Deviation_3D_{lat_str}_{lon_str}{suffix}")
+    jobs += figure_job(render_wind_surface, surface_base, formats, z=std_density.values)
+    jobs += figure_job(render_wind_html, surface_base, formats, z=std_density.values)
+    return jobs
+
+
+def save_wind_tables(stats, tables_folder, lat_str, lon_str, formats, suffix=""):
+    paths = []
+    for key in ["mean", "std", "cv", "energy_density"]:
+        path_base = os.path.join(tables_folder, f"Wind_{key}_{lat_str}_{lon_str}{suffix}")
+        paths += save_table(hour_table(stats[key]), path_base, formats)
+    return paths
+
+
+def get_wind_tables(lat, lon, API_KEY, capacity_factor=None, regional=False, output_dir=None, cache=None,
+                    store=None, years=None):
+    # Result tables only (no figures); cached by coordinates, ERA5 file checksums and capacity factor.
+    # Returns None when no ERA5 data is available; cache=False disables the result cache and the
+    # per-year aggregate store. store: regional store path or open dataset, skips the download check.
+    # years: list of years (default: YEARS, or every year of the regional store)
+    cache = default_result_cache() if cache is None else cache
+    if regional:
+        store = ensure_regional_store("wind", API_KEY) if store is None else store
+        if store is None:
+            return None
+        inputs = read_store_signature(store)
+    else:
+        if output_dir is None:
+            output_dir = site_output_dir(lat, lon)
+            os.makedirs(output_dir, exist_ok=True)
+        nc_files = download_wind(lat, lon, API_KEY, output_dir, years=years or YEARS)
+        if not nc_files or not any(os.path.exists(f) for f in nc_files):
+            return None
+        inputs = manifest_signature(nc_files)
+
+    # The capacity-factor raster is keyed by its signature so a cache hit never has to read it
+    cf_source = float(capacity_factor) if capacity_factor is not None else file_stat_signature(GEOTIFF_FILE)
+    key = make_key("wind", lat=round(float(lat), 6), lon=round(float(lon), 6), regional=regional,
+                   capacity_factor=cf_source, inputs=inputs, years=years)
+    tables = cache.get(key) if cache else None
+    if tables is not None:
+        return tables
+
+    if capacity_factor is None:
+        capacity_factor = read_capacity_factor(lat, lon)
+
+    aggregates = AggregateStore(aggregate_path("wind", lat, lon, regional)) if cache else None
+    if regional:
+        tables = wind_statistics_from_store(store, lat, lon, capacity_factor, years, aggregates)
+    else:
+        tables = compute_wind_statistics(nc_files, lat, lon, capacity_factor, aggregates)
+    tables['capacity_factor'] = capacity_factor
+    if cache:
+        cache.put(key, tables)
+    return tables
+
+
+def run_wind_analysis(lat: float, lon: float, API_KEY: str, capacity_factor=None, regional=False, use_cache=True,
+                      formats=DEFAULT_FORMATS, jobs=None, years=None):
+    # Figures go to `jobs` when a list is given (rendered later by the caller), otherwise they are rendered here.
+    # years: statistics over these years only (e.g. parse_years("2005-2014")), served from the aggregate store
     print(f"\n{'='*70}")
-    print(f"WIND ANALYSIS → Lat: {lat:.2f}° | Lon: {lon:.2f}°")
+    print(f"WIND ANALYSIS → Lat: {lat:.2f}° | Lon: {lon:.2f}°" + (f" | Years: {years[0]}–{years[-1]}" if years else ""))
     print(f"{'='*70}")
 
     # =========================== CONFIGURATION ===========================
-    coord_folder = f"{lat:.2f}_{lon:.2f}".replace('-', 'm').replace('.', 'p')
-    output_dir = os.path.join(".\output", coord_folder)
+    output_dir = site_output_dir(lat, lon)
     figures_pdf_folder = os.path.join(output_dir, "figures_pdf")
+    tables_folder = os.path.join(output_dir, "tables")
 
     os.makedirs(output_dir, exist_ok=True)
-    os.makedirs(figures_pdf_folder, exist_ok=True)
+    if figure_formats(formats):
+        os.makedirs(figures_pdf_folder, exist_ok=True)
+    if table_formats(formats):
+        os.makedirs(tables_folder, exist_ok=True)
 
     lat_str = f"Lat_{str(lat).replace('-', 'm').replace('.', 'p')}"
     lon_str = f"Lon_{str(lon).replace('-', 'm').replace('.', 'p')}"
+    suffix = f"_{years[0]}_{years[-1]}" if years else ""  # a year range never overwrites the full-period outputs
 
-    INPUT_FOLDER = r"./input"
-    GEOTIFF_FILE = os.path.join(INPUT_FOLDER, "ceara_cf_onshore_offshore_iec_ii.tif")
-
-    POWER_DENSITY = 0.004  # kW/m²
-
-    # =========================== DOWNLOAD ERA5  ===========================
-    print("Downloading ERA5 100m wind data (1998–2018)...")
-    c = cdsapi.Client(url="https://cds.climate.copernicus.eu/api", key=API_KEY)
-
-    years = [str(y) for y in range(1999, 2019)]
-    nc_files = []
-    for year in years:
-        file_path = os.path.join(output_dir, f"wind100m_{year}.nc")
-        nc_files.append(file_path)
-
-        if os.path.exists(file_path):
-            print(f"   → {year}: Already exist")
-            continue
-
-        print(f"   → Baixando {year}...")
-        try:
-            c.retrieve(
-                "reanalysis-era5-single-levels",
-                {
-                    "product_type": "reanalysis",
-                    "variable": ["100m_u_component_of_wind", "100m_v_component_of_wind"],
-                    "year": year,
-                    "month": [f"{m:02d}" for m in range(1,13)],
-                    "day": [f"{d:02d}" for d in range(1,32)],
-                    "time": [f"{h:02d}:00" for h in range(24)],
-                    "area": [lat, lon, lat, lon],
-                    "format": "netcdf"
-                },
-                file_path
-            )
-        except Exception as e:
-            print(f"There's a error {year}: {e}")
-
-    # =========================== WIND DATA PROCESSING ===========================
-    if not nc_files or not any(os.path.exists(f) for f in nc_files):
+    with stage("wind tables", regional=regional):
+        stats = get_wind_tables(lat, lon, API_KEY, capacity_factor, regional, output_dir,
+                                cache=None if use_cache else False, years=years)
+    if stats is None:
         print("No wind files found. Skipping calculations.")
-        return
-
-    ds = xr.open_mfdataset([f for f in nc_files if os.path.exists(f)], combine='by_coords')
-    point_data = ds.sel(latitude=lat, longitude=lon, method='nearest')
-
-    df_wind = point_data[['u100', 'v100']].to_dataframe().reset_index()
-    df_wind.rename(columns={'u100': 'U100', 'v100': 'V100'}, inplace=True)
-
-    if 'valid_time' in df_wind.columns:
-        df_wind.rename(columns={'valid_time': 'Time'}, inplace=True)
-    elif 'time' in df_wind.columns:
-        df_wind.rename(columns={'time': 'Time'}, inplace=True)
-
-    df_wind.dropna(subset=['U100', 'V100'], inplace=True)
-    df_wind['WindSpeed'] = np.sqrt(df_wind['U100']**2 + df_wind['V100']**2)
-    df_wind['Month'] = df_wind['Time'].dt.month
-    df_wind['Hour'] = df_wind['Time'].dt.hour
-
-    # =========================== CAPACITY FACTOR ===========================
-    capacity_factor = 0.45
-    if os.path.exists(GEOTIFF_FILE):
-        try:
-            with rasterio.open(GEOTIFF_FILE) as src:
-                row, col = src.index(lon, lat)
-                val = src.read(1)[row, col]
-                if not np.isnan(val) and val != src.nodata:
-                    capacity_factor = val
-                    print(f"GeoTIFF capacity factor: {capacity_factor:.4f}")
-        except Exception as e:
-            print(f"Error reading GeoTIFF: {e}")
-
-    # =========================== ESTATISTICS ===========================
-    mean = df_wind.pivot_table(values='WindSpeed', index='Month', columns='Hour', aggfunc='mean')
-    std = df_wind.pivot_table(values='WindSpeed', index='Month', columns='Hour', aggfunc='std')
-    cv = (std / mean * 100).fillna(0)
-
-    global_mean = df_wind['WindSpeed'].mean()
-    energy_density = mean / global_mean * capacity_factor * POWER_DENSITY
+        return None
 
-    month_names = ["Jan","Feb","Mar","Apr","May","Jun","Jul","Aug","Sep","Oct","Nov","Dec"]
-    mean.index = month_names
-    std.index = month_names
-    cv.index = month_names
-    energy_density.index = month_names
-
-    # =========================== GRAPHICS ===========================
-    cmap = sns.color_palette("turbo", as_cmap=True)
-
-    def save_clean_heatmap(data, base_name, cbar_label, fmt=".5f"):
-        plt.figure(figsize=(16, 8))
-        sns.heatmap(data, annot=True, fmt=fmt, cmap=cmap, linewidths=0.5,
-                    cbar_kws={'label': cbar_label, 'shrink': 0.8},
-                    annot_kws={'size': 9})
-        plt.xlabel("Hour of Day", fontsize=12)
-        plt.ylabel("Month", fontsize=12)
-        plt.xticks(rotation=45, ha='right')
-        plt.yticks(rotation=0)
-        plt.tight_layout()
-        filename = f"{base_name}_{lat_str}_{lon_str}.pdf"
-        path = os.path.join(figures_pdf_folder, filename)
-        plt.savefig(path, format='pdf', dpi=300, bbox_inches='tight')
-        plt.close()
-        print(f"File created: {filename}")
-
-    save_clean_heatmap(energy_density, "Wind_Monthly_Average_Energy_Density", "Average Energy Density (kWh/m²)")
-    save_clean_heatmap(std * capacity_factor * POWER_DENSITY, "Wind_Monthly_Standard_Deviation", "Standard Deviation (kWh/m²)")
-    save_clean_heatmap(cv, "Wind_Coefficient_of_Variation", "Coefficient of Variation (%)", ".1f")
-
-    # =========================== 3D SURFACE PLOT  ===========================
-    X, Y = np.meshgrid(np.arange(24), np.arange(12))
-    Z = (std * capacity_factor * POWER_DENSITY).values
-
-    fig = plt.figure(figsize=(16, 10))
-    ax = fig.add_subplot(111, projection='3d')
-    surf = ax.plot_surface(X, Y, Z, cmap='turbo', edgecolor='k', linewidth=0.3, alpha=0.9, antialiased=True)
-
-    ax.set_xlabel('Hour of Day', labelpad=15, fontsize=12)
-    ax.set_ylabel('Month', labelpad=15, fontsize=12)
-    ax.set_zlabel('Standard Deviation\n(kWh/m²)', labelpad=15, fontsize=12)
-
-    ax.set_xticks(np.arange(0, 24, 3))
-    ax.set_xticklabels([f"{h:02d}h" for h in range(0, 24, 3)])
-    ax.set_yticks(np.arange(12))
-    ax.set_yticklabels(month_names)
-
-    ax.view_init(elev=30, azim=-60)
-
-    cbar = fig.colorbar(surf, shrink=0.6, aspect=20, pad=0.1)
-    cbar.set_label('Standard Deviation (kWh/m²)', rotation=270, labelpad=20, fontsize=11)
-
-    plt.tight_layout()
-
-    pdf_3d = f"Wind_Standard_Deviation_3D_{lat_str}_{lon_str}.pdf"
-    path_3d = os.path.join(figures_pdf_folder, pdf_3d)
-    plt.savefig(path_3d, format='pdf', dpi=300, bbox_inches='tight')
-    plt.close()
-    print(f"File created {pdf_3d}")
-
-    # --- Plotly 3D  ---
-    figly = go.Figure(data=[go.Surface(
-        z=Z, x=np.arange(24), y=np.arange(12),
-        colorscale='Turbo',
-        colorbar=dict(title="Std Dev<br>(kWh/m²)", thickness=20),
-        contours_z=dict(show=True, usecolormap=True, project_z=True)
-    )])
-
-    figly.update_layout(
-        scene=dict(
-            xaxis_title="Hour of Day",
-            yaxis_title="Month",
-            zaxis_title="Std Dev (kWh/m²)",
-            xaxis=dict(tickvals=np.arange(0,24,3), ticktext=[f"{h:02d}h" for h in range(0,24,3)]),
-            yaxis=dict(tickvals=list(range(12)), ticktext=month_names),
-        ),
-        width=1200, height=800,
-        margin=dict(l=0, r=0, b=0, t=40)
-    )
-
-    html_3d = f"Wind_Standard_Deviation_3D_{lat_str}_{lon_str}.html"
-    path_html = os.path.join(figures_pdf_folder, html_3d)
-    figly.write_html(path_html, include_plotlyjs='cdn')
-    print(f"Interactive file created: {html_3d}")
+    with stage("table export"):
+        save_wind_tables(stats, tables_folder, lat_str, lon_str, formats, suffix)
+    figure_jobs = wind_figure_jobs(stats, stats['capacity_factor'], figures_pdf_folder, lat_str, lon_str, formats,
+                                   suffix)
+    if jobs is None:
+        render_jobs(figure_jobs)
+    else:
+        jobs.extend(figure_jobs)
 
     print(f"\nWIND ANALYSIS COMPLETED!")
-    print(f"All files saved in: {figures_pdf_folder}\n")
+    print(f"All files saved in: {output_dir}\n")
     print(f"{'='*70}\n")
+    return stats
 
 
 # Teste direto (apague a chave depois!)
 #if __name__ == "__main__":
     #API_KEY = ''
-    #run_wind_analysis(-3.73, -38.52, API_KEY)
\ No newline at end of file
+    #run_wind_analysis(-3.73, -38.52, API_KEY)
@@ -0,0 +1,155 @@
+# wind_grid.py
+# Gridded wind mode: month x hour mean, std, CV and energy density of the 100 m wind speed for every
+# ERA5 cell of the regional store. The store is opened lazily in dask chunks of one time chunk x the
+# whole region, the (month, hour) groupby reductions are computed together on --jobs threads, and
+# the capacity-factor raster is averaged onto the ERA5 cells by GDAL instead of sampled pixel by
+# pixel. The result is one NetCDF4 file chunked as all months and hours x a few cells, so a later
+# point query (wind_grid_tables) reads a single chunk.
+
+import os
+import numpy as np
+import pandas as pd
+
+from era5_download import NETCDF_LOCK
+from era5_store import CHUNK_TIME, CHUNK_SPACE, GRID_STEP, ensure_regional_store
+from common import MONTH_NAMES
+from wind_analysis import GEOTIFF_FILE, DEFAULT_CAPACITY_FACTOR, POWER_DENSITY
+from profiling import stage
+import parallel
+
+
+GRID_DIR = os.path.join("./output", "wind_grid")
+GRID_NAME = "wind_grid_statistics.nc"
+STATISTICS = ["mean", "std", "cv", "energy_density"]
+
+
+# =========================== STATISTICS ===========================
+def grid_statistics(ds, years=None):
+    # Lazy (month, hour, latitude, longitude) mean, std and count of the wind speed of a dask-backed
+    # dataset; (month, hour) cells without data are NaN (count 0). years: keep only these years
+    import xarray as xr
+
+    time_name = "valid_time" if "valid_time" in ds.coords else "time"
+    if years is not None:
+        ds = ds.sel({time_name: ds[time_name].dt.year.isin([int(y) for y in years])})
+    speed = np.sqrt(ds["u100"].astype(np.float64)**2 + ds["v100"].astype(np.float64)**2)
+    times = ds[time_name]
+    grouped = speed.assign_coords(cell=(times.dt.month - 1) * 24 + times.dt.hour).groupby("cell")
+
+    cells = np.arange(288)
+    stats = xr.Dataset({"mean": grouped.mean(), "std": grouped.std(ddof=1), "count": grouped.count()})
+    stats = stats.reindex(cell=cells, fill_value={"mean": np.nan, "std": np.nan, "count": 0})
+    stats = stats.assign_coords(month=("cell", cells // 24 + 1), hour=("cell", cells % 24))
+    return stats.set_index(cell=["month", "hour"]).unstack("cell").transpose("month", "hour", "latitude", "longitude")
+
+
+def capacity_factor_grid(lats, lons, geotiff_file=GEOTIFF_FILE):
+    # Mean of the capacity-factor pixels inside each ERA5 cell (GDAL average resampling onto the
+    # cell grid); cells without raster data fall back to 0.45, like read_capacity_factors
+    grid = np.full((lats.size, lons.size), np.nan, dtype=np.float32)
+    if os.path.exists(geotiff_file):
+        import rasterio
+        from rasterio.transform import from_origin
+        from rasterio.warp import Resampling, reproject
+
+        lat_step = abs(lats[1] - lats[0]) if lats.size > 1 else GRID_STEP
+        lon_step = abs(lons[1] - lons[0]) if lons.size > 1 else GRID_STEP
+        transform = from_origin(lons.min() - lon_step / 2, lats.max() + lat_step / 2, lon_step, lat_step)
+        try:
+            with stage("capacity factor", grid=True), rasterio.open(geotiff_file) as src:
+                reproject(rasterio.band(src, 1), grid, src_nodata=src.nodata, dst_transform=transform,
+                          dst_crs="EPSG:4326", dst_nodata=np.nan, resampling=Resampling.average)
+        except Exception as e:
+            print(f"Error reading GeoTIFF: {e}")
+            grid[:] = np.nan
+        if lats[0] < lats[-1]:
+            grid = grid[::-1]  # the reprojected grid is north-up; match a south-up dataset
+    return np.where(np.isnan(grid), np.float32(DEFAULT_CAPACITY_FACTOR), grid)
+
+
+def add_energy_density(stats, capacity_factor):
+    # CV and energy density per cell, as wind_statistics_from_accumulator does for one point
+    count = stats["count"]
+    global_mean = (stats["mean"].fillna(0) * count).sum(("month", "hour")) / count.sum(("month", "hour"))
+    stats["cv"] = (stats["std"] / stats["mean"] * 100).fillna(0)
+    stats["capacity_factor"] = (("latitude", "longitude"), capacity_factor)
+    stats["energy_density"] = stats["mean"] / global_mean * stats["capacity_factor"] * POWER_DENSITY
+    return stats
+
+
+# =========================== OUTPUT ===========================
+def write_grid(stats, path):
+    # float32, zlib-compressed, chunked (12 months, 24 hours, a few cells); written then renamed
+    ny, nx = stats.sizes["latitude"], stats.sizes["longitude"]
+    space = (min(CHUNK_SPACE, ny), min(CHUNK_SPACE, nx))
+    encoding = {name: dict(dtype="float32", zlib=True, complevel=4, shuffle=True, chunksizes=(12, 24) + space,
+                           _FillValue=np.float32(np.nan)) for name in STATISTICS}
+    encoding["count"] = dict(dtype="int32", zlib=True, chunksizes=(12, 24) + space)
+    encoding["capacity_factor"] = dict(dtype="float32", chunksizes=space)
+    stats["mean"].attrs.update(units="m/s", long_name="Mean 100 m wind speed")
+    stats["std"].attrs.update(units="m/s", long_name="Standard deviation of the 100 m wind speed")
+    stats["cv"].attrs.update(units="%", long_name="Coefficient of variation of the 100 m wind speed")
+    stats["energy_density"].attrs.update(units="kWh/m2", long_name="Mean hourly wind energy density")
+    stats["capacity_factor"].attrs.update(long_name="Capacity factor averaged over the ERA5 cell")
+
+    tmp = path + ".tmp"
+    with NETCDF_LOCK:
+        stats.to_netcdf(tmp, format="NETCDF4", encoding=encoding)
+    os.replace(tmp, path)
+    return path
+
+
+def wind_grid_tables(path, lat, lon):
+    # Tables of the nearest cell of a written grid, the same dict as get_wind_tables; reads one chunk
+    import xarray as xr
+
+    with NETCDF_LOCK, xr.open_dataset(path) as ds:
+        cell = ds.sel(latitude=lat, longitude=lon, method="nearest").load()
+    tables = {}
+    for key in STATISTICS:
+        table = pd.DataFrame(cell[key].values, index=MONTH_NAMES, columns=range(24))
+        table.columns.name = "Hour"
+        tables[key] = table
+    tables["capacity_factor"] = float(cell["capacity_factor"])
+    return tables
+
+
+# =========================== GRID MODE ===========================
+def run_wind_grid(API_KEY="", store=None, output_dir=GRID_DIR, years=None, workers=None,
+                  geotiff_file=GEOTIFF_FILE):
+    # store: regional wind store path (default: downloaded/built with ensure_regional_store).
+    # workers: dask threads for the groupby (default: --jobs)
+    import xarray as xr
+
+    store = ensure_regional_store("wind", API_KEY) if store is None else store
+    if store is None:
+        print("No regional wind files found. Skipping.")
+        return None
+    workers = workers or parallel.JOBS
+
+    with NETCDF_LOCK, stage("dataset open", file=os.path.basename(store)):
+        ds = xr.open_dataset(store, chunks={"valid_time": CHUNK_TIME, "latitude": -1, "longitude": -1})
+    try:
+        print(f"\n{'='*70}")
+        period = f"years {years[0]}–{years[-1]}" if years else f"{ds.sizes['valid_time']} hours"
+        print(f"WIND GRID → {ds.sizes['latitude']} x {ds.sizes['longitude']} ERA5 cells, {period}, {workers} worker(s)")
+        print(f"{'='*70}")
+        with stage("aggregation", grid=True, workers=workers):
+            stats = grid_statistics(ds, years).compute(scheduler="threads", num_workers=workers)
+    finally:
+        with NETCDF_LOCK:
+            ds.close()
+
+    stats = add_energy_density(stats, capacity_factor_grid(stats["latitude"].values, stats["longitude"].values,
+                                                           geotiff_file))
+    os.makedirs(output_dir, exist_ok=True)
+    name = GRID_NAME if not years else GRID_NAME.replace(".nc", f"_{years[0]}_{years[-1]}.nc")
+    with stage("table export"):
+        path = write_grid(stats, os.path.join(output_dir, name))
+    print(f"Saved: {path}")
+    print(f"\nWIND GRID COMPLETED!\nAll files in: {output_dir}\n")
+    return path
+
+
+if __name__ == "__main__":
+    run_wind_grid()